@@ -0,0 +1,88 @@
+"""
+JWT authentication without a user query per request.
+
+UserRefreshToken adds the user's role and a token version to the claims.
+The version is derived from the password hash, so changing the password
+retires every token issued before. CachedJWTAuthentication keeps each
+user's role, active flag and current token version in the cache for
+USER_STATE_TIMEOUT seconds (saves and deletes of the user drop the entry,
+see accounts.signals) and returns a User with only id, role and is_active
+loaded. Reading any other field loads the rest of the row in one query, so
+only views that need profile fields pay for it.
+"""
+from django.core.cache import cache
+from django.db.models import DEFERRED
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
+
+TOKEN_VERSION_CLAIM = 'ver'
+USER_STATE_TIMEOUT = 60
+
+
+def token_version(password):
+    """Version of the tokens of a user with the ``password`` hash."""
+    return salted_hmac('accounts.authentication.token_version', password).hexdigest()[:16]
+
+
+def user_state_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def forget_user_state(user_id):
+    cache.delete(user_state_key(user_id))
+
+
+def get_user_state(user_id):
+    """``(role, is_active, token version)`` of a user, or None if there is no such user."""
+    key = user_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = User.objects.filter(pk=user_id).values_list('role', 'is_active', 'password').first()
+        if row is None:
+            return None
+        role, is_active, password = row
+        state = (role, is_active, token_version(password))
+        cache.set(key, state, USER_STATE_TIMEOUT)
+    return state
+
+
+class UserRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        token[TOKEN_VERSION_CLAIM] = token_version(user.password)
+        return token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            # The claim is a string, and users compare equal by pk
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        state = get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        role, is_active, version = state
+        if not is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        # Tokens issued before versions were added carry no claim and stay valid until they expire
+        if validated_token.get(TOKEN_VERSION_CLAIM, version) != version:
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+
+        loaded = {'id': user_id, 'role': role, 'is_active': is_active}
+        fields = User._meta.concrete_fields
+        user = User.from_db(
+            None, [field.attname for field in fields], [loaded.get(field.attname, DEFERRED) for field in fields]
+        )
+        user._load_rest_on_access = True
+        return user
@@ -0,0 +1,149 @@
+"""
+Password hashing off the request threads.
+
+PBKDF2 is slow on purpose, so a burst of sign-ins used to occupy every
+worker thread with hashing and starve all other requests. Hashes and checks
+now run in a process-wide pool of PASSWORD_HASHING_WORKERS threads (hashlib
+releases the GIL, so other requests keep being served meanwhile). Up to
+PASSWORD_HASHING_QUEUE more jobs wait for a worker. A job that finds the
+queue full for PASSWORD_HASHING_TIMEOUT seconds raises HashingBusy, which
+the sign-in views answer with 503, so clients retry instead of piling up.
+With no workers configured hashing runs on the calling thread.
+
+User.set_password() and User.check_password() go through the pool, which
+covers authenticate(), registration and password changes. check_password()
+still upgrades hashes made with outdated hasher settings. The API login and
+token views are synchronous (DRF has no async views), so there the pool
+bounds how many hashes run at once but each request thread still waits for
+its own. The sign-in and registration pages are async views that await
+the pool through aauthenticate(), User.acheck_password() and
+UserManager.acreate_user(), so under ASGI no thread is held while a hash
+waits or runs. Pool activity is reported by healthcare_backend.metrics.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+from healthcare_backend.metrics import add_process_metric
+
+
+class HashingBusy(Exception):
+    """The pool's queue stayed full for PASSWORD_HASHING_TIMEOUT seconds."""
+
+    def __init__(self, message='Too many sign-ins at once, please try again in a moment.'):
+        super().__init__(message)
+
+
+class HashingPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.slots = None
+        self.size = None
+
+    def get_limits(self):
+        return (
+            getattr(settings, 'PASSWORD_HASHING_WORKERS', 4),
+            getattr(settings, 'PASSWORD_HASHING_QUEUE', 64),
+            getattr(settings, 'PASSWORD_HASHING_TIMEOUT', 5),
+        )
+
+    def submit(self, func, args, timeout):
+        """Queue ``func(*args)``, waiting at most ``timeout`` seconds for a free slot."""
+        workers, queue, _ = self.get_limits()
+        with self.lock:
+            if self.executor is None or self.size != (workers, queue):
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+                self.slots = threading.BoundedSemaphore(workers + queue)
+                self.size = (workers, queue)
+            executor, slots = self.executor, self.slots
+
+        if not slots.acquire(timeout=timeout):
+            add_process_metric('password_hash_rejected')
+            raise HashingBusy()
+        queued = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                slots.release()
+                add_process_metric('password_hashes')
+                add_process_metric('password_hash_wait', started - queued)
+                add_process_metric('password_hash_time', time.perf_counter() - started)
+
+        return executor.submit(job)
+
+    def run(self, func, *args):
+        workers, _, timeout = self.get_limits()
+        if not workers:
+            return func(*args)
+        return self.submit(func, args, timeout).result()
+
+    async def arun(self, func, *args):
+        """Awaitable run(): the event loop stays free while the job waits and runs."""
+        workers, _, timeout = self.get_limits()
+        if not workers:
+            return await sync_to_async(func, thread_sensitive=False)(*args)
+        # Waiting for a free slot blocks, so it happens off the event loop too
+        future = await sync_to_async(self.submit, thread_sensitive=False)(func, args, timeout)
+        return await asyncio.wrap_future(future)
+
+
+pool = HashingPool()
+
+
+def hash_password(raw_password):
+    return pool.run(make_password, raw_password)
+
+
+async def ahash_password(raw_password):
+    return await pool.arun(make_password, raw_password)
+
+
+def verify_password(raw_password, encoded, setter=None):
+    """
+    Django's check_password() in the pool. ``setter(raw_password)``, which
+    stores an upgraded hash, runs on the calling thread.
+    """
+    outdated = []
+    is_correct = pool.run(check_password, raw_password, encoded, outdated.append)
+    if outdated and setter is not None:
+        setter(raw_password)
+    return is_correct
+
+
+async def averify_password(raw_password, encoded, setter=None):
+    """verify_password() for async views; ``setter`` is awaited."""
+    outdated = []
+    is_correct = await pool.arun(check_password, raw_password, encoded, outdated.append)
+    if outdated and setter is not None:
+        await setter(raw_password)
+    return is_correct
+
+
+async def aauthenticate(email, password):
+    """
+    The active user with ``email`` and ``password``, or None. Mirrors
+    ModelBackend.authenticate() for async views, hashing in the pool.
+    """
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    user = await User._default_manager.filter(**{User.USERNAME_FIELD: email}).afirst()
+    if user is None:
+        # Hash anyway, so unknown emails take as long as wrong passwords
+        await ahash_password(password)
+        return None
+    if await user.acheck_password(password) and user.is_active:
+        user.backend = 'django.contrib.auth.backends.ModelBackend'
+        return user
+    return None
@@ -0,0 +1,43 @@
+"""
+Profile ids of the requesting user.
+
+Appointments and reviews point at Patient and Doctor rows, not users, so
+ownership checks need the user's profile id. get_identity() resolves it
+once per request, with one query and only for the profile matching the
+user's role. Permission classes and views then compare foreign-key ids
+(``obj.patient_id == identity.patient_id``) instead of loading the
+profile and user rows of every object they check.
+"""
+from django.utils.functional import cached_property
+
+
+class Identity:
+    def __init__(self, user):
+        self.user = user
+
+    def profile_id(self, role, model):
+        if not self.user.is_authenticated or self.user.role != role:
+            return None
+        return model.objects.filter(user_id=self.user.pk).values_list('id', flat=True).first()
+
+    @cached_property
+    def patient_id(self):
+        """Id of the user's Patient profile, or None."""
+        from patients.models import Patient
+        return self.profile_id('patient', Patient)
+
+    @cached_property
+    def doctor_id(self):
+        """Id of the user's Doctor profile, or None."""
+        from doctors.models import Doctor
+        return self.profile_id('doctor', Doctor)
+
+
+def get_identity(request):
+    """The Identity of ``request.user``, shared by everything handling the request."""
+    # DRF's Request wraps the HttpRequest, and both see the same user
+    request = getattr(request, '_request', request)
+    identity = getattr(request, '_identity', None)
+    if identity is None or identity.user is not request.user:
+        identity = request._identity = Identity(request.user)
+    return identity
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment
+from django.utils import timezone
+
+from accounts.models import User
+from frontend.management.commands.seed_benchmark import BENCHMARK_DOMAIN
+from frontend.management.commands.run_benchmark import percentile
+from healthcare_backend import metrics
+
+LOGIN_PASSWORD = 'login-benchmark-password'
+
+
+class Command(BaseCommand):
+    help = ('Log in from many threads at once and report logins/sec, login latency and the '
+            'latency of a cheap page requested during the storm, for each hashing pool size. '
+            'Run with DJANGO_SETTINGS_MODULE=healthcare_backend.settings_benchmark')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--accounts', type=int, default=20)
+        parser.add_argument('--logins', type=int, default=100, help='Logins per run')
+        parser.add_argument('--concurrency', type=int, default=16, help='Threads logging in at once')
+        parser.add_argument('--workers', type=int, nargs='+',
+                            default=[0, settings.PASSWORD_HASHING_WORKERS],
+                            help='PASSWORD_HASHING_WORKERS of each run; 0 hashes on the request thread')
+        parser.add_argument('--probe-url', default='/', help='Page requested during the storm')
+        parser.add_argument('--output', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('login_benchmark creates accounts; use healthcare_backend.settings_benchmark')
+
+        # Test environment: allows the test client on any host
+        setup_test_environment()
+        emails = self.get_accounts(options['accounts'])
+        results = {
+            'generated_at': timezone.now().isoformat(),
+            'logins': options['logins'],
+            'concurrency': options['concurrency'],
+            'runs': [],
+        }
+        for workers in options['workers']:
+            with override_settings(PASSWORD_HASHING_WORKERS=workers):
+                run = self.run(emails, options)
+            results['runs'].append(run)
+            self.stdout.write(
+                f"workers={workers}: {run['logins_per_second']:.1f} logins/s, "
+                f"login p50 {run['login_p50_ms']:.0f} ms, p95 {run['login_p95_ms']:.0f} ms, "
+                f"{run['busy']} answered 503; {options['probe_url']} during the storm "
+                f"p50 {run['probe_p50_ms']:.1f} ms, p95 {run['probe_p95_ms']:.1f} ms"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def get_accounts(self, count):
+        emails = [f'login-{i}@{BENCHMARK_DOMAIN}' for i in range(count)]
+        existing = set(User.objects.filter(email__in=emails).values_list('email', flat=True))
+        for email in emails:
+            if email not in existing:
+                User.objects.create_user(email=email, password=LOGIN_PASSWORD,
+                                         first_name='Login', last_name='Benchmark', role='patient')
+        return emails
+
+    def run(self, emails, options):
+        before = dict(metrics._process_totals)
+        local = threading.local()
+        done = threading.Event()
+        probes = []
+
+        def log_in(i):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            start = time.perf_counter()
+            response = local.client.post('/api/accounts/login/', {
+                'email': emails[i % len(emails)], 'password': LOGIN_PASSWORD,
+            }, content_type='application/json')
+            connections.close_all()
+            return response.status_code, time.perf_counter() - start
+
+        def probe():
+            client = Client()
+            while not done.is_set():
+                start = time.perf_counter()
+                client.get(options['probe_url'])
+                probes.append(time.perf_counter() - start)
+                time.sleep(0.01)
+            connections.close_all()
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            outcomes = list(executor.map(log_in, range(options['logins'])))
+        elapsed = time.perf_counter() - start
+        done.set()
+        prober.join()
+
+        failed = [code for code, _ in outcomes if code not in (200, 503)]
+        if failed:
+            raise CommandError(f'{len(failed)} logins failed, e.g. with status {failed[0]}')
+        latencies = [seconds for code, seconds in outcomes if code == 200]
+        after = dict(metrics._process_totals)
+        hashes = after['password_hashes'] - before['password_hashes']
+        return {
+            'workers': settings.PASSWORD_HASHING_WORKERS,
+            'seconds': round(elapsed, 3),
+            'logins_per_second': len(latencies) / elapsed,
+            'busy': len(outcomes) - len(latencies),
+            'login_p50_ms': percentile(latencies, 0.5) * 1000 if latencies else 0,
+            'login_p95_ms': percentile(latencies, 0.95) * 1000 if latencies else 0,
+            'probe_requests': len(probes),
+            'probe_p50_ms': percentile(probes, 0.5) * 1000 if probes else 0,
+            'probe_p95_ms': percentile(probes, 0.95) * 1000 if probes else 0,
+            'pool_hashes': hashes,
+            'pool_wait_ms_avg': (after['password_hash_wait'] - before['password_hash_wait']) / hashes * 1000
+            if hashes else 0,
+        }
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from accounts.models import User
+from accounts.tasks import render_profile_picture_variants
+from chat.models import Message
+from chat.tasks import render_attachment_variants
+from healthcare_backend.images import needs_variants
+
+
+class Command(BaseCommand):
+    help = 'Queue resized variants of profile pictures and chat attachments uploaded before they existed'
+
+    def handle(self, *args, **options):
+        users = 0
+        for user in User.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True).only(
+            'profile_picture', 'profile_picture_variants'
+        ).iterator():
+            if needs_variants(user.profile_picture, user.profile_picture_variants):
+                render_profile_picture_variants.delay(user.pk)
+                users += 1
+
+        messages = 0
+        attached = Message.objects.filter(
+            ~Q(image_attachment='') & Q(image_attachment__isnull=False)
+            | ~Q(file_attachment='') & Q(file_attachment__isnull=False)
+        ).only('image_attachment', 'image_attachment_variants', 'file_attachment', 'file_attachment_variants')
+        for message in attached.iterator():
+            if (needs_variants(message.image_attachment, message.image_attachment_variants)
+                    or needs_variants(message.file_attachment, message.file_attachment_variants)):
+                render_attachment_variants.delay(message.pk)
+                messages += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Queued image variants for {users} profile pictures and {messages} chat messages'
+        ))
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from .hashing import ahash_password, averify_password, hash_password, verify_password
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
@@ -11,6 +12,17 @@ class UserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+    async def acreate_user(self, email, password=None, **extra_fields):
+        """create_user() for async views, hashing in the pool of accounts.hashing."""
+        if not email:
+            raise ValueError('The Email field must be set')
+        email = self.normalize_email(email)
+        user = self.model(email=email, **extra_fields)
+        user.password = await ahash_password(password)
+        user._password = password
+        await user.asave(using=self._db)
+        return user
+
     def create_superuser(self, email, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', True)
         extra_fields.setdefault('is_superuser', True)
@@ -39,6 +51,8 @@ class User(AbstractUser):
     date_of_birth = models.DateField(null=True, blank=True)
     address = models.TextField(blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', null=True, blank=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False,
+                                                help_text="Resized copies of the profile picture, see healthcare_backend.images")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -54,3 +68,30 @@ class User(AbstractUser):
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
+
+    # Passwords are hashed and checked in the pool of accounts.hashing
+    def set_password(self, raw_password):
+        self.password = hash_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        def setter(raw_password):
+            self.set_password(raw_password)
+            # An upgraded hash is not a password change
+            self._password = None
+            self.save(update_fields=['password'])
+        return verify_password(raw_password, self.password, setter)
+
+    async def acheck_password(self, raw_password):
+        async def setter(raw_password):
+            self.password = await ahash_password(raw_password)
+            await self.asave(update_fields=['password'])
+        return await averify_password(raw_password, self.password, setter)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        # Users built from token claims (accounts.authentication) load all
+        # deferred fields on the first access to one of them
+        if fields is not None and getattr(self, '_load_rest_on_access', False):
+            self._load_rest_on_access = False
+            fields = self.get_deferred_fields() | set(fields)
+        super().refresh_from_db(using, fields, **kwargs)
@@ -1,4 +1,6 @@
 from rest_framework import permissions
+from .identity import get_identity
+from .models import User
 
 class IsAdminUser(permissions.BasePermission):
     """
@@ -21,8 +23,8 @@ class IsAdminOrOwner(permissions.BasePermission):
             return True
         
         # Object owner can access their own object
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
+        if hasattr(obj, 'user_id'):
+            return obj.user_id == request.user.pk
         
         # For User objects, check if it's the same user
         if obj == request.user:
@@ -76,8 +78,8 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
 
         # Write permissions are only allowed to the owner of the object.
-        if hasattr(obj, 'user'):
-            return obj.user == request.user
+        if hasattr(obj, 'user_id'):
+            return obj.user_id == request.user.pk
         return obj == request.user
 
 
@@ -85,12 +87,19 @@ class IsAppointmentParticipant(permissions.BasePermission):
     """
     Permission to only allow appointment participants (patient, doctor) or admin to access.
     """
+    def has_permission(self, request, view):
+        return request.user and request.user.is_authenticated
+    
     def has_object_permission(self, request, view, obj):
         if request.user.role == 'admin':
             return True
         
-        if hasattr(obj, 'patient') and hasattr(obj, 'doctor'):
-            return (obj.patient.user == request.user or 
-                   obj.doctor.user == request.user)
+        if hasattr(obj, 'patient_id') and hasattr(obj, 'doctor_id'):
+            # Chat rooms point at the participants' users, appointments at their profiles
+            if obj._meta.get_field('patient').related_model is User:
+                return request.user.pk in (obj.patient_id, obj.doctor_id)
+            identity = get_identity(request)
+            return ((identity.patient_id is not None and obj.patient_id == identity.patient_id) or
+                    (identity.doctor_id is not None and obj.doctor_id == identity.doctor_id))
         
         return False
\ No newline at end of file
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
+from healthcare_backend.images import ImageVariantsField
 from .models import User
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -49,11 +50,12 @@ class UserLoginSerializer(serializers.Serializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     full_name = serializers.ReadOnlyField()
+    profile_picture_variants = ImageVariantsField(source='profile_picture', variants_field='profile_picture_variants')
     
     class Meta:
         model = User
         fields = ('id', 'email', 'first_name', 'last_name', 'full_name', 'phone_number',
-                 'date_of_birth', 'address', 'role', 'profile_picture', 'is_active',
+                 'date_of_birth', 'address', 'role', 'profile_picture', 'profile_picture_variants', 'is_active',
                  'date_joined', 'created_at', 'updated_at')
         read_only_fields = ('id', 'email', 'role', 'date_joined', 'created_at', 'updated_at')
 
@@ -0,0 +1,27 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from healthcare_backend.images import needs_variants
+from .authentication import forget_user_state
+from .models import User
+from .tasks import render_profile_picture_variants
+
+
+@receiver(post_save, sender=User)
+def queue_profile_picture_variants(sender, instance, update_fields=None, **kwargs):
+    """Render resized copies of a new or changed profile picture after commit."""
+    # Also skips users built from token claims, whose deferred picture would load the whole row
+    if update_fields is not None and 'profile_picture' not in update_fields:
+        return
+    if needs_variants(instance.profile_picture, instance.profile_picture_variants):
+        transaction.on_commit(lambda: render_profile_picture_variants.delay(instance.pk))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_auth_state(sender, instance, update_fields=None, **kwargs):
+    """Apply password, role and deactivation changes to the next API request."""
+    # Logins only touch last_login, which API authentication does not use
+    if update_fields != frozenset({'last_login'}):
+        user_id = instance.pk
+        transaction.on_commit(lambda: forget_user_state(user_id))
@@ -0,0 +1,17 @@
+from celery import shared_task
+
+from healthcare_backend.images import refresh_variants
+from .models import User
+
+# Square avatars: small for lists and chat, card for the doctor directory
+PROFILE_PICTURE_SIZES = {
+    'thumb': (96, 96, True),
+    'card': (320, 320, True),
+}
+
+
+@shared_task
+def render_profile_picture_variants(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        refresh_variants(user, 'profile_picture', 'profile_picture_variants', PROFILE_PICTURE_SIZES)
@@ -0,0 +1,323 @@
+"""
+Token authentication, password hashing, profile picture variants, and
+identities and permissions by role.
+"""
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from appointments.models import Appointment
+from chat.models import ChatRoom
+from doctors.models import Doctor
+from patients.models import Patient
+from .authentication import TOKEN_VERSION_CLAIM, CachedJWTAuthentication, UserRefreshToken
+from .hashing import HashingBusy, pool
+from .identity import get_identity
+from .models import User
+from .permissions import (
+    IsAdminOrOwner, IsAdminUser, IsAppointmentParticipant, IsDoctor, IsDoctorOrAdmin, IsPatient, IsPatientOrAdmin,
+)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe',
+            role='patient', phone_number='555-0100', address='1 Main St'
+        )
+
+    def get_profile(self, token):
+        return self.client.get('/api/accounts/profile/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def save_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+    def test_valid_token_is_accepted(self):
+        response = self.get_profile(UserRefreshToken.for_user(self.user).access_token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['email'], 'patient@example.com')
+
+    def test_inactive_user_is_rejected(self):
+        token = UserRefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get_profile(token).status_code, 200)
+        self.user.is_active = False
+        self.save_user()
+        self.assertEqual(self.get_profile(token).status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        token = UserRefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get_profile(token).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.get_profile(token).status_code, 401)
+
+    def test_tokens_issued_before_a_password_change_are_rejected(self):
+        old_token = UserRefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get_profile(old_token).status_code, 200)
+        self.user.set_password('new password')
+        self.save_user()
+        self.assertEqual(self.get_profile(old_token).status_code, 401)
+        self.assertEqual(self.get_profile(UserRefreshToken.for_user(self.user).access_token).status_code, 200)
+
+    def test_legacy_token_without_version_is_accepted(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.assertNotIn(TOKEN_VERSION_CLAIM, token)
+        self.assertEqual(self.get_profile(token).status_code, 200)
+
+    def test_reading_a_deferred_field_loads_the_rest_of_the_row_in_one_query(self):
+        auth = CachedJWTAuthentication()
+        validated_token = auth.get_validated_token(str(UserRefreshToken.for_user(self.user).access_token))
+        auth.get_user(validated_token)
+
+        with self.assertNumQueries(0):
+            user = auth.get_user(validated_token)
+            self.assertEqual((user.pk, user.role, user.is_active), (self.user.pk, 'patient', True))
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'patient@example.com')
+            self.assertEqual(user.phone_number, '555-0100')
+            self.assertEqual(user.password, self.user.password)
+            self.assertEqual(user.address, '1 Main St')
+
+    def test_refresh_from_db_passes_on_other_arguments(self):
+        with mock.patch('django.db.models.Model.refresh_from_db') as refresh_from_db:
+            self.user.refresh_from_db(fields=['email'], from_queryset=User.objects.all())
+        refresh_from_db.assert_called_once_with(None, ['email'], from_queryset=mock.ANY)
+
+    def test_profile_update_keeps_every_column(self):
+        before = User.objects.values().get(pk=self.user.pk)
+        response = self.client.patch(
+            '/api/accounts/profile/', {'first_name': 'Patricia'}, content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {UserRefreshToken.for_user(self.user).access_token}'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        after = User.objects.values().get(pk=self.user.pk)
+        self.assertEqual(after.pop('first_name'), 'Patricia')
+        self.assertGreaterEqual(after.pop('updated_at'), before.pop('updated_at'))
+        before.pop('first_name')
+        self.assertEqual(after, before)
+
+    def test_saving_a_token_user_does_not_load_the_profile_picture(self):
+        auth = CachedJWTAuthentication()
+        validated_token = auth.get_validated_token(str(UserRefreshToken.for_user(self.user).access_token))
+        user = auth.get_user(validated_token)
+
+        with mock.patch('accounts.signals.render_profile_picture_variants.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+                user.last_login = timezone.now()
+                user.save(update_fields=['last_login'])
+        delay.assert_not_called()
+
+
+class ProfilePictureVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user(email='patient@example.com', password='password')
+
+    @mock.patch('accounts.signals.render_profile_picture_variants.delay')
+    def test_a_new_picture_queues_its_variants_after_commit(self, delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile_picture.save('me.png', ContentFile(b'picture'))
+        delay.assert_called_once_with(self.user.pk)
+
+    @mock.patch('accounts.signals.render_profile_picture_variants.delay')
+    def test_saves_that_leave_the_picture_alone_queue_nothing(self, delay):
+        self.user.profile_picture_variants = {'source': ''}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile_picture.save('me.png', ContentFile(b'picture'), save=False)
+            self.user.save(update_fields=['first_name'])
+        delay.assert_not_called()
+
+
+class HashingBusyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+
+    def test_sign_in_endpoints_answer_503_when_the_pool_is_full(self):
+        with mock.patch.object(pool, 'submit', side_effect=HashingBusy()):
+            for url in ('/api/accounts/login/', '/api/accounts/token/'):
+                response = self.client.post(url, {'email': 'patient@example.com', 'password': 'password'},
+                                            content_type='application/json')
+                self.assertEqual(response.status_code, 503, url)
+                self.assertEqual(response['Retry-After'], '1')
+                self.assertIn('error', response.json())
+
+    def test_login_page_answers_503_when_the_pool_is_full(self):
+        with mock.patch.object(pool, 'submit', side_effect=HashingBusy()):
+            response = self.client.post('/login/', {'email': 'patient@example.com', 'password': 'password'})
+        self.assertEqual(response.status_code, 503)
+
+
+class HashingPoolTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+
+    def test_sign_in_checks_passwords_in_the_pool(self):
+        for url, data in (('/login/', {'email': 'patient@example.com', 'password': 'password'}),
+                          ('/api/accounts/login/', {'email': 'patient@example.com', 'password': 'password'})):
+            with mock.patch.object(pool, 'submit', wraps=pool.submit) as submit:
+                response = self.client.post(url, data)
+            self.assertIn(response.status_code, (200, 302), url)
+            self.assertEqual(submit.call_count, 1, url)
+        self.client.logout()
+        self.assertEqual(self.client.post('/login/', {'email': 'patient@example.com', 'password': 'wrong'}).status_code, 200)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_registration_hashes_in_the_pool(self):
+        with mock.patch.object(pool, 'submit', wraps=pool.submit) as submit:
+            response = self.client.post('/register/', {
+                'email': 'new@example.com', 'password': 'secret-password', 'confirm_password': 'secret-password',
+                'first_name': 'New', 'last_name': 'Patient', 'role': 'patient',
+            })
+        self.assertRedirects(response, '/login/', fetch_redirect_response=False)
+        self.assertEqual(submit.call_count, 1)
+        self.assertTrue(User.objects.get(email='new@example.com').check_password('secret-password'))
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.PBKDF2PasswordHasher',
+                                         'django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_outdated_hashes_are_upgraded_on_sign_in(self):
+        for url in ('/login/', '/api/accounts/login/'):
+            User.objects.filter(pk=self.user.pk).update(password=make_password('password', hasher='md5'))
+            with mock.patch.object(pool, 'submit', wraps=pool.submit) as submit:
+                response = self.client.post(url, {'email': 'patient@example.com', 'password': 'password'})
+            self.assertIn(response.status_code, (200, 302), url)
+            # The check and the new hash both ran in the pool
+            self.assertEqual(submit.call_count, 2, url)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'), url)
+            self.assertTrue(self.user.check_password('password'))
+
+
+class RoleTestMixin:
+    @classmethod
+    def setUpTestData(cls):
+        def create_user(email, role):
+            return User.objects.create_user(email=email, password='password', role=role)
+
+        cls.patient = Patient.objects.create(user=create_user('patient@example.com', 'patient'))
+        cls.other_patient = Patient.objects.create(user=create_user('other.patient@example.com', 'patient'))
+        cls.doctor = Doctor.objects.create(user=create_user('doctor@example.com', 'doctor'), specialization='cardiology')
+        cls.other_doctor = Doctor.objects.create(
+            user=create_user('other.doctor@example.com', 'doctor'), specialization='neurology'
+        )
+        cls.admin = create_user('admin@example.com', 'admin')
+        cls.appointment = Appointment.objects.create(
+            patient=cls.patient, doctor=cls.doctor, reason_for_visit='Checkup', status='accepted',
+            appointment_date=timezone.now() + timedelta(days=1)
+        )
+        cls.chat_room = ChatRoom.objects.get(appointment=cls.appointment)
+
+    def request_as(self, user):
+        request = Request(RequestFactory().get('/'))
+        request.user = user
+        return request
+
+
+class IdentityTests(RoleTestMixin, TestCase):
+    def test_patients_resolve_their_patient_profile_once(self):
+        request = self.request_as(self.patient.user)
+        with self.assertNumQueries(1):
+            for _ in range(2):
+                identity = get_identity(request)
+                self.assertEqual((identity.patient_id, identity.doctor_id), (self.patient.id, None))
+
+    def test_doctors_resolve_their_doctor_profile_once(self):
+        request = self.request_as(self.doctor.user)
+        with self.assertNumQueries(1):
+            for _ in range(2):
+                identity = get_identity(request)
+                self.assertEqual((identity.patient_id, identity.doctor_id), (None, self.doctor.id))
+
+    def test_admins_and_anonymous_users_have_no_profile(self):
+        for user in (self.admin, AnonymousUser()):
+            identity = get_identity(self.request_as(user))
+            with self.assertNumQueries(0):
+                self.assertEqual((identity.patient_id, identity.doctor_id), (None, None))
+
+    def test_shared_by_the_request_and_its_django_request_until_the_user_changes(self):
+        request = self.request_as(self.patient.user)
+        identity = get_identity(request)
+        self.assertIs(get_identity(request._request), identity)
+        request.user = self.doctor.user
+        self.assertEqual(get_identity(request).doctor_id, self.doctor.id)
+
+
+class PermissionTests(RoleTestMixin, TestCase):
+    def assertAllowed(self, permission, allowed):
+        users = {
+            'patient': self.patient.user, 'doctor': self.doctor.user,
+            'admin': self.admin, 'anonymous': AnonymousUser(),
+        }
+        for role, user in users.items():
+            with self.subTest(permission=permission.__name__, role=role):
+                self.assertEqual(bool(permission().has_permission(self.request_as(user), None)), role in allowed)
+
+    def test_role_permissions(self):
+        self.assertAllowed(IsPatient, {'patient'})
+        self.assertAllowed(IsDoctor, {'doctor'})
+        self.assertAllowed(IsAdminUser, {'admin'})
+        self.assertAllowed(IsPatientOrAdmin, {'patient', 'admin'})
+        self.assertAllowed(IsDoctorOrAdmin, {'doctor', 'admin'})
+
+    def test_appointment_participants(self):
+        permission = IsAppointmentParticipant()
+        for user, allowed in (
+            (self.patient.user, True), (self.doctor.user, True), (self.admin, True),
+            (self.other_patient.user, False), (self.other_doctor.user, False),
+        ):
+            for obj in (self.appointment, self.chat_room):
+                with self.subTest(user=user.email, obj=type(obj).__name__):
+                    self.assertIs(permission.has_object_permission(self.request_as(user), None, obj), allowed)
+
+    def test_appointment_checks_compare_ids_without_loading_the_participants(self):
+        appointment = Appointment.objects.get(pk=self.appointment.pk)
+        request = self.request_as(self.doctor.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(IsAppointmentParticipant().has_object_permission(request, None, appointment))
+            self.assertTrue(IsAppointmentParticipant().has_object_permission(request, None, appointment))
+
+    def test_admins_and_owners(self):
+        permission = IsAdminOrOwner()
+        for user, allowed in (
+            (self.patient.user, True), (self.admin, True), (self.other_patient.user, False), (self.doctor.user, False),
+        ):
+            with self.subTest(user=user.email):
+                request = self.request_as(user)
+                self.assertIs(permission.has_object_permission(request, None, self.patient), allowed)
+                self.assertIs(permission.has_object_permission(request, None, self.patient.user), allowed)
+
+    def test_appointment_detail_by_role(self):
+        url = reverse('appointment-detail', kwargs={'pk': self.appointment.pk})
+        for user, status_code, queries in (
+            (self.patient.user, 200, 2), (self.doctor.user, 200, 2), (self.admin, 200, 1),
+            (self.other_patient.user, 403, 2), (self.other_doctor.user, 403, 2),
+        ):
+            with self.subTest(user=user.email):
+                client = APIClient()
+                client.force_authenticate(user)
+                with self.assertNumQueries(queries):
+                    self.assertEqual(client.get(url).status_code, status_code)
+        self.assertEqual(APIClient().get(url).status_code, 401)
@@ -3,20 +3,33 @@ from rest_framework import generics, status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import authenticate
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
+from .authentication import UserRefreshToken
+from .hashing import HashingBusy
 from .models import User
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer,
     UserListSerializer, PasswordChangeSerializer, RegisterSerializer
 )
 from .permissions import IsAdminOrOwner, IsAdminUser
+from healthcare_backend.stats import get_stats, wants_fresh_stats
 
-class UserRegistrationView(generics.CreateAPIView):
+
+class HashingBusyMixin:
+    """Answer 503 when the password hashing pool is full, so clients retry later."""
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, HashingBusy):
+            return Response({'error': str(exc)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': '1'})
+        return super().handle_exception(exc)
+
+
+class UserRegistrationView(HashingBusyMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserRegistrationSerializer
     permission_classes = [permissions.AllowAny]
@@ -26,7 +39,7 @@ class UserRegistrationView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
         
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         
         return Response({
             'user': UserProfileSerializer(user).data,
@@ -36,7 +49,7 @@ class UserRegistrationView(generics.CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
-class UserLoginView(APIView):
+class UserLoginView(HashingBusyMixin, APIView):
     permission_classes = [permissions.AllowAny]
     
     def post(self, request):
@@ -44,7 +57,7 @@ class UserLoginView(APIView):
         serializer.is_valid(raise_exception=True)
         
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         
         return Response({
             'user': UserProfileSerializer(user).data,
@@ -79,7 +92,7 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAdminOrOwner]
 
 
-class PasswordChangeView(APIView):
+class PasswordChangeView(HashingBusyMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
@@ -90,35 +103,31 @@ class PasswordChangeView(APIView):
         user.set_password(serializer.validated_data['new_password'])
         user.save()
         
-        return Response({'message': 'Password changed successfully'})
+        # Tokens issued before the change are no longer accepted
+        refresh = UserRefreshToken.for_user(user)
+        
+        return Response({
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+            'message': 'Password changed successfully'
+        })
 
 
 class UserStatsView(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        stats = {
-            'total_users': User.objects.count(),
-            'active_users': User.objects.filter(is_active=True).count(),
-            'patients': User.objects.filter(role='patient').count(),
-            'doctors': User.objects.filter(role='doctor').count(),
-            'admins': User.objects.filter(role='admin').count(),
-            'general_users': User.objects.filter(role='user').count(),
-        }
-        return Response(stats)
+        return Response(get_stats(fresh=wants_fresh_stats(request))['users'])
 
 
 # Legacy views for backward compatibility
-class RegisterView(generics.CreateAPIView):
+class RegisterView(HashingBusyMixin, generics.CreateAPIView):
     serializer_class = RegisterSerializer
     permission_classes = [permissions.AllowAny]
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
-    @classmethod
-    def get_token(cls,user):
-        token = super().get_token(user)
-        token['role'] = user.role
-        return token
+    # Adds the role and token version claims
+    token_class = UserRefreshToken
 
-class MyTokenObtainPairView(TokenObtainPairView):
+class MyTokenObtainPairView(HashingBusyMixin, TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
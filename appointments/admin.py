@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Appointment, Review
+from .models import Appointment, AppointmentDailyStat, Review
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
@@ -48,4 +48,18 @@ class ReviewAdmin(admin.ModelAdmin):
             'fields': ('created_at',),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(AppointmentDailyStat)
+class AppointmentDailyStatAdmin(admin.ModelAdmin):
+    list_display = ('day', 'doctor', 'status', 'appointment_type', 'count')
+    list_filter = ('status', 'appointment_type', 'day')
+    date_hierarchy = 'day'
+    
+    # Rows are maintained from appointment changes
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,135 @@
+"""
+Doctor slot availability.
+
+A booking occupies one slot of ``APPOINTMENT_SLOT_MINUTES`` starting at its
+``appointment_date``. Conflicts are detected with a range query on the
+``(doctor, appointment_date)`` index, and bookings for the same doctor are
+serialized by locking the doctor row, so a check never scans the doctor's
+whole appointment history.
+"""
+from bisect import bisect_left
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from doctors.models import Doctor
+from .models import Appointment
+
+# Statuses that keep a slot occupied
+BLOCKING_STATUSES = ('pending', 'accepted', 'completed')
+
+# Working hours used when a doctor has not set available_from/available_to
+DEFAULT_DAY_START = time(9, 0)
+DEFAULT_DAY_END = time(17, 30)
+
+MAX_RANGE_DAYS = 31
+
+
+class SlotUnavailable(Exception):
+    """Raised when a requested appointment time cannot be booked."""
+
+
+def get_slot_length():
+    return timedelta(minutes=getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 30))
+
+
+def get_working_hours(doctor):
+    """Return the (start, end) times a doctor takes appointments."""
+    return (doctor.available_from or DEFAULT_DAY_START,
+            doctor.available_to or DEFAULT_DAY_END)
+
+
+def conflicting_appointments(doctor, appointment_date):
+    """
+    Appointments of ``doctor`` whose slot overlaps a slot starting at
+    ``appointment_date``. Served by the (doctor, appointment_date) index.
+    """
+    slot = get_slot_length()
+    return Appointment.objects.filter(
+        doctor=doctor,
+        appointment_date__gt=appointment_date - slot,
+        appointment_date__lt=appointment_date + slot,
+        status__in=BLOCKING_STATUSES,
+    )
+
+
+def check_slot(doctor, appointment_date):
+    """Raise SlotUnavailable if ``appointment_date`` cannot be booked with ``doctor``."""
+    if not doctor.is_available:
+        raise SlotUnavailable('This doctor is not accepting appointments.')
+
+    if appointment_date <= timezone.now():
+        raise SlotUnavailable('Appointments must be booked in the future.')
+
+    local_start = timezone.localtime(appointment_date)
+    day_start, day_end = get_working_hours(doctor)
+    local_end = (local_start + get_slot_length()).time()
+    if local_start.time() < day_start or local_end > day_end or local_end < local_start.time():
+        raise SlotUnavailable(
+            f"Please choose a time between {day_start.strftime('%H:%M')} "
+            f"and {day_end.strftime('%H:%M')}."
+        )
+
+    if conflicting_appointments(doctor, appointment_date).exists():
+        raise SlotUnavailable('This time slot is already booked. Please choose another time.')
+
+
+def reserve_slot(doctor, appointment_date):
+    """
+    Lock the doctor row and re-check the slot. Must be called inside
+    ``transaction.atomic()``; the lock is held until the caller commits, so
+    concurrent bookings for the same doctor are checked one at a time.
+    """
+    locked_doctor = Doctor.objects.select_for_update().get(pk=doctor.pk)
+    check_slot(locked_doctor, appointment_date)
+    return locked_doctor
+
+
+def build_slot_grid(doctor, date_from, date_to):
+    """
+    Return the slot grid of ``doctor`` for every day in ``date_from``..``date_to``
+    (inclusive) as a list of ``{'date', 'slots': [{'start', 'end', 'available'}]}``.
+
+    Booked times are fetched with a single indexed range query and matched
+    against the grid with a binary search.
+    """
+    tz = timezone.get_current_timezone()
+    slot = get_slot_length()
+    day_start, day_end = get_working_hours(doctor)
+    now = timezone.now()
+
+    window_start = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    window_end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min), tz)
+    booked = sorted(
+        Appointment.objects.filter(
+            doctor=doctor,
+            appointment_date__gt=window_start - slot,
+            appointment_date__lt=window_end + slot,
+            status__in=BLOCKING_STATUSES,
+        ).values_list('appointment_date', flat=True)
+    )
+
+    def is_free(start):
+        # Any booking in the open interval (start - slot, start + slot) overlaps
+        index = bisect_left(booked, start - slot)
+        while index < len(booked) and booked[index] <= start - slot:
+            index += 1
+        return index == len(booked) or booked[index] >= start + slot
+
+    days = []
+    day = date_from
+    while day <= date_to:
+        slots = []
+        start = timezone.make_aware(datetime.combine(day, day_start), tz)
+        last_start = timezone.make_aware(datetime.combine(day, day_end), tz) - slot
+        while start <= last_start:
+            slots.append({
+                'start': start.isoformat(),
+                'end': (start + slot).isoformat(),
+                'available': doctor.is_available and start > now and is_free(start),
+            })
+            start += slot
+        days.append({'date': day.isoformat(), 'slots': slots})
+        day += timedelta(days=1)
+    return days
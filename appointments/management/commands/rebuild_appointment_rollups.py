@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from appointments.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily appointment rollups from the appointment table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} appointment rollup rows'))
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:22
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def build_rollups(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    AppointmentDailyStat = apps.get_model('appointments', 'AppointmentDailyStat')
+    
+    rows = Appointment.objects.annotate(
+        day=TruncDate('appointment_date')
+    ).values('day', 'doctor_id', 'status', 'appointment_type').annotate(
+        count=Count('id')
+    ).order_by()
+    AppointmentDailyStat.objects.bulk_create(
+        [AppointmentDailyStat(**row) for row in rows], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0004_doctor_search'),
+        ('appointments', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('appointment_type', models.CharField(choices=[('consultation', 'Consultation'), ('follow_up', 'Follow-up'), ('checkup', 'Regular Checkup'), ('emergency', 'Emergency')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointment_stats', to='doctors.doctor')),
+            ],
+            options={
+                'unique_together': {('day', 'doctor', 'status', 'appointment_type')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -36,6 +36,29 @@ class Appointment(models.Model):
     class Meta:
         ordering = ['-appointment_date', '-created_at']
         unique_together = ('patient', 'doctor', 'appointment_date')
+        indexes = [
+            models.Index(fields=['doctor', 'appointment_date'], name='appointment_doctor_date_idx'),
+            models.Index(fields=['patient', 'appointment_date'], name='appointment_patient_date_idx'),
+            models.Index(fields=['appointment_date', 'id'], name='appointment_date_id_idx'),
+            # Dashboards and lists filtered by status, newest appointment first
+            models.Index(fields=['doctor', 'status', '-appointment_date'], name='appointment_doctor_status_idx'),
+            models.Index(fields=['patient', 'status', '-appointment_date'], name='appointment_patient_status_idx'),
+            # A doctor's queue of requests awaiting review
+            models.Index(fields=['doctor', '-created_at'], name='appointment_doctor_pending_idx',
+                         condition=models.Q(status='pending')),
+        ]
+
+    # Fields placing an appointment in its daily rollup row, see appointments.rollups
+    ROLLUP_FIELDS = ('appointment_date', 'doctor_id', 'status', 'appointment_type')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Saves then know the rollup row they move the appointment from without a query
+        instance._stored_rollup_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.ROLLUP_FIELDS
+        }
+        return instance
 
     def __str__(self):
         return f"{self.patient.user.full_name} -> Dr. {self.doctor.user.full_name} on {self.appointment_date.strftime('%Y-%m-%d %H:%M')}"
@@ -53,8 +76,36 @@ class Review(models.Model):
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Edits then know the doctor and rating they replace without a query, see doctors.ratings
+        loaded = dict(zip(field_names, values))
+        if 'doctor_id' in loaded and 'rating' in loaded:
+            instance._stored_rating = (loaded['doctor_id'], loaded['rating'])
+        return instance
+    
     def __str__(self):
         return f"{self.patient.user.full_name} -> Dr. {self.doctor.user.full_name} ({self.rating}/5)"
     
     class Meta:
         unique_together = ('patient', 'doctor', 'appointment')
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='review_created_id_idx'),
+        ]
+
+
+class AppointmentDailyStat(models.Model):
+    """Number of appointments per local day, doctor, status and type. Maintained by appointments.rollups."""
+    day = models.DateField()
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='appointment_stats')
+    status = models.CharField(max_length=20, choices=Appointment.STATUS_CHOICES)
+    appointment_type = models.CharField(max_length=20, choices=Appointment.APPOINTMENT_TYPE_CHOICES)
+    count = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.day} Dr. #{self.doctor_id} {self.status}/{self.appointment_type}: {self.count}"
+    
+    class Meta:
+        # The unique index leads with day, so it also serves date range reads
+        unique_together = ('day', 'doctor', 'status', 'appointment_type')
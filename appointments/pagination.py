@@ -0,0 +1,30 @@
+from rest_framework.pagination import CursorPagination
+
+
+class IdTiebreakCursorPagination(CursorPagination):
+    """
+    Cursor pagination that breaks ties on ``id``. The cursor holds the value
+    of the first ordering field plus an offset into the rows sharing it, so
+    those rows need a stable order, including when ?ordering= picks a
+    non-unique field such as created_at.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering += ('-id' if ordering[0].startswith('-') else 'id',)
+        return ordering
+
+
+class AppointmentCursorPagination(IdTiebreakCursorPagination):
+    """
+    Keyset pagination over (appointment_date, id). The view's OrderingFilter
+    still picks the ordering; no COUNT(*) is run for any page.
+    """
+    ordering = ('-appointment_date', '-id')
+
+
+class ReviewCursorPagination(IdTiebreakCursorPagination):
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,123 @@
+"""
+Daily appointment rollups.
+
+AppointmentDailyStat holds the number of appointments per local day,
+doctor, status and type. Appointment saves and deletes move one unit
+between rows, so analytics read a few rows per day instead of scanning
+the appointment table. rebuild_rollups() recomputes everything from one
+grouped query.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from .models import Appointment, AppointmentDailyStat
+
+# Truncation applied to the rollup day for each timeseries granularity
+GRANULARITIES = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def rollup_key(appointment):
+    """Rollup row an appointment is counted in."""
+    return {
+        'day': timezone.localdate(appointment.appointment_date),
+        'doctor_id': appointment.doctor_id,
+        'status': appointment.status,
+        'appointment_type': appointment.appointment_type,
+    }
+
+
+def adjust_rollup(key, delta):
+    """Atomically add ``delta`` to the rollup row identified by ``key``."""
+    rows = AppointmentDailyStat.objects.filter(**key)
+    if rows.update(count=F('count') + delta):
+        return
+    try:
+        with transaction.atomic():
+            AppointmentDailyStat.objects.create(count=delta, **key)
+    except IntegrityError:
+        # Created concurrently
+        rows.update(count=F('count') + delta)
+
+
+def adjust_rollups(deltas):
+    """
+    Apply many ``(rollup key, delta)`` pairs in two queries: missing rows are
+    inserted with a zero count, then one UPDATE adds every delta.
+    """
+    deltas = [(key, delta) for key, delta in deltas if delta]
+    if not deltas:
+        return
+    AppointmentDailyStat.objects.bulk_create(
+        [AppointmentDailyStat(count=0, **key) for key, delta in deltas if delta > 0],
+        ignore_conflicts=True
+    )
+    matches = [(Q(**key), delta) for key, delta in deltas]
+    condition = Q()
+    for match, _ in matches:
+        condition |= match
+    AppointmentDailyStat.objects.filter(condition).update(count=F('count') + Case(
+        *[When(match, then=Value(delta)) for match, delta in matches],
+        default=Value(0), output_field=IntegerField()
+    ))
+
+
+def move_appointment(previous_key, key):
+    """Record an appointment moving between rollup rows; either key may be None."""
+    if previous_key == key:
+        return
+    if previous_key is not None:
+        adjust_rollup(previous_key, -1)
+    if key is not None:
+        adjust_rollup(key, 1)
+
+
+def rebuild_rollups(batch_size=1000):
+    """Replace all rollup rows with counts grouped from the appointment table."""
+    rows = Appointment.objects.annotate(
+        day=TruncDate('appointment_date')
+    ).values('day', 'doctor_id', 'status', 'appointment_type').annotate(
+        count=Count('id')
+    ).order_by()
+    with transaction.atomic():
+        AppointmentDailyStat.objects.all().delete()
+        AppointmentDailyStat.objects.bulk_create(
+            [AppointmentDailyStat(**row) for row in rows], batch_size=batch_size
+        )
+    return AppointmentDailyStat.objects.count()
+
+
+def appointment_timeseries(date_from, date_to, granularity='day', doctor_id=None):
+    """
+    Appointment counts per period between two days (inclusive) as a list of
+    ``{'period', 'total', 'by_status', 'by_type'}``. Periods without
+    appointments are left out.
+    """
+    rows = AppointmentDailyStat.objects.filter(day__range=(date_from, date_to))
+    if doctor_id is not None:
+        rows = rows.filter(doctor_id=doctor_id)
+    trunc = GRANULARITIES[granularity]
+    rows = rows.annotate(
+        period=trunc('day') if trunc else F('day')
+    ).values('period', 'status', 'appointment_type').annotate(
+        count=Sum('count')
+    ).order_by('period')
+
+    series = {}
+    for row in rows:
+        if not row['count']:
+            continue
+        point = series.setdefault(row['period'], {
+            'period': row['period'].isoformat(),
+            'total': 0,
+            'by_status': {},
+            'by_type': {},
+        })
+        point['total'] += row['count']
+        point['by_status'][row['status']] = point['by_status'].get(row['status'], 0) + row['count']
+        point['by_type'][row['appointment_type']] = point['by_type'].get(row['appointment_type'], 0) + row['count']
+    return list(series.values())
@@ -1,5 +1,9 @@
+from django.db import transaction
 from rest_framework import serializers
 from .models import Appointment, Review
+from .availability import SlotUnavailable, check_slot, reserve_slot
+from .transitions import MAX_BATCH_SIZE, TARGET_STATUSES
+from accounts.identity import get_identity
 from patients.serializers import PatientListSerializer
 from doctors.serializers import DoctorListSerializer
 
@@ -18,13 +22,27 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
         model = Appointment
         fields = ('doctor', 'appointment_date', 'appointment_type', 'reason_for_visit', 'symptoms')
     
+    def validate(self, attrs):
+        try:
+            check_slot(attrs['doctor'], attrs['appointment_date'])
+        except SlotUnavailable as e:
+            raise serializers.ValidationError({'appointment_date': str(e)})
+        return attrs
+    
     def create(self, validated_data):
         user = self.context['request'].user
         if hasattr(user, 'patient_profile'):
             validated_data['patient'] = user.patient_profile
         else:
             raise serializers.ValidationError("Only patients can create appointments")
-        return super().create(validated_data)
+        
+        # Re-check under the doctor row lock so concurrent bookings can't take the same slot
+        with transaction.atomic():
+            try:
+                reserve_slot(validated_data['doctor'], validated_data['appointment_date'])
+            except SlotUnavailable as e:
+                raise serializers.ValidationError({'appointment_date': str(e)})
+            return super().create(validated_data)
 
 
 class AppointmentUpdateSerializer(serializers.ModelSerializer):
@@ -33,6 +51,16 @@ class AppointmentUpdateSerializer(serializers.ModelSerializer):
         fields = ('status', 'notes', 'prescription', 'follow_up_date', 'rejection_reason')
 
 
+class StatusTransitionSerializer(serializers.Serializer):
+    id = serializers.IntegerField(min_value=1)
+    status = serializers.ChoiceField(choices=TARGET_STATUSES)
+    rejection_reason = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class BulkStatusSerializer(serializers.Serializer):
+    transitions = StatusTransitionSerializer(many=True, allow_empty=False, max_length=MAX_BATCH_SIZE)
+
+
 class AppointmentListSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.user.full_name', read_only=True)
     doctor_name = serializers.CharField(source='doctor.user.full_name', read_only=True)
@@ -61,18 +89,18 @@ class ReviewCreateSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         appointment = validated_data['appointment']
-        user = self.context['request'].user
+        patient_id = get_identity(self.context['request']).patient_id
         
-        if not hasattr(user, 'patient_profile'):
+        if patient_id is None:
             raise serializers.ValidationError("Only patients can create reviews")
         
-        if appointment.patient != user.patient_profile:
+        if appointment.patient_id != patient_id:
             raise serializers.ValidationError("You can only review your own appointments")
         
         if appointment.status != 'completed':
             raise serializers.ValidationError("You can only review completed appointments")
         
-        validated_data['patient'] = user.patient_profile
-        validated_data['doctor'] = appointment.doctor
+        validated_data['patient_id'] = patient_id
+        validated_data['doctor_id'] = appointment.doctor_id
         
         return super().create(validated_data)
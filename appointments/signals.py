@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+from .models import Appointment
+from .rollups import move_appointment, rollup_key
+
+# Sent with ``appointments`` (patient and doctor loaded) after
+# appointments.transitions changes their status with QuerySet.update(),
+# which skips post_save
+appointments_bulk_updated = Signal()
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_rollup_key(sender, instance, **kwargs):
+    """
+    Keep the rollup row of the stored appointment for post_save. Loaded
+    appointments remember it from Appointment.from_db(); only instances
+    built by hand, or loaded without those fields, need a query.
+    """
+    instance._previous_rollup_key = None
+    if instance.pk:
+        stored = getattr(instance, '_stored_rollup_values', {})
+        if len(stored) == len(Appointment.ROLLUP_FIELDS):
+            previous = SimpleNamespace(**stored)
+        else:
+            previous = Appointment.objects.filter(pk=instance.pk).only(*Appointment.ROLLUP_FIELDS).first()
+        if previous is not None:
+            instance._previous_rollup_key = rollup_key(previous)
+
+
+@receiver(post_save, sender=Appointment)
+def update_rollup_on_save(sender, instance, **kwargs):
+    move_appointment(getattr(instance, '_previous_rollup_key', None), rollup_key(instance))
+    instance._stored_rollup_values = {name: getattr(instance, name) for name in Appointment.ROLLUP_FIELDS}
+
+
+@receiver(post_delete, sender=Appointment)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    move_appointment(rollup_key(instance), None)
@@ -0,0 +1,427 @@
+"""
+Slot availability: double booking and the doctor's slot grid. Bulk status
+transitions. Daily rollups and the timeseries endpoint. Cursor pagination
+and the query counts of the list endpoints.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import connection
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.models import User
+from doctors.models import Doctor
+from patients.models import Patient
+from chat.models import ChatRoom
+from .availability import SlotUnavailable, build_slot_grid, check_slot
+from .models import Appointment, AppointmentDailyStat, Review
+from .pagination import AppointmentCursorPagination
+from .rollups import rebuild_rollups
+from .transitions import apply_transitions
+from .views import AppointmentListCreateView
+
+
+class AvailabilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+        )
+        cls.patient_user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        cls.doctor = Doctor.objects.create(
+            user=doctor_user, specialization='cardiology', available_from=time(9, 0), available_to=time(11, 0)
+        )
+        cls.patient = Patient.objects.create(user=cls.patient_user)
+        cls.day = timezone.localdate() + timedelta(days=7)
+
+    def at(self, hour, minute=0, day=None):
+        return timezone.make_aware(datetime.combine(day or self.day, time(hour, minute)))
+
+    def book(self, start, status='pending'):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, appointment_date=start,
+            reason_for_visit='Checkup', status=status
+        )
+
+    def test_overlapping_slots_are_refused(self):
+        self.book(self.at(9, 30))
+        for start in (self.at(9, 30), self.at(9, 15), self.at(9, 45)):
+            with self.assertRaises(SlotUnavailable):
+                check_slot(self.doctor, start)
+        # Adjacent slots are free
+        check_slot(self.doctor, self.at(9, 0))
+        check_slot(self.doctor, self.at(10, 0))
+
+    def test_rejected_and_cancelled_appointments_free_their_slot(self):
+        self.book(self.at(9, 30), status='rejected')
+        self.book(self.at(9, 45), status='cancelled')
+        check_slot(self.doctor, self.at(9, 30))
+
+    def test_times_outside_working_hours_are_refused(self):
+        for start in (self.at(8, 30), self.at(10, 45), self.at(11, 0)):
+            with self.assertRaises(SlotUnavailable):
+                check_slot(self.doctor, start)
+
+    def test_double_booking_through_the_api(self):
+        client = APIClient()
+        client.force_authenticate(self.patient_user)
+        data = {'doctor': self.doctor.id, 'appointment_date': self.at(10, 0).isoformat(),
+                'appointment_type': 'consultation', 'reason_for_visit': 'Checkup'}
+        self.assertEqual(client.post('/api/appointments/', data, format='json').status_code, 201)
+        response = client.post('/api/appointments/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('appointment_date', response.json())
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 1)
+
+    def test_slot_grid(self):
+        self.book(self.at(9, 30))
+        self.book(self.at(10, 0), status='rejected')
+        days = build_slot_grid(self.doctor, self.day, self.day + timedelta(days=1))
+        self.assertEqual([day['date'] for day in days],
+                         [self.day.isoformat(), (self.day + timedelta(days=1)).isoformat()])
+        slots = days[0]['slots']
+        self.assertEqual([slot['start'] for slot in slots],
+                         [self.at(hour, minute).isoformat() for hour, minute in ((9, 0), (9, 30), (10, 0), (10, 30))])
+        self.assertEqual(slots[-1]['end'], self.at(11, 0).isoformat())
+        self.assertEqual([slot['available'] for slot in slots], [True, False, True, True])
+        self.assertTrue(all(slot['available'] for slot in days[1]['slots']))
+
+    def test_slot_grid_of_past_days_and_unavailable_doctors(self):
+        past_day = timezone.localdate() - timedelta(days=1)
+        self.assertFalse(any(slot['available'] for slot in build_slot_grid(self.doctor, past_day, past_day)[0]['slots']))
+
+        self.doctor.is_available = False
+        self.assertFalse(any(slot['available'] for slot in build_slot_grid(self.doctor, self.day, self.day)[0]['slots']))
+
+    def test_slots_endpoint(self):
+        self.book(self.at(9, 0))
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/slots/', {'from': self.day.isoformat(),
+                                                                               'to': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['days'][0]['slots'][0]['available'])
+        response = self.client.get(f'/api/doctors/{self.doctor.id}/slots/', {'from': 'tomorrow'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+        )
+        other_user = User.objects.create_user(
+            email='other@example.com', password='password', first_name='Olga', last_name='Ray', role='doctor'
+        )
+        cls.patient_user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        cls.doctor = Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+        cls.other_doctor = Doctor.objects.create(user=other_user, specialization='dermatology')
+        cls.patient = Patient.objects.create(user=cls.patient_user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor_user)
+        self.hour = 8
+
+    def book(self, status='pending', doctor=None):
+        self.hour += 1
+        return Appointment.objects.create(
+            patient=self.patient, doctor=doctor or self.doctor, reason_for_visit='Checkup', status=status,
+            appointment_date=timezone.now().replace(hour=self.hour, minute=0) + timedelta(days=7)
+        )
+
+    def post(self, transitions):
+        return self.client.post('/api/appointments/bulk-status/', {'transitions': transitions}, format='json')
+
+    def assertStatus(self, appointment, status):
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, status)
+
+    def test_allowed_transitions(self):
+        to_accept, to_reject, to_complete = self.book(), self.book(), self.book(status='accepted')
+        results = apply_transitions(self.doctor, [
+            {'id': to_accept.id, 'status': 'accepted'},
+            {'id': to_reject.id, 'status': 'rejected', 'rejection_reason': 'Fully booked'},
+            {'id': to_complete.id, 'status': 'completed'},
+        ])
+        self.assertEqual([result['ok'] for result in results], [True, True, True])
+        self.assertEqual([result['previous_status'] for result in results], ['pending', 'pending', 'accepted'])
+        self.assertStatus(to_accept, 'accepted')
+        self.assertStatus(to_reject, 'rejected')
+        self.assertEqual(to_reject.rejection_reason, 'Fully booked')
+        self.assertStatus(to_complete, 'completed')
+        self.assertTrue(ChatRoom.objects.filter(appointment=to_accept, patient=self.patient_user,
+                                                doctor=self.doctor_user).exists())
+
+    def test_forbidden_transitions(self):
+        cases = [(self.book(status='completed'), 'accepted'), (self.book(status='rejected'), 'accepted'),
+                 (self.book(), 'completed'), (self.book(status='cancelled'), 'rejected')]
+        results = apply_transitions(self.doctor, [
+            {'id': appointment.id, 'status': target} for appointment, target in cases
+        ])
+        self.assertFalse(any(result['ok'] for result in results))
+        self.assertEqual(results[0]['error'], 'Cannot change a completed appointment to accepted')
+        for (appointment, _), status in zip(cases, ('completed', 'rejected', 'pending', 'cancelled')):
+            self.assertStatus(appointment, status)
+
+    def test_partially_invalid_batch(self):
+        valid, completed = self.book(), self.book(status='completed')
+        duplicate = self.book()
+        response = self.post([
+            {'id': valid.id, 'status': 'accepted'},
+            {'id': completed.id, 'status': 'rejected'},
+            {'id': duplicate.id, 'status': 'accepted'},
+            {'id': duplicate.id, 'status': 'rejected'},
+            {'id': 999999, 'status': 'accepted'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([result['ok'] for result in response.data['results']], [True, False, False, False, False])
+        self.assertEqual(response.data['results'][2]['error'], 'Appointment is listed more than once')
+        self.assertEqual(response.data['results'][4]['error'], 'Appointment not found')
+        self.assertStatus(valid, 'accepted')
+        self.assertStatus(completed, 'completed')
+        self.assertStatus(duplicate, 'pending')
+
+    def test_invalid_payloads_are_refused(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{'id': self.book().id, 'status': 'cancelled'}]).status_code, 400)
+
+    def test_doctors_cannot_change_other_doctors_appointments(self):
+        theirs = self.book(doctor=self.other_doctor)
+        response = self.post([{'id': theirs.id, 'status': 'accepted'}])
+        self.assertEqual(response.data['results'][0], {'id': theirs.id, 'ok': False, 'error': 'Appointment not found'})
+        self.assertStatus(theirs, 'pending')
+
+    def test_only_doctors_may_post(self):
+        appointment = self.book()
+        self.client.force_authenticate(self.patient_user)
+        self.assertEqual(self.post([{'id': appointment.id, 'status': 'accepted'}]).status_code, 403)
+        self.assertStatus(appointment, 'pending')
+
+    def test_one_update_per_target_status(self):
+        accepted = [self.book() for _ in range(3)]
+        rejected = [self.book() for _ in range(2)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post([{'id': appointment.id, 'status': 'accepted'} for appointment in accepted]
+                                 + [{'id': appointment.id, 'status': 'rejected'} for appointment in rejected])
+        self.assertEqual(response.data['updated'], 5)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "appointments_appointment"')]
+        self.assertEqual(len(updates), 2)
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+        )
+        patient_user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', password='password', first_name='Ada', last_name='Min', role='admin'
+        )
+        cls.doctor = Doctor.objects.create(user=doctor_user, specialization='cardiology')
+        cls.patient = Patient.objects.create(user=patient_user)
+        cls.start = timezone.make_aware(datetime(2025, 3, 3, 10, 0))
+
+    def book(self, days=0, **fields):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, reason_for_visit='Checkup',
+            appointment_date=self.start + timedelta(days=days), **fields
+        )
+
+    def assertRollupsMatch(self):
+        recomputed = Appointment.objects.annotate(day=TruncDate('appointment_date')).values(
+            'day', 'doctor_id', 'status', 'appointment_type'
+        ).annotate(count=Count('id')).order_by()
+        stored = AppointmentDailyStat.objects.filter(count__gt=0).values(
+            'day', 'doctor_id', 'status', 'appointment_type', 'count'
+        )
+        self.assertCountEqual(list(stored), list(recomputed))
+
+    def test_saves_and_deletes_keep_the_rollups_exact(self):
+        first, second = self.book(), self.book(days=1, appointment_type='follow_up')
+        self.assertRollupsMatch()
+
+        first.appointment_date += timedelta(days=2)
+        first.save()
+        self.assertRollupsMatch()
+
+        second.status = 'accepted'
+        second.save(update_fields=['status', 'updated_at'])
+        self.assertRollupsMatch()
+
+        loaded = Appointment.objects.get(pk=second.pk)
+        loaded.status = 'completed'
+        loaded.appointment_type = 'checkup'
+        loaded.save()
+        self.assertRollupsMatch()
+
+        # Loaded without the rollup fields, the stored row is read back
+        partial = Appointment.objects.only('id', 'status').get(pk=first.pk)
+        partial.status = 'cancelled'
+        partial.save(update_fields=['status'])
+        self.assertRollupsMatch()
+
+        Appointment.objects.get(pk=first.pk).delete()
+        self.assertRollupsMatch()
+
+    def test_saving_a_loaded_appointment_does_not_read_it_again(self):
+        appointment = Appointment.objects.get(pk=self.book().pk)
+        appointment.status = 'rejected'
+        with CaptureQueriesContext(connection) as queries:
+            appointment.save(update_fields=['status', 'updated_at'])
+        self.assertFalse([query['sql'] for query in queries
+                          if query['sql'].startswith('SELECT') and 'FROM "appointments_appointment"' in query['sql']])
+        self.assertRollupsMatch()
+
+    def test_rebuild(self):
+        self.book()
+        self.book(days=1, status='accepted')
+        AppointmentDailyStat.objects.update(count=7)
+        self.assertEqual(rebuild_rollups(), 2)
+        self.assertRollupsMatch()
+
+    def test_timeseries_endpoint(self):
+        self.book()
+        self.book(days=1, status='accepted', appointment_type='follow_up')
+        self.book(days=40)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+
+        response = client.get('/api/appointments/stats/timeseries/', {'from': '2025-03-01', 'to': '2025-03-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['series'], [
+            {'period': '2025-03-03', 'total': 1, 'by_status': {'pending': 1}, 'by_type': {'consultation': 1}},
+            {'period': '2025-03-04', 'total': 1, 'by_status': {'accepted': 1}, 'by_type': {'follow_up': 1}},
+        ])
+
+        response = client.get('/api/appointments/stats/timeseries/',
+                              {'from': '2025-03-01', 'to': '2025-04-30', 'granularity': 'month'})
+        self.assertEqual([(point['period'], point['total']) for point in response.data['series']],
+                         [('2025-03-01', 2), ('2025-04-01', 1)])
+
+        for params in ({'granularity': 'year'}, {'from': 'March'}, {'from': '2025-04-01', 'to': '2025-03-01'},
+                       {'doctor': 'me'}):
+            self.assertEqual(client.get('/api/appointments/stats/timeseries/', params).status_code, 400, params)
+
+        client.force_authenticate(self.patient.user)
+        self.assertEqual(client.get('/api/appointments/stats/timeseries/').status_code, 403)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+        )
+        cls.patient_user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        doctor = Doctor.objects.create(user=doctor_user, specialization='cardiology')
+        patient = Patient.objects.create(user=cls.patient_user)
+        start = timezone.now() + timedelta(days=1)
+        cls.appointments = [
+            Appointment.objects.create(patient=patient, doctor=doctor, reason_for_visit='Checkup',
+                                       appointment_date=start + timedelta(hours=i))
+            for i in range(7)
+        ]
+        # Ties on the ordering field
+        Appointment.objects.update(created_at=timezone.now())
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient_user)
+
+    def walk(self, params):
+        ids, url = [], '/api/appointments/'
+        while url:
+            data = self.client.get(url, params).json()
+            self.assertEqual(set(data), {'next', 'previous', 'results'})
+            self.assertLessEqual(len(data['results']), 3)
+            ids += [appointment['id'] for appointment in data['results']]
+            url, params = data['next'], None
+        return ids
+
+    def test_pages_cover_every_appointment_once(self):
+        expected = [appointment.id for appointment in reversed(self.appointments)]
+        self.assertEqual(self.walk({'page_size': 3}), expected)
+
+    def test_ordering_on_a_non_unique_field_breaks_ties_on_id(self):
+        ids = sorted(appointment.id for appointment in self.appointments)
+        self.assertEqual(self.walk({'page_size': 3, 'ordering': 'created_at'}), ids)
+        self.assertEqual(self.walk({'page_size': 3, 'ordering': '-created_at'}), ids[::-1])
+
+        view = AppointmentListCreateView()
+        for ordering, expected in (('created_at', ('created_at', 'id')), ('-created_at', ('-created_at', '-id')),
+                                   ('', ('-appointment_date', '-id'))):
+            request = Request(APIRequestFactory().get('/api/appointments/', {'ordering': ordering}))
+            self.assertEqual(AppointmentCursorPagination().get_ordering(request, Appointment.objects.all(), view),
+                             expected)
+
+    def test_previous_page(self):
+        first = self.client.get('/api/appointments/', {'page_size': 3}).json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(self.client.get(second['previous']).json()['results'], first['results'])
+
+
+class ListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+        )
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', password='password', first_name='Ada', last_name='Min', role='admin'
+        )
+        cls.doctor = Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+        start = timezone.now() - timedelta(days=30)
+        cls.patient_users = []
+        for i in range(5):
+            patient_user = User.objects.create_user(
+                email=f'patient{i}@example.com', password='password', first_name='Pat', last_name=f'Roe{i}',
+                role='patient'
+            )
+            patient = Patient.objects.create(user=patient_user)
+            appointment = Appointment.objects.create(
+                patient=patient, doctor=cls.doctor, reason_for_visit='Checkup', status='completed',
+                appointment_date=start + timedelta(days=i)
+            )
+            Review.objects.create(appointment=appointment, patient=patient, doctor=cls.doctor, rating=4)
+            cls.patient_users.append(patient_user)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def assertQueries(self, user, url, count):
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(count):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_appointment_lists(self):
+        response = self.assertQueries(self.admin, '/api/appointments/', 1)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['patient_name'], 'Pat Roe4')
+        self.assertQueries(self.doctor_user, '/api/appointments/', 1)
+        self.assertQueries(self.patient_users[0], '/api/appointments/', 1)
+        self.assertQueries(self.doctor_user, '/api/appointments/doctor/', 1)
+        self.assertQueries(self.patient_users[0], '/api/appointments/patient/', 1)
+
+    def test_review_lists(self):
+        response = self.assertQueries(self.admin, '/api/appointments/reviews/', 1)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertQueries(self.patient_users[0], '/api/appointments/reviews/', 1)
+        # Page numbers, so the list is counted
+        self.assertQueries(self.admin, f'/api/appointments/doctors/{self.doctor.id}/reviews/', 2)
@@ -0,0 +1,116 @@
+"""
+Appointment status transitions applied by doctors.
+
+apply_transitions() validates a batch of ``(appointment id, new status)``
+against ALLOWED_TRANSITIONS and writes them with one UPDATE per target
+status (and rejection reason), touching only status, rejection_reason and
+updated_at. QuerySet.update() skips model signals, so the work the
+Appointment signals do for single saves is done here in bulk: rollup rows
+are adjusted once per distinct row, chat rooms of newly accepted
+appointments are created with one bulk_create and appointments_bulk_updated
+is sent once for the batch.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from chat.models import ChatRoom
+from .models import Appointment
+from .rollups import adjust_rollups, rollup_key
+from .signals import appointments_bulk_updated
+
+# Statuses a doctor may move an appointment to, by current status
+ALLOWED_TRANSITIONS = {
+    'pending': ('accepted', 'rejected'),
+    'accepted': ('completed', 'rejected'),
+}
+
+TARGET_STATUSES = ('accepted', 'rejected', 'completed')
+
+MAX_BATCH_SIZE = 200
+
+
+def source_statuses(target):
+    return [source for source, targets in ALLOWED_TRANSITIONS.items() if target in targets]
+
+
+def apply_transitions(doctor, transitions):
+    """
+    Apply ``transitions`` (dicts with ``id``, ``status`` and optionally
+    ``rejection_reason``) to appointments of ``doctor``. Returns one result
+    per transition, in order: ``{'id', 'ok', 'previous_status', 'status'}`` or
+    ``{'id', 'ok': False, 'error'}``. Valid transitions are applied even when
+    others in the batch fail.
+    """
+    ids = [transition['id'] for transition in transitions]
+    duplicates = {appointment_id for appointment_id, count in Counter(ids).items() if count > 1}
+    results = {}
+    groups = defaultdict(list)
+
+    with transaction.atomic():
+        current = {
+            appointment.id: appointment
+            for appointment in Appointment.objects.select_for_update().filter(
+                id__in=ids, doctor=doctor
+            ).select_related('patient').only(
+                'id', 'status', 'appointment_date', 'appointment_type', 'doctor_id', 'patient__user_id'
+            )
+        }
+        for transition in transitions:
+            appointment_id, target = transition['id'], transition['status']
+            appointment = current.get(appointment_id)
+            if appointment_id in duplicates:
+                error = 'Appointment is listed more than once'
+            elif appointment is None:
+                error = 'Appointment not found'
+            elif target not in ALLOWED_TRANSITIONS.get(appointment.status, ()):
+                error = f'Cannot change a {appointment.status} appointment to {target}'
+            else:
+                reason = transition.get('rejection_reason', '') if target == 'rejected' else None
+                groups[target, reason].append(appointment)
+                results[appointment_id] = {
+                    'id': appointment_id, 'ok': True,
+                    'previous_status': appointment.status, 'status': target,
+                }
+                continue
+            results.setdefault(appointment_id, {'id': appointment_id, 'ok': False, 'error': error})
+
+        now = timezone.now()
+        rollup_deltas = Counter()
+        accepted = []
+        for (target, reason), appointments in groups.items():
+            fields = {'status': target, 'updated_at': now}
+            if reason is not None:
+                fields['rejection_reason'] = reason
+            Appointment.objects.filter(
+                id__in=[appointment.id for appointment in appointments],
+                doctor=doctor,
+                status__in=source_statuses(target),
+            ).update(**fields)
+
+            for appointment in appointments:
+                rollup_deltas[tuple(rollup_key(appointment).items())] -= 1
+                appointment.status = target
+                rollup_deltas[tuple(rollup_key(appointment).items())] += 1
+            if target == 'accepted':
+                accepted.extend(appointments)
+
+        adjust_rollups((dict(key), delta) for key, delta in rollup_deltas.items())
+        if groups:
+            changed = [appointment for appointments in groups.values() for appointment in appointments]
+            for appointment in changed:
+                appointment.doctor = doctor
+            appointments_bulk_updated.send(sender=Appointment, appointments=changed)
+
+        if accepted:
+            ChatRoom.objects.bulk_create([
+                ChatRoom(
+                    appointment_id=appointment.id,
+                    patient_id=appointment.patient.user_id,
+                    doctor_id=doctor.user_id,
+                )
+                for appointment in accepted
+            ], ignore_conflicts=True)
+
+    return [results[appointment_id] for appointment_id in ids]
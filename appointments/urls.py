@@ -5,9 +5,11 @@ urlpatterns = [
     path('', views.AppointmentListCreateView.as_view(), name='appointment-list-create'),
     path('<int:pk>/', views.AppointmentDetailView.as_view(), name='appointment-detail'),
     path('<int:pk>/status/', views.UpdateAppointmentStatusView.as_view(), name='appointment-status'),
+    path('bulk-status/', views.BulkAppointmentStatusView.as_view(), name='appointment-bulk-status'),
     path('doctor/', views.DoctorAppointmentsView.as_view(), name='doctor-appointments'),
     path('patient/', views.PatientAppointmentsView.as_view(), name='patient-appointments'),
     path('stats/', views.AppointmentStatsView.as_view(), name='appointment-stats'),
+    path('stats/timeseries/', views.AppointmentTimeseriesView.as_view(), name='appointment-timeseries'),
     
     # Reviews
     path('reviews/', views.ReviewListCreateView.as_view(), name='review-list-create'),
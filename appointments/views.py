@@ -3,18 +3,25 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from django.db import models
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
 from .models import Appointment, Review
+from doctors.models import Doctor
+from .pagination import AppointmentCursorPagination, ReviewCursorPagination
+from .rollups import GRANULARITIES, appointment_timeseries
 from .serializers import (
     AppointmentSerializer, AppointmentCreateSerializer, 
     AppointmentListSerializer, AppointmentUpdateSerializer,
-    ReviewSerializer, ReviewCreateSerializer
+    BulkStatusSerializer, ReviewSerializer, ReviewCreateSerializer
 )
+from .transitions import apply_transitions
+from accounts.identity import get_identity
 from accounts.permissions import (
     IsAdminUser, IsPatient, IsDoctor, IsDoctorOrAdmin, 
     IsAppointmentParticipant, IsPatientOrAdmin
 )
+from healthcare_backend.stats import get_stats, wants_fresh_stats
 
 class AppointmentListCreateView(generics.ListCreateAPIView):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -22,16 +29,19 @@ class AppointmentListCreateView(generics.ListCreateAPIView):
     search_fields = ['patient__user__first_name', 'patient__user__last_name', 
                     'doctor__user__first_name', 'doctor__user__last_name']
     ordering_fields = ['appointment_date', 'created_at']
-    ordering = ['-appointment_date']
+    ordering = ['-appointment_date', '-id']
+    pagination_class = AppointmentCursorPagination
+    query_budget = {'GET': 4}
     
     def get_queryset(self):
         user = self.request.user
+        appointments = Appointment.objects.select_related('patient__user', 'doctor__user')
         if user.role == 'admin':
-            return Appointment.objects.all()
+            return appointments
         elif user.role == 'patient':
-            return Appointment.objects.filter(patient__user=user)
+            return appointments.filter(patient__user=user)
         elif user.role == 'doctor':
-            return Appointment.objects.filter(doctor__user=user)
+            return appointments.filter(doctor__user=user)
         else:
             return Appointment.objects.none()
     
@@ -49,9 +59,15 @@ class AppointmentListCreateView(generics.ListCreateAPIView):
 
 
 class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Appointment.objects.all()
+    queryset = Appointment.objects.select_related('patient__user', 'doctor__user')
     permission_classes = [IsAppointmentParticipant]
     
+    def get_object(self):
+        # update() checks the appointment before UpdateModelMixin fetches it again
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+    
     def get_serializer_class(self):
         if self.request.method in ['PUT', 'PATCH']:
             return AppointmentUpdateSerializer
@@ -69,7 +85,7 @@ class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
             )
         
         # Only the assigned doctor can update the appointment
-        if user.role == 'doctor' and appointment.doctor.user != user:
+        if user.role == 'doctor' and appointment.doctor_id != get_identity(request).doctor_id:
             return Response(
                 {'error': 'You can only update your own appointments'}, 
                 status=status.HTTP_403_FORBIDDEN
@@ -84,10 +100,12 @@ class DoctorAppointmentsView(generics.ListAPIView):
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status', 'appointment_type']
     ordering_fields = ['appointment_date', 'created_at']
-    ordering = ['appointment_date']
+    ordering = ['appointment_date', 'id']
+    pagination_class = AppointmentCursorPagination
+    query_budget = 4
     
     def get_queryset(self):
-        return Appointment.objects.filter(doctor__user=self.request.user)
+        return Appointment.objects.filter(doctor__user=self.request.user).select_related('patient__user', 'doctor__user')
 
 
 class PatientAppointmentsView(generics.ListAPIView):
@@ -96,34 +114,66 @@ class PatientAppointmentsView(generics.ListAPIView):
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['status', 'appointment_type']
     ordering_fields = ['appointment_date', 'created_at']
-    ordering = ['-appointment_date']
+    ordering = ['-appointment_date', '-id']
+    pagination_class = AppointmentCursorPagination
+    query_budget = 4
     
     def get_queryset(self):
-        return Appointment.objects.filter(patient__user=self.request.user)
+        return Appointment.objects.filter(patient__user=self.request.user).select_related('patient__user', 'doctor__user')
 
 
 class AppointmentStatsView(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        total_appointments = Appointment.objects.count()
-        by_status = Appointment.objects.values('status').annotate(
-            count=models.Count('status')
-        )
-        by_type = Appointment.objects.values('appointment_type').annotate(
-            count=models.Count('appointment_type')
-        )
-        today_appointments = Appointment.objects.filter(
-            appointment_date__date=timezone.now().date()
-        ).count()
+        return Response(get_stats(fresh=wants_fresh_stats(request))['appointments'])
+
+
+class AppointmentTimeseriesView(APIView):
+    """Appointment counts over time from the daily rollups, e.g. ?from=2025-01-01&to=2025-12-31&granularity=month"""
+    query_budget = 3
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in GRANULARITIES:
+            return Response(
+                {'error': f"granularity must be one of: {', '.join(GRANULARITIES)}"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            date_to = parse_date(request.query_params.get('to') or timezone.localdate().isoformat())
+            date_from = (parse_date(request.query_params['from']) if request.query_params.get('from')
+                         else date_to and date_to - timedelta(days=29))
+        except ValueError:
+            date_from = date_to = None
+        if date_from is None or date_to is None:
+            return Response(
+                {'error': 'Dates must use the YYYY-MM-DD format'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if date_to < date_from:
+            return Response(
+                {'error': '"from" must not be after "to"'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        stats = {
-            'total_appointments': total_appointments,
-            'today_appointments': today_appointments,
-            'by_status': list(by_status),
-            'by_type': list(by_type),
-        }
-        return Response(stats)
+        doctor_id = request.query_params.get('doctor')
+        if doctor_id is not None and not doctor_id.isdigit():
+            return Response(
+                {'error': 'doctor must be a doctor id'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat(),
+            'granularity': granularity,
+            'series': appointment_timeseries(
+                date_from, date_to, granularity, int(doctor_id) if doctor_id else None
+            ),
+        })
 
 
 # Review Views
@@ -131,18 +181,19 @@ class ReviewListCreateView(generics.ListCreateAPIView):
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['rating', 'doctor__specialization']
     ordering_fields = ['created_at', 'rating']
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+    pagination_class = ReviewCursorPagination
+    query_budget = {'GET': 4}
     
     def get_queryset(self):
         user = self.request.user
-        if user.role == 'admin':
-            return Review.objects.all()
-        elif user.role == 'patient':
-            return Review.objects.filter(patient__user=user)
+        reviews = Review.objects.select_related('patient__user', 'doctor__user')
+        if user.role == 'patient':
+            return reviews.filter(patient__user=user)
         elif user.role == 'doctor':
-            return Review.objects.filter(doctor__user=user)
+            return reviews.filter(doctor__user=user)
         else:
-            return Review.objects.all()  # Public reviews for general users
+            return reviews  # Admins, and public reviews for general users
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -163,10 +214,11 @@ class DoctorReviewsView(generics.ListAPIView):
     filter_backends = [filters.OrderingFilter]
     ordering_fields = ['created_at', 'rating']
     ordering = ['-created_at']
+    query_budget = 3
     
     def get_queryset(self):
         doctor_id = self.kwargs.get('doctor_id')
-        return Review.objects.filter(doctor_id=doctor_id)
+        return Review.objects.filter(doctor_id=doctor_id).select_related('patient__user', 'doctor__user')
 
 
 class UpdateAppointmentStatusView(APIView):
@@ -189,8 +241,37 @@ class UpdateAppointmentStatusView(APIView):
             )
         
         appointment.status = new_status
+        update_fields = ['status', 'updated_at']
         if new_status == 'rejected':
             appointment.rejection_reason = request.data.get('rejection_reason', '')
-        appointment.save()
+            update_fields.append('rejection_reason')
+        appointment.save(update_fields=update_fields)
         
         return Response(AppointmentSerializer(appointment).data)
+
+
+class BulkAppointmentStatusView(APIView):
+    """
+    Apply many status changes at once:
+    ``{"transitions": [{"id": 1, "status": "accepted"}, {"id": 2, "status": "rejected", "rejection_reason": "..."}]}``.
+    Answers 200 with one result per transition; invalid ones do not stop the rest.
+    """
+    permission_classes = [IsDoctor]
+    query_budget = 12
+    
+    def post(self, request):
+        serializer = BulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        doctor = Doctor.objects.filter(user=request.user).only('id', 'user_id').first()
+        if doctor is None:
+            return Response(
+                {'error': 'Doctor profile not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        results = apply_transitions(doctor, serializer.validated_data['transitions'])
+        return Response({
+            'updated': sum(result['ok'] for result in results),
+            'results': results,
+        })
@@ -7,12 +7,18 @@ class ChatRoomAdmin(admin.ModelAdmin):
     list_filter = ('is_active', 'created_at')
     search_fields = ('patient__first_name', 'patient__last_name', 
                     'doctor__first_name', 'doctor__last_name')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('created_at', 'updated_at', 'patient_unread_count', 'patient_last_read_id',
+                      'doctor_unread_count', 'doctor_last_read_id')
     
     fieldsets = (
         ('Chat Room Details', {
             'fields': ('appointment', 'patient', 'doctor', 'is_active')
         }),
+        ('Read State', {
+            'fields': ('patient_unread_count', 'patient_last_read_id',
+                      'doctor_unread_count', 'doctor_last_read_id'),
+            'classes': ('collapse',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -22,8 +28,9 @@ class ChatRoomAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ('chat_room', 'sender', 'message_type', 'content_preview', 'is_read', 'timestamp')
-    list_filter = ('message_type', 'is_read', 'timestamp')
+    list_display = ('chat_room', 'sender', 'message_type', 'content_preview', 'read', 'timestamp')
+    list_filter = ('message_type', 'timestamp')
+    list_select_related = ('chat_room__appointment', 'chat_room__patient', 'chat_room__doctor', 'sender')
     search_fields = ('sender__first_name', 'sender__last_name', 'content')
     readonly_fields = ('timestamp',)
     
@@ -31,6 +38,11 @@ class MessageAdmin(admin.ModelAdmin):
         return obj.content[:50] + "..." if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Content Preview'
     
+    @admin.display(boolean=True, description='Read')
+    def read(self, obj):
+        # From the room's read watermarks; the legacy Message.is_read flag is no longer kept up to date
+        return obj.chat_room.is_message_read(obj)
+    
     fieldsets = (
         ('Message Details', {
             'fields': ('chat_room', 'sender', 'message_type', 'content')
@@ -40,7 +52,7 @@ class MessageAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
         ('Status', {
-            'fields': ('is_read', 'timestamp'),
+            'fields': ('timestamp',),
             'classes': ('collapse',)
         }),
     )
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""
+Chat attachment uploads and downloads.
+
+Uploads: SizeLimitUploadHandler stops reading a multipart body as soon as an
+attachment passes CHAT_ATTACHMENT_MAX_BYTES. Django streams large files to a
+temporary file in chunks, so nothing is held in memory in full.
+
+Downloads: serve_attachment streams a stored file in blocks, answers single
+HTTP Range requests with 206, and with CHAT_ATTACHMENT_OFFLOAD set hands the
+transfer to the web server instead ("x-accel-redirect" for nginx, with
+CHAT_ATTACHMENT_ACCEL_PREFIX mapped to MEDIA_ROOT, or "x-sendfile" for
+Apache/lighttpd).
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_etags
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def max_upload_bytes():
+    return getattr(settings, 'CHAT_ATTACHMENT_MAX_BYTES', 25 * 1024 * 1024)
+
+
+class SizeLimitUploadHandler(FileUploadHandler):
+    """Abort a multipart upload once a file exceeds the attachment limit."""
+
+    def __init__(self, request=None, limit=None):
+        super().__init__(request)
+        self.limit = limit if limit is not None else max_upload_bytes()
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limit:
+            self.exceeded = True
+            raise StopUpload(connection_reset=True)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def parse_byte_range(header, size):
+    """
+    (start, end) of a single ``bytes=`` range, inclusive, None to send the
+    whole file, or False when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Multiple or malformed ranges: the whole file is a valid answer
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        if last and int(last) < start:
+            # Not a valid range at all, so the header is ignored (RFC 9110, 14.1.1)
+            return None
+        if start >= size:
+            return False
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        if not int(last) or not size:
+            return False
+        start, end = max(size - int(last), 0), size - 1
+    return start, end
+
+
+def read_blocks(field_file, start, length):
+    with field_file.open('rb'):
+        field_file.seek(start)
+        while length > 0:
+            block = field_file.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def serve_attachment(request, field_file, as_attachment=True):
+    """Stream ``field_file`` to an authorized client."""
+    name = os.path.basename(field_file.name)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, name)
+    size = field_file.size
+    etag = '"%s"' % hashlib.md5(f'{field_file.name}:{size}'.encode()).hexdigest()
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    offload = getattr(settings, 'CHAT_ATTACHMENT_OFFLOAD', '')
+    if offload:
+        # The web server sends the file and handles Range itself
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            prefix = getattr(settings, 'CHAT_ATTACHMENT_ACCEL_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = quote(prefix.rstrip('/') + '/' + field_file.name)
+        else:
+            response['X-Sendfile'] = field_file.path
+        response['Content-Disposition'] = disposition
+        response['ETag'] = etag
+        return response
+
+    byte_range = None
+    if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+        byte_range = parse_byte_range(request.headers['Range'], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        response = FileResponse(field_file.open('rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_blocks(field_file, start, end - start + 1), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    response['ETag'] = etag
+    try:
+        response['Last-Modified'] = http_date(field_file.storage.get_modified_time(field_file.name).timestamp())
+    except (NotImplementedError, OSError):
+        pass
+    return response
@@ -0,0 +1,203 @@
+"""
+Write-behind message persistence for the WebSocket consumer.
+
+With CHAT_WRITE_BEHIND enabled, ChatConsumer hands new messages to the
+process-wide MessageBuffer. Each message gets a ``client_id`` straight
+away and is broadcast immediately. The buffer stores pending messages with
+one bulk_create (and one unread counter UPDATE per room) every
+CHAT_FLUSH_INTERVAL_MS milliseconds, or as soon as CHAT_FLUSH_BATCH_SIZE
+messages are waiting. Once stored, a ``chat_message_saved`` event tells the
+room the database id of each client_id.
+
+A batch that cannot be stored is kept for the next flush. Messages that
+failed CHAT_FLUSH_MAX_ATTEMPTS flushes are stored one at a time instead, and
+those that still fail are logged and dropped, so one bad row cannot hold
+the buffer up forever.
+
+Consumers flush on disconnect, and anything still pending at interpreter
+exit is written synchronously, so a graceful shutdown loses nothing.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import uuid
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from .models import ChatRoom, Message
+from .signals import messages_bulk_created
+from .unread import recipient_counter_fields
+
+logger = logging.getLogger(__name__)
+
+
+def persist_messages(messages):
+    """
+    Store unsaved messages and bump their rooms' unread counters in one
+    transaction. Messages whose (room, sender, client_id) is already stored
+    are skipped, so retried batches are not duplicated. Returns the saved
+    messages.
+    """
+    stored = set(Message.objects.filter(
+        client_id__in=[message.client_id for message in messages]
+    ).values_list('chat_room_id', 'sender_id', 'client_id'))
+    messages = [message for message in messages if message_key(message) not in stored]
+    if not messages:
+        return []
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create(messages)
+        except IntegrityError:
+            # A concurrent flush stored some of them; fall back to one by one
+            saved = []
+            for message in messages:
+                try:
+                    with transaction.atomic():
+                        message.save(force_insert=True)
+                    saved.append(message)
+                except IntegrityError:
+                    pass
+            messages = saved
+
+        unread = Counter()
+        for message in messages:
+            for field in recipient_counter_fields(message.chat_room, message.sender_id):
+                unread[message.chat_room_id, field] += 1
+        rooms = {}
+        for (room_id, field), count in unread.items():
+            rooms.setdefault(room_id, {})[field] = models.F(field) + count
+        for room_id, counters in rooms.items():
+            ChatRoom.objects.filter(pk=room_id).update(**counters)
+        if messages:
+            messages_bulk_created.send(sender=Message, messages=messages)
+    return messages
+
+
+def persist_each(messages):
+    """Store messages one at a time, logging and dropping those that still cannot be stored."""
+    saved = []
+    for message in messages:
+        try:
+            saved.extend(persist_messages([message]))
+        except Exception:
+            logger.exception('Dropping chat message %s of room %s, it could not be stored',
+                             message.client_id, message.chat_room_id)
+    return saved
+
+
+def message_key(message):
+    return message.chat_room_id, message.sender_id, message.client_id
+
+
+class MessageBuffer:
+    def __init__(self):
+        self.pending = []
+        self.flush_task = None
+        self.lock = None
+        # Guards ``pending`` between the event loop and the exit handler
+        self.pending_lock = threading.Lock()
+
+    @property
+    def interval(self):
+        return getattr(settings, 'CHAT_FLUSH_INTERVAL_MS', 20) / 1000
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'CHAT_FLUSH_BATCH_SIZE', 100)
+
+    @property
+    def max_attempts(self):
+        return getattr(settings, 'CHAT_FLUSH_MAX_ATTEMPTS', 5)
+
+    async def add(self, chat_room, sender, client_id=None, **fields):
+        """
+        Queue a new message and return it unsaved, with client_id and a
+        provisional timestamp set (the stored timestamp is taken at flush).
+        A client_id the sender already used for a pending message of the room
+        is a retried send: that message is returned and nothing is queued.
+        """
+        message = Message(
+            chat_room=chat_room, sender=sender, client_id=client_id or uuid.uuid4(),
+            timestamp=timezone.now(), **fields
+        )
+        with self.pending_lock:
+            if client_id is not None:
+                key = message_key(message)
+                for pending in self.pending:
+                    if message_key(pending) == key:
+                        return pending
+            self.pending.append(message)
+            full = len(self.pending) >= self.batch_size
+        if full:
+            try:
+                await self.flush()
+            except Exception:
+                # The batch stays pending and is retried by the next timed flush;
+                # the message was accepted, so the send itself does not fail
+                logger.exception('Could not store buffered chat messages')
+                full = False
+        if not full and (self.flush_task is None or self.flush_task.done()):
+            self.flush_task = asyncio.ensure_future(self.flush_later())
+        return message
+
+    async def flush_later(self):
+        await asyncio.sleep(self.interval)
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception('Could not store buffered chat messages')
+
+    async def flush(self):
+        """Store every pending message and announce their database ids."""
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            with self.pending_lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return
+            try:
+                saved = await database_sync_to_async(persist_messages)(batch)
+            except Exception:
+                # Keep the messages for the next flush, unless they failed too often
+                retry, exhausted = [], []
+                for message in batch:
+                    message.flush_attempts = getattr(message, 'flush_attempts', 0) + 1
+                    (exhausted if message.flush_attempts >= self.max_attempts else retry).append(message)
+                with self.pending_lock:
+                    self.pending[:0] = retry
+                if not exhausted:
+                    raise
+                saved = await database_sync_to_async(persist_each)(exhausted)
+
+        channel_layer = get_channel_layer()
+        for message in saved:
+            await channel_layer.group_send(f'chat_{message.chat_room_id}', {
+                'type': 'chat_message_saved',
+                'client_id': str(message.client_id),
+                'sender_id': message.sender_id,
+                'message_id': message.id,
+                'timestamp': message.timestamp.isoformat(),
+            })
+
+    def flush_sync(self):
+        """Store pending messages without an event loop, e.g. at interpreter exit."""
+        with self.pending_lock:
+            batch, self.pending = self.pending, []
+        if batch:
+            try:
+                persist_messages(batch)
+            except Exception:
+                persist_each(batch)
+
+
+message_buffer = MessageBuffer()
+atexit.register(message_buffer.flush_sync)
@@ -1,8 +1,19 @@
 import json
+import logging
+import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import ChatRoom, Message
+from .buffer import message_buffer
+from .membership import room_members
+from .receipts import read_positions
+from .models import ChatRoom
+from .unread import create_message, mark_room_read
+
+logger = logging.getLogger(__name__)
+
+PRESENCE_STATUSES = ('online', 'away', 'offline')
 
 User = get_user_model()
 
@@ -17,11 +28,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        # Check if user is participant in this chat room
-        is_participant = await self.is_chat_participant(user, self.chat_room_id)
-        if not is_participant:
+        # Check if user is participant in this chat room; the room is kept for the connection
+        self.chat_room = await self.get_chat_room(user, self.chat_room_id)
+        if self.chat_room is None:
             await self.close()
             return
+        self.patient_id = self.chat_room.patient_id
+        self.doctor_id = self.chat_room.doctor_id
+        # Highest message id known to exist in the room, bounds read_up_to positions
+        self.latest_message_id = 0
 
         # Join room group
         await self.channel_layer.group_add(
@@ -30,6 +45,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        await self.send_presence('online')
 
     async def disconnect(self, close_code):
         # Leave room group
@@ -37,6 +53,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        if getattr(self, 'chat_room', None) is None:
+            return
+        await self.send_presence('offline')
+        
+        try:
+            await read_positions.release(self.chat_room.pk, self.scope["user"].id)
+        except Exception:
+            logger.exception('Could not store chat read position on disconnect')
+        
+        # Store anything this connection sent that is still buffered
+        if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+            try:
+                await message_buffer.flush()
+            except Exception:
+                logger.exception('Could not store buffered chat messages on disconnect')
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
@@ -46,12 +77,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
             message = text_data_json['message']
             sender = self.scope["user"]
             
-            # Save message to database
-            message_obj = await self.save_message(
-                chat_room_id=self.chat_room_id,
-                sender=sender,
-                content=message
-            )
+            if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+                # Broadcast now; the id follows in a chat_message_saved event
+                message_obj = await message_buffer.add(
+                    self.chat_room,
+                    sender,
+                    client_id=self.parse_client_id(text_data_json.get('client_id')),
+                    content=message,
+                    message_type='text'
+                )
+            else:
+                # Save message to database
+                message_obj = await self.save_message(
+                    sender=sender,
+                    content=message
+                )
             
             # Send message to room group
             await self.channel_layer.group_send(
@@ -64,13 +104,60 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'sender_role': sender.role,
                     'timestamp': message_obj.timestamp.isoformat(),
                     'message_id': message_obj.id,
+                    'client_id': str(message_obj.client_id) if message_obj.client_id else None,
                 }
             )
         elif message_type == 'mark_read':
+            # Buffered messages must be stored before the read watermark moves past them
+            if getattr(settings, 'CHAT_WRITE_BEHIND', False):
+                await message_buffer.flush()
             # Mark messages as read
-            await self.mark_messages_read(self.chat_room_id, self.scope["user"])
+            await self.mark_messages_read(self.scope["user"])
+        elif message_type == 'typing':
+            await self.group_send_ephemeral('typing', is_typing=bool(text_data_json.get('is_typing', True)))
+        elif message_type == 'presence':
+            status = text_data_json.get('status')
+            if status in PRESENCE_STATUSES:
+                await self.send_presence(status)
+        elif message_type == 'read_up_to':
+            message_id = text_data_json.get('message_id')
+            if (isinstance(message_id, int) and not isinstance(message_id, bool) and message_id > 0
+                    and await self.is_stored_position(message_id)):
+                # Broadcast now, store the furthest position at most every few seconds
+                await self.group_send_ephemeral('read_up_to', message_id=message_id)
+                await read_positions.record(self.chat_room, self.scope["user"].id, message_id)
+
+    async def is_stored_position(self, message_id):
+        """Whether ``message_id`` is not past the room's latest stored message."""
+        if message_id > self.latest_message_id:
+            self.latest_message_id = await database_sync_to_async(self.chat_room.latest_message_id)()
+        return message_id <= self.latest_message_id
+
+    async def group_send_ephemeral(self, event_type, **fields):
+        """Fan an event out to the other connections in the room without touching the database."""
+        user = self.scope["user"]
+        await self.channel_layer.group_send(self.room_group_name, {
+            'type': 'ephemeral_event',
+            'event': event_type,
+            'user_id': user.id,
+            'user_name': user.full_name,
+            'sender_channel': self.channel_name,
+            **fields,
+        })
+
+    async def send_presence(self, status):
+        await self.group_send_ephemeral('presence', status=status)
+
+    async def ephemeral_event(self, event):
+        # Typing, presence and read receipts; the sender does not get its own event back
+        if event['sender_channel'] == self.channel_name:
+            return
+        payload = {key: value for key, value in event.items() if key not in ('type', 'event', 'sender_channel')}
+        await self.send(text_data=json.dumps({'type': event['event'], **payload}))
 
     async def chat_message(self, event):
+        if event['message_id']:
+            self.latest_message_id = max(self.latest_message_id, event['message_id'])
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
             'type': 'chat_message',
@@ -80,21 +167,49 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'sender_role': event['sender_role'],
             'timestamp': event['timestamp'],
             'message_id': event['message_id'],
+            'client_id': event.get('client_id'),
         }))
 
-    @database_sync_to_async
-    def is_chat_participant(self, user, chat_room_id):
+    async def chat_message_saved(self, event):
+        # Database id of a message that was broadcast before it was stored
+        self.latest_message_id = max(self.latest_message_id, event['message_id'])
+        await self.send(text_data=json.dumps({
+            'type': 'chat_message_saved',
+            'client_id': event['client_id'],
+            'sender_id': event.get('sender_id'),
+            'message_id': event['message_id'],
+            'timestamp': event['timestamp'],
+        }))
+
+    @staticmethod
+    def parse_client_id(value):
+        """Client supplied message id, so retried sends are stored once."""
         try:
-            chat_room = ChatRoom.objects.get(id=chat_room_id)
-            return user in [chat_room.patient, chat_room.doctor] or user.role == 'admin'
-        except ChatRoom.DoesNotExist:
-            return False
+            return uuid.UUID(str(value)) if value else None
+        except ValueError:
+            return None
+
+    @database_sync_to_async
+    def get_chat_room(self, user, chat_room_id):
+        """
+        The active chat room if ``user`` may join it, else None. Built from the
+        cached participant ids; it carries everything save_message and
+        mark_messages_read need, so later events do not look the room up.
+        """
+        if not str(chat_room_id).isdigit():
+            return None
+        participants = room_members.get(int(chat_room_id))
+        if participants is None:
+            return None
+        patient_id, doctor_id = participants
+        if user.id in (patient_id, doctor_id) or user.role == 'admin':
+            return ChatRoom(pk=int(chat_room_id), patient_id=patient_id, doctor_id=doctor_id)
+        return None
 
     @database_sync_to_async
-    def save_message(self, chat_room_id, sender, content):
-        chat_room = ChatRoom.objects.get(id=chat_room_id)
-        message = Message.objects.create(
-            chat_room=chat_room,
+    def save_message(self, sender, content):
+        message = create_message(
+            chat_room=self.chat_room,
             sender=sender,
             content=content,
             message_type='text'
@@ -102,9 +217,5 @@ class ChatConsumer(AsyncWebsocketConsumer):
         return message
 
     @database_sync_to_async
-    def mark_messages_read(self, chat_room_id, user):
-        chat_room = ChatRoom.objects.get(id=chat_room_id)
-        Message.objects.filter(
-            chat_room=chat_room,
-            is_read=False
-        ).exclude(sender=user).update(is_read=True)
+    def mark_messages_read(self, user):
+        mark_room_read(self.chat_room, user)
@@ -0,0 +1 @@
+# Management commands module
\ No newline at end of file
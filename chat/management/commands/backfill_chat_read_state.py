@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from chat.models import ChatRoom, Message
+from chat.unread import inconsistent_rooms, repair_unread_counts
+
+
+class Command(BaseCommand):
+    help = 'Initialize chat room read watermarks and unread counters from Message.is_read'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        def last_read_by(participant_field):
+            read_messages = Message.objects.filter(
+                chat_room=OuterRef('pk'),
+                is_read=True
+            ).exclude(sender_id=OuterRef(participant_field)).order_by('-id')
+            return Coalesce(Subquery(read_messages.values('id')[:1]), Value(0))
+
+        with transaction.atomic():
+            rooms = ChatRoom.objects.update(
+                patient_last_read_id=last_read_by('patient_id'),
+                doctor_last_read_id=last_read_by('doctor_id'),
+            )
+            repaired = repair_unread_counts(inconsistent_rooms(), options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled read state of {rooms} chat rooms ({repaired} unread counters updated)'
+        ))
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import statistics
+import time
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from chat.buffer import message_buffer
+from chat.models import ChatRoom
+from chat.routing import websocket_urlpatterns
+from frontend.management.commands.run_benchmark import percentile
+from healthcare_backend.metrics import RequestMetrics
+
+
+class Command(BaseCommand):
+    help = ('Open many simulated ChatConsumer connections across chat rooms, send messages '
+            'through them and report messages/sec, fan-out latency percentiles and SQL queries '
+            'per message. Run with DJANGO_SETTINGS_MODULE=healthcare_backend.settings_benchmark '
+            'or CHANNEL_LAYER=memory to test without Redis')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=100)
+        parser.add_argument('--connections-per-room', type=int, default=10,
+                            help='Connections per room, alternating between patient and doctor')
+        parser.add_argument('--messages', type=int, default=20, help='Messages sent in each room')
+        parser.add_argument('--write-behind', action='store_true',
+                            help='Enable CHAT_WRITE_BEHIND for the run')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='Seconds to wait for every message to be delivered')
+        parser.add_argument('--output', help='Also write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['connections_per_room'] < 2:
+            raise CommandError('--connections-per-room must be at least 2')
+        rooms = self.get_rooms(options['rooms'])
+        with override_settings(CHAT_WRITE_BEHIND=options['write_behind'] or settings.CHAT_WRITE_BEHIND):
+            results = asyncio.run(self.run(rooms, options))
+
+        self.stdout.write(
+            f"{results['connections']} connections in {results['rooms']} rooms, "
+            f"connected in {results['connect_seconds']:.2f}s\n"
+            f"{results['messages']} messages, {results['deliveries']} deliveries "
+            f"in {results['send_seconds']:.2f}s\n"
+            f"{results['messages_per_second']:.1f} messages/s, "
+            f"{results['deliveries_per_second']:.1f} deliveries/s\n"
+            f"fan-out latency p50 {results['latency_p50_ms']:.2f} ms, "
+            f"p95 {results['latency_p95_ms']:.2f} ms, p99 {results['latency_p99_ms']:.2f} ms\n"
+            f"{results['queries_per_message']:.2f} SQL queries per message"
+        )
+        if results['lost']:
+            self.stdout.write(self.style.WARNING(f"{results['lost']} deliveries missing after the timeout"))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def get_rooms(self, count):
+        """Active chat rooms with their participants, seeding benchmark data if there are too few."""
+        def active_rooms():
+            return list(ChatRoom.objects.filter(is_active=True).select_related(
+                'patient', 'doctor'
+            ).order_by('id')[:count])
+
+        rooms = active_rooms()
+        if len(rooms) < count:
+            self.stdout.write(f'Seeding chat rooms for {count - len(rooms)} more rooms')
+            call_command(
+                'seed_benchmark', doctors=max(count // 20, 1), patients=max(count // 2, 1),
+                appointments=(count - len(rooms)) * 2, messages_per_room=0, verbosity=0
+            )
+            rooms = active_rooms()
+        if len(rooms) < count:
+            raise CommandError(f'Only {len(rooms)} active chat rooms are available')
+        return rooms
+
+    async def run(self, rooms, options):
+        application = URLRouter(websocket_urlpatterns)
+        per_room = options['connections_per_room']
+        loop = asyncio.get_running_loop()
+
+        # Consumers run their queries on the database thread; count them there
+        metrics = RequestMetrics()
+        await database_sync_to_async(lambda: connection.execute_wrappers.append(metrics))()
+
+        started = time.perf_counter()
+        clients = []
+        for room in rooms:
+            for i in range(per_room):
+                communicator = WebsocketCommunicator(application, f'/ws/chat/{room.id}/')
+                communicator.scope['user'] = room.doctor if i % 2 else room.patient
+                clients.append((room, communicator))
+        connected = await asyncio.gather(*[
+            communicator.connect(timeout=options['timeout']) for _, communicator in clients
+        ])
+        if not all(accepted for accepted, _ in connected):
+            raise CommandError('Some connections were rejected')
+        connect_seconds = time.perf_counter() - started
+
+        sent_at = {}
+        echoed = {}
+        latencies = []
+        expected = len(rooms) * options['messages'] * per_room
+        all_delivered = asyncio.Event()
+
+        async def listen(communicator):
+            while True:
+                event = json.loads(await communicator.receive_from(timeout=options['timeout']))
+                if event['type'] != 'chat_message':
+                    continue
+                latencies.append(loop.time() - sent_at[event['message']])
+                if event['sender_id'] == communicator.scope['user'].id:
+                    echoed[event['message']].set()
+                if len(latencies) == expected:
+                    all_delivered.set()
+
+        async def send(room, communicator):
+            # Each room has one message in flight: the next is sent once the sender sees its echo
+            for seq in range(options['messages']):
+                text = f'load test {room.id}-{seq}'
+                echoed[text] = asyncio.Event()
+                sent_at[text] = loop.time()
+                await communicator.send_to(text_data=json.dumps({'type': 'chat_message', 'message': text}))
+                await asyncio.wait_for(echoed[text].wait(), options['timeout'])
+
+        # Presence events of the connection burst are not counted
+        queries_before = metrics.queries
+        listeners = [asyncio.ensure_future(listen(communicator)) for _, communicator in clients]
+        senders = {}
+        for room, communicator in clients:
+            senders.setdefault(room.id, (room, communicator))
+
+        started = time.perf_counter()
+        await asyncio.gather(*[send(room, communicator) for room, communicator in senders.values()])
+        try:
+            await asyncio.wait_for(all_delivered.wait(), options['timeout'])
+        except asyncio.TimeoutError:
+            pass
+        if settings.CHAT_WRITE_BEHIND:
+            await message_buffer.flush()
+        send_seconds = time.perf_counter() - started
+        queries = metrics.queries - queries_before
+
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        await asyncio.gather(*[communicator.disconnect() for _, communicator in clients])
+        await database_sync_to_async(lambda: connection.execute_wrappers.remove(metrics))()
+
+        messages = len(rooms) * options['messages']
+        samples = [latency * 1000 for latency in latencies] or [0]
+        return {
+            'generated_at': timezone.now().isoformat(),
+            'channel_layer': settings.CHANNEL_LAYERS['default']['BACKEND'],
+            'database': connection.vendor,
+            'write_behind': settings.CHAT_WRITE_BEHIND,
+            'rooms': len(rooms),
+            'connections': len(clients),
+            'messages': messages,
+            'deliveries': len(latencies),
+            'lost': expected - len(latencies),
+            'connect_seconds': round(connect_seconds, 3),
+            'send_seconds': round(send_seconds, 3),
+            'messages_per_second': round(messages / send_seconds, 1),
+            'deliveries_per_second': round(len(latencies) / send_seconds, 1),
+            'latency_p50_ms': round(statistics.median(samples), 2),
+            'latency_p95_ms': round(percentile(samples, 0.95), 2),
+            'latency_p99_ms': round(percentile(samples, 0.99), 2),
+            'queries_per_message': round(queries / messages, 2),
+        }
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from chat.unread import inconsistent_rooms, repair_unread_counts
+
+
+class Command(BaseCommand):
+    help = 'Verify chat room unread counters against the message table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite inconsistent counters')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rooms = list(inconsistent_rooms())
+        for chat_room in rooms:
+            self.stdout.write(
+                f'Chat room {chat_room.pk}: '
+                f'patient {chat_room.patient_unread_count} (expected {chat_room.expected_patient_unread}), '
+                f'doctor {chat_room.doctor_unread_count} (expected {chat_room.expected_doctor_unread})'
+            )
+
+        if not rooms:
+            self.stdout.write(self.style.SUCCESS('All chat room unread counters are consistent'))
+        elif options['fix']:
+            repaired = repair_unread_counts(rooms, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} chat rooms'))
+        else:
+            raise CommandError(f'{len(rooms)} chat rooms have inconsistent unread counters')
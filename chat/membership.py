@@ -0,0 +1,63 @@
+"""
+Process-wide cache of chat room participants for the WebSocket consumer.
+
+Maps an active room id to its (patient_id, doctor_id) so connecting to a
+room normally needs no query. Entries are dropped when a room is saved or
+deleted in this process (see chat.signals) and expire after
+CHAT_MEMBERSHIP_CACHE_TTL seconds, which bounds how long other worker
+processes can serve a deactivated room.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import ChatRoom
+
+
+class RoomMembershipCache:
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_limits(self):
+        maxsize = self.maxsize or getattr(settings, 'CHAT_MEMBERSHIP_CACHE_SIZE', 10000)
+        ttl = self.ttl or getattr(settings, 'CHAT_MEMBERSHIP_CACHE_TTL', 300)
+        return maxsize, ttl
+
+    def get(self, room_id):
+        """(patient_id, doctor_id) of an active room, or None if it does not exist or is inactive."""
+        maxsize, ttl = self.get_limits()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(room_id)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(room_id)
+                return entry[0]
+
+        participants = ChatRoom.objects.filter(
+            pk=room_id, is_active=True
+        ).values_list('patient_id', 'doctor_id').first()
+        if participants is None:
+            return None
+
+        with self.lock:
+            self.entries[room_id] = (participants, now + ttl)
+            self.entries.move_to_end(room_id)
+            while len(self.entries) > maxsize:
+                self.entries.popitem(last=False)
+        return participants
+
+    def discard(self, room_id):
+        with self.lock:
+            self.entries.pop(room_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+room_members = RoomMembershipCache()
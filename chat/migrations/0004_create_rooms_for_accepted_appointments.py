@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_missing_rooms(apps, schema_editor):
+    """Chat rooms used to be created lazily by the chat page; create them for existing accepted appointments."""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    
+    appointments = Appointment.objects.filter(
+        status='accepted',
+        chat_room__isnull=True
+    ).select_related('patient', 'doctor')
+    ChatRoom.objects.bulk_create([
+        ChatRoom(
+            appointment=appointment,
+            patient_id=appointment.patient.user_id,
+            doctor_id=appointment.doctor.user_id,
+            is_active=True
+        )
+        for appointment in appointments
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_alter_chatroom_unique_together'),
+        ('appointments', '0003_appointment_appointment_doctor_date_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_rooms, migrations.RunPython.noop),
+    ]
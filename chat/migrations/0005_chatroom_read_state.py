@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_create_rooms_for_accepted_appointments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='doctor_last_read_id',
+            field=models.PositiveBigIntegerField(default=0, help_text='Last message id the doctor has read'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='doctor_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='patient_last_read_id',
+            field=models.PositiveBigIntegerField(default=0, help_text='Last message id the patient has read'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='patient_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='is_read',
+            field=models.BooleanField(default=False, help_text='Legacy flag; read state is tracked on the chat room'),
+        ),
+    ]
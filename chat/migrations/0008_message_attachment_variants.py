@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_message_client_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='file_attachment_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='image_attachment_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_chatroom_participant_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='client_id',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, help_text='Id assigned before the message is stored by the WebSocket consumer', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('chat_room', 'sender', 'client_id'), name='message_client_id_unique'),
+        ),
+    ]
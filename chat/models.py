@@ -2,6 +2,50 @@ from django.db import models
 from accounts.models import User
 from appointments.models import Appointment
 
+class ChatRoomQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """
+        Rooms ``user`` takes part in. Patients and doctors only ever sit in
+        the column of their role, so they are filtered on that column alone
+        and the conversation list can use its participant index.
+        """
+        if user.role == 'patient':
+            return self.filter(patient=user)
+        if user.role == 'doctor':
+            return self.filter(doctor=user)
+        return self.filter(models.Q(patient=user) | models.Q(doctor=user))
+    
+    def with_summary(self, user):
+        """
+        Annotate each room with its latest message and the number of messages
+        ``user`` has not read yet, so a whole conversation list is one query.
+        The unread count comes from the room's denormalized counters.
+        """
+        latest = Message.objects.filter(chat_room=models.OuterRef('pk')).order_by('-timestamp', '-id')
+        return self.select_related('patient', 'doctor', 'appointment').annotate(
+            last_message_id=models.Subquery(latest.values('id')[:1]),
+            last_message_sender_id=models.Subquery(latest.values('sender_id')[:1]),
+            last_message_type=models.Subquery(latest.values('message_type')[:1]),
+            last_message_content=models.Subquery(latest.values('content')[:1]),
+            last_message_timestamp=models.Subquery(latest.values('timestamp')[:1]),
+            unread_count=models.Case(
+                models.When(patient_id=user.id, then=models.F('patient_unread_count')),
+                models.When(doctor_id=user.id, then=models.F('doctor_unread_count')),
+                default=models.Value(0),
+            ),
+        )
+    
+    def get_or_create_for_appointment(self, appointment):
+        return self.get_or_create(
+            appointment=appointment,
+            defaults={
+                'patient': appointment.patient.user,
+                'doctor': appointment.doctor.user,
+                'is_active': True
+            }
+        )
+
+
 class ChatRoom(models.Model):
     appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE, related_name='chat_room')
     patient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='patient_chats')
@@ -10,8 +54,53 @@ class ChatRoom(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Per-participant read state, maintained by chat.unread
+    patient_last_read_id = models.PositiveBigIntegerField(default=0, help_text="Last message id the patient has read")
+    doctor_last_read_id = models.PositiveBigIntegerField(default=0, help_text="Last message id the doctor has read")
+    patient_unread_count = models.PositiveIntegerField(default=0)
+    doctor_unread_count = models.PositiveIntegerField(default=0)
+    
+    objects = ChatRoomQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Conversation lists of a participant, most recently active first
+            models.Index(fields=['patient', '-updated_at'], name='chatroom_patient_updated_idx'),
+            models.Index(fields=['doctor', '-updated_at'], name='chatroom_doctor_updated_idx'),
+        ]
+    
     def __str__(self):
         return f"Chat: {self.patient.full_name} <-> Dr. {self.doctor.full_name} (Apt: {self.appointment.id})"
+    
+    def latest_message_id(self):
+        return self.messages.order_by('-id').values_list('id', flat=True).first() or 0
+    
+    def messages_etag(self, since, latest_message_id):
+        """
+        ETag of the messages after ``since``, with their read receipts. It
+        changes when a message is added or either participant reads further.
+        """
+        return f'"chat-{self.pk}-{since}-{latest_message_id}-{self.patient_last_read_id}-{self.doctor_last_read_id}"'
+    
+    def read_state_fields(self, user_id):
+        """Return the (unread count, last read id) field names tracking ``user_id``, or None."""
+        if user_id == self.patient_id:
+            return 'patient_unread_count', 'patient_last_read_id'
+        if user_id == self.doctor_id:
+            return 'doctor_unread_count', 'doctor_last_read_id'
+        return None
+    
+    def unread_count_for(self, user_id):
+        fields = self.read_state_fields(user_id)
+        return getattr(self, fields[0]) if fields else 0
+    
+    def is_message_read(self, message):
+        """Whether the participant(s) other than the sender have read ``message``."""
+        if message.sender_id == self.patient_id:
+            return message.id <= self.doctor_last_read_id
+        if message.sender_id == self.doctor_id:
+            return message.id <= self.patient_last_read_id
+        return message.id <= min(self.patient_last_read_id, self.doctor_last_read_id)
 
 
 class Message(models.Model):
@@ -27,11 +116,25 @@ class Message(models.Model):
     content = models.TextField(blank=True)
     file_attachment = models.FileField(upload_to='chat_files/', null=True, blank=True)
     image_attachment = models.ImageField(upload_to='chat_images/', null=True, blank=True)
-    is_read = models.BooleanField(default=False)
+    file_attachment_variants = models.JSONField(default=dict, blank=True, editable=False)
+    image_attachment_variants = models.JSONField(default=dict, blank=True, editable=False)
+    is_read = models.BooleanField(default=False, help_text="Legacy flag; read state is tracked on the chat room")
+    client_id = models.UUIDField(null=True, blank=True, db_index=True, editable=False,
+                                 help_text="Id assigned before the message is stored by the WebSocket consumer")
     timestamp = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination over (timestamp, id) within a room
+            models.Index(fields=['chat_room', 'timestamp', 'id'], name='message_room_timestamp_idx'),
+            # Delta polling (id > since), "load older" (id < before) and latest message lookups
+            models.Index(fields=['chat_room', 'id'], name='message_room_id_idx'),
+        ]
+        constraints = [
+            # A retried send is stored once; client ids of other rooms and senders never clash
+            models.UniqueConstraint(fields=['chat_room', 'sender', 'client_id'], name='message_client_id_unique'),
+        ]
     
     def __str__(self):
         return f"{self.sender.full_name}: {self.content[:50]}..."
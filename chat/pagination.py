@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class MessageCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (timestamp, id), so deep pages cost the same as the
+    first one and the message table is never counted.
+
+    Messages are listed oldest first. With ``?history=1`` the list starts at
+    the newest message and each ``next`` page is older ("load older").
+    """
+    ordering = ('timestamp', 'id')
+    history_ordering = ('-timestamp', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('history'):
+            return self.history_ordering
+        return type(self).ordering
@@ -0,0 +1,88 @@
+"""
+Coalesced read positions for the WebSocket consumer.
+
+``read_up_to`` events are broadcast to the room straight away, but the
+database only needs the furthest position each participant has reached.
+ReadPositionBuffer keeps that position in memory and stores it at most
+once every CHAT_READ_FLUSH_SECONDS per participant, and when the
+participant disconnects.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .unread import mark_read_up_to
+
+logger = logging.getLogger(__name__)
+
+
+class ReadPositionBuffer:
+    def __init__(self):
+        # (room id, user id) -> [chat room, highest unsaved message id or None, last stored at]
+        self.positions = {}
+        self.tasks = {}
+        self.lock = threading.Lock()
+
+    @property
+    def interval(self):
+        return getattr(settings, 'CHAT_READ_FLUSH_SECONDS', 5)
+
+    async def record(self, chat_room, user_id, message_id):
+        """Remember that ``user_id`` has read ``chat_room`` up to ``message_id``."""
+        key = (chat_room.pk, user_id)
+        with self.lock:
+            entry = self.positions.setdefault(key, [chat_room, None, 0.0])
+            entry[1] = max(entry[1] or 0, message_id)
+            wait = entry[2] + self.interval - time.monotonic()
+        if wait <= 0:
+            await self.flush(chat_room.pk, user_id)
+        elif key not in self.tasks or self.tasks[key].done():
+            self.tasks[key] = asyncio.ensure_future(self.flush_later(key, wait))
+
+    async def flush_later(self, key, wait):
+        await asyncio.sleep(wait)
+        try:
+            await self.flush(*key)
+        except Exception:
+            logger.exception('Could not store chat read position')
+
+    async def flush(self, room_id, user_id):
+        """Store the pending read position of one participant, if any."""
+        position = self.take((room_id, user_id))
+        if position is not None:
+            await database_sync_to_async(mark_read_up_to)(*position)
+
+    async def release(self, room_id, user_id):
+        """Store and forget a participant's position when they disconnect."""
+        key = (room_id, user_id)
+        task = self.tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+        await self.flush(room_id, user_id)
+        with self.lock:
+            self.positions.pop(key, None)
+
+    def take(self, key):
+        with self.lock:
+            entry = self.positions.get(key)
+            if entry is None or entry[1] is None:
+                return None
+            chat_room, message_id, _ = entry
+            entry[1], entry[2] = None, time.monotonic()
+        return chat_room, key[1], message_id
+
+    def flush_sync(self):
+        """Store every pending position without an event loop, e.g. at interpreter exit."""
+        for key in list(self.positions):
+            position = self.take(key)
+            if position is not None:
+                mark_read_up_to(*position)
+
+
+read_positions = ReadPositionBuffer()
+atexit.register(read_positions.flush_sync)
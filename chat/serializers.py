@@ -1,24 +1,86 @@
+from urllib.parse import urlencode
+
+from django.db import transaction
+from django.urls import reverse
 from rest_framework import serializers
+from healthcare_backend.images import ImageVariantsField
 from .models import ChatRoom, Message
+from .unread import record_new_message
+
+
+def attachment_url(message, kind, **query):
+    """URL of MessageAttachmentView for a message's ``kind`` ('file' or 'image') attachment."""
+    url = reverse('message-attachment', kwargs={'chat_room_id': message.chat_room_id, 'pk': message.pk, 'kind': kind})
+    return f'{url}?{urlencode(query)}' if query else url
+
+
+class AttachmentURLMixin:
+    """
+    Represent an attachment by its download view, which checks the reader is
+    in the room, instead of its public /media URL.
+    """
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = attachment_url(value.instance, self.kind)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class FileAttachmentField(AttachmentURLMixin, serializers.FileField):
+    pass
+
+
+class ImageAttachmentField(AttachmentURLMixin, serializers.ImageField):
+    pass
+
+
+class AttachmentVariantsField(ImageVariantsField):
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        super().__init__(source=f'{kind}_attachment', variants_field=f'{kind}_attachment_variants', **kwargs)
+
+    def variant_url(self, value, variant, key, name):
+        return attachment_url(value.instance, self.kind, variant=variant, format=key)
+
 
 class MessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.full_name', read_only=True)
     sender_role = serializers.CharField(source='sender.role', read_only=True)
+    is_read = serializers.SerializerMethodField()
+    file_attachment = FileAttachmentField(kind='file', required=False, allow_null=True)
+    image_attachment = ImageAttachmentField(kind='image', required=False, allow_null=True)
+    file_attachment_variants = AttachmentVariantsField(kind='file')
+    image_attachment_variants = AttachmentVariantsField(kind='image')
     
     class Meta:
         model = Message
         fields = '__all__'
         read_only_fields = ('sender', 'timestamp')
+    
+    def get_is_read(self, obj):
+        return obj.chat_room.is_message_read(obj)
 
 
 class MessageCreateSerializer(serializers.ModelSerializer):
+    file_attachment = FileAttachmentField(kind='file', required=False, allow_null=True)
+    image_attachment = ImageAttachmentField(kind='image', required=False, allow_null=True)
+    
     class Meta:
         model = Message
-        fields = ('chat_room', 'message_type', 'content', 'file_attachment', 'image_attachment')
+        fields = ('id', 'chat_room', 'message_type', 'content', 'file_attachment', 'image_attachment')
+        read_only_fields = ('id', 'chat_room')
     
     def create(self, validated_data):
         validated_data['sender'] = self.context['request'].user
-        return super().create(validated_data)
+        with transaction.atomic():
+            message = super().create(validated_data)
+            record_new_message(message)
+        return message
 
 
 class ChatRoomSerializer(serializers.ModelSerializer):
@@ -30,17 +92,37 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = ChatRoom
-        fields = '__all__'
+        # Not the read state columns, which are each participant's own
+        fields = (
+            'id', 'appointment', 'appointment_id', 'patient', 'patient_name', 'doctor', 'doctor_name',
+            'is_active', 'created_at', 'updated_at', 'last_message', 'unread_count',
+        )
     
     def get_last_message(self, obj):
+        # Rooms loaded with ChatRoom.objects.with_summary() carry the last message as annotations
+        if hasattr(obj, 'last_message_id'):
+            if obj.last_message_id is None:
+                return None
+            sender = {obj.patient_id: obj.patient, obj.doctor_id: obj.doctor}.get(obj.last_message_sender_id)
+            return {
+                'id': obj.last_message_id,
+                'sender': obj.last_message_sender_id,
+                'sender_name': sender.full_name if sender else None,
+                'sender_role': sender.role if sender else None,
+                'message_type': obj.last_message_type,
+                'content': obj.last_message_content,
+                'timestamp': serializers.DateTimeField().to_representation(obj.last_message_timestamp),
+            }
+        
         last_message = obj.messages.last()
         if last_message:
             return MessageSerializer(last_message).data
         return None
     
     def get_unread_count(self, obj):
-        user = self.context['request'].user
-        return obj.messages.filter(is_read=False).exclude(sender=user).count()
+        if hasattr(obj, 'unread_count'):
+            return obj.unread_count
+        return obj.unread_count_for(self.context['request'].user.id)
 
 
 class ChatRoomCreateSerializer(serializers.ModelSerializer):
@@ -0,0 +1,34 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+from appointments.models import Appointment
+from healthcare_backend.images import needs_variants
+from .membership import room_members
+from .models import ChatRoom, Message
+from .tasks import render_attachment_variants
+
+# Sent with ``messages`` after chat.buffer stores them with bulk_create,
+# which skips post_save
+messages_bulk_created = Signal()
+
+
+@receiver(post_save, sender=Appointment)
+def create_chat_room_on_accept(sender, instance, **kwargs):
+    """Open the chat room as soon as an appointment is accepted."""
+    if instance.status == 'accepted':
+        ChatRoom.objects.get_or_create_for_appointment(instance)
+
+
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def forget_room_members(sender, instance, **kwargs):
+    """Drop cached participants when a room is changed, deactivated or deleted."""
+    room_members.discard(instance.pk)
+
+
+@receiver(post_save, sender=Message)
+def queue_attachment_variants(sender, instance, **kwargs):
+    """Render resized copies of uploaded attachments after commit."""
+    if (needs_variants(instance.image_attachment, instance.image_attachment_variants)
+            or needs_variants(instance.file_attachment, instance.file_attachment_variants)):
+        transaction.on_commit(lambda: render_attachment_variants.delay(instance.pk))
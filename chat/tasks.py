@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from healthcare_backend.images import refresh_variants
+from .models import Message
+
+# Chat images keep their aspect ratio: thumb inline in the conversation, large when opened
+IMAGE_ATTACHMENT_SIZES = {
+    'thumb': (320, 320, False),
+    'large': (1280, 1280, False),
+}
+# Files that turn out to be images get a preview
+FILE_ATTACHMENT_SIZES = {
+    'thumb': (320, 320, False),
+}
+
+
+@shared_task
+def render_attachment_variants(message_id):
+    message = Message.objects.filter(pk=message_id).first()
+    if message is None:
+        return
+    refresh_variants(message, 'image_attachment', 'image_attachment_variants', IMAGE_ATTACHMENT_SIZES)
+    refresh_variants(message, 'file_attachment', 'file_attachment_variants', FILE_ATTACHMENT_SIZES)
@@ -0,0 +1,475 @@
+"""
+Chat read state, read receipts and message persistence.
+"""
+import asyncio
+import json
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from appointments.models import Appointment
+from doctors.models import Doctor
+from patients.models import Patient
+from .attachments import parse_byte_range
+from .buffer import MessageBuffer, persist_messages
+from .membership import RoomMembershipCache, room_members
+from .models import ChatRoom, Message
+from .routing import websocket_urlpatterns
+from .unread import create_message, mark_read_up_to, mark_room_read
+
+
+def create_chat_room(suffix=''):
+    """An active chat room between a new doctor and a new patient."""
+    doctor_user = User.objects.create_user(
+        email=f'doctor{suffix}@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+    )
+    patient_user = User.objects.create_user(
+        email=f'patient{suffix}@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+    )
+    appointment = Appointment.objects.create(
+        patient=Patient.objects.create(user=patient_user),
+        doctor=Doctor.objects.create(user=doctor_user, specialization='cardiology'),
+        appointment_date=timezone.now() + timedelta(days=1), reason_for_visit='Checkup', status='accepted'
+    )
+    return ChatRoom.objects.get(appointment=appointment)
+
+
+class ChatRoomTests(TestCase):
+    def setUp(self):
+        self.chat_room = create_chat_room()
+        self.other_room = create_chat_room('-2')
+        self.patient, self.doctor = self.chat_room.patient, self.chat_room.doctor
+
+    def test_accepting_an_appointment_opens_its_room(self):
+        appointment = Appointment.objects.create(
+            patient=self.patient.patient_profile, doctor=self.doctor.doctor_profile,
+            appointment_date=timezone.now() + timedelta(days=2), reason_for_visit='Follow-up'
+        )
+        self.assertFalse(ChatRoom.objects.filter(appointment=appointment).exists())
+
+        appointment.status = 'accepted'
+        appointment.save()
+        appointment.save()
+        chat_room = ChatRoom.objects.get(appointment=appointment)
+        self.assertEqual((chat_room.patient, chat_room.doctor, chat_room.is_active), (self.patient, self.doctor, True))
+
+    def test_for_user(self):
+        admin = User.objects.create_user(email='admin@example.com', password='password', role='admin')
+        self.assertEqual(list(ChatRoom.objects.for_user(self.patient)), [self.chat_room])
+        self.assertEqual(list(ChatRoom.objects.for_user(self.doctor)), [self.chat_room])
+        self.assertEqual(list(ChatRoom.objects.for_user(self.other_room.doctor)), [self.other_room])
+        self.assertEqual(list(ChatRoom.objects.for_user(admin)), [])
+
+    def test_with_summary(self):
+        create_message(self.chat_room, self.doctor, content='Hello')
+        latest = create_message(self.chat_room, self.doctor, content='How are you?')
+
+        with self.assertNumQueries(1):
+            rooms = {room.pk: room for room in ChatRoom.objects.with_summary(self.patient)}
+            chat_room, other_room = rooms[self.chat_room.pk], rooms[self.other_room.pk]
+            self.assertEqual(chat_room.patient, self.patient)
+        self.assertEqual((chat_room.last_message_id, chat_room.last_message_content), (latest.id, 'How are you?'))
+        self.assertEqual(chat_room.last_message_sender_id, self.doctor.id)
+        self.assertEqual(chat_room.unread_count, 2)
+        self.assertEqual(ChatRoom.objects.with_summary(self.doctor).get(pk=self.chat_room.pk).unread_count, 0)
+        self.assertIsNone(other_room.last_message_id)
+        self.assertEqual(other_room.unread_count, 0)
+
+    def test_room_list_leaves_out_the_read_state(self):
+        create_message(self.chat_room, self.doctor, content='Hello')
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        room = client.get(reverse('chatroom-list-create')).data['results'][0]
+        self.assertEqual(set(room), {
+            'id', 'appointment', 'appointment_id', 'patient', 'patient_name', 'doctor', 'doctor_name',
+            'is_active', 'created_at', 'updated_at', 'last_message', 'unread_count',
+        })
+        self.assertEqual(room['unread_count'], 1)
+        self.assertEqual(room['last_message']['content'], 'Hello')
+
+
+class RoomMembershipCacheTests(TestCase):
+    def setUp(self):
+        room_members.clear()
+        self.addCleanup(room_members.clear)
+        self.chat_room = create_chat_room()
+        self.participants = (self.chat_room.patient_id, self.chat_room.doctor_id)
+
+    def test_cached_rooms_need_no_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(room_members.get(self.chat_room.pk), self.participants)
+        with self.assertNumQueries(0):
+            self.assertEqual(room_members.get(self.chat_room.pk), self.participants)
+
+    def test_missing_and_inactive_rooms_are_not_cached(self):
+        self.chat_room.is_active = False
+        self.chat_room.save()
+        for room_id in (self.chat_room.pk, self.chat_room.pk + 1):
+            with self.assertNumQueries(1):
+                self.assertIsNone(room_members.get(room_id))
+        self.assertEqual(room_members.entries, {})
+
+    def test_deactivating_a_room_drops_it(self):
+        room_members.get(self.chat_room.pk)
+        self.chat_room.is_active = False
+        self.chat_room.save()
+        self.assertNotIn(self.chat_room.pk, room_members.entries)
+        self.assertIsNone(room_members.get(self.chat_room.pk))
+
+    def test_deleting_the_appointment_drops_its_room(self):
+        room_members.get(self.chat_room.pk)
+        self.chat_room.appointment.delete()
+        self.assertNotIn(self.chat_room.pk, room_members.entries)
+        self.assertIsNone(room_members.get(self.chat_room.pk))
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = RoomMembershipCache(ttl=10)
+        with mock.patch('chat.membership.time.monotonic', return_value=100):
+            cache.get(self.chat_room.pk)
+        with mock.patch('chat.membership.time.monotonic', return_value=109), self.assertNumQueries(0):
+            self.assertEqual(cache.get(self.chat_room.pk), self.participants)
+        with mock.patch('chat.membership.time.monotonic', return_value=110), self.assertNumQueries(1):
+            self.assertEqual(cache.get(self.chat_room.pk), self.participants)
+
+    def test_least_recently_used_rooms_are_evicted(self):
+        other_room = create_chat_room('-2')
+        cache = RoomMembershipCache(maxsize=1)
+        cache.get(self.chat_room.pk)
+        cache.get(other_room.pk)
+        self.assertEqual(list(cache.entries), [other_room.pk])
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.chat_room = create_chat_room()
+        self.patient, self.doctor = self.chat_room.patient, self.chat_room.doctor
+
+    def assertCounts(self, patient_unread, doctor_unread):
+        self.chat_room.refresh_from_db()
+        self.assertEqual((self.chat_room.patient_unread_count, self.chat_room.doctor_unread_count),
+                         (patient_unread, doctor_unread))
+
+    def test_new_messages_count_for_the_recipient(self):
+        create_message(self.chat_room, self.doctor, content='Hello')
+        create_message(self.chat_room, self.doctor, content='How are you?')
+        create_message(self.chat_room, self.patient, content='Fine')
+        self.assertCounts(2, 1)
+
+    def test_marking_a_room_read(self):
+        create_message(self.chat_room, self.patient, content='Hello')
+        latest = create_message(self.chat_room, self.doctor, content='Hi')
+        mark_room_read(self.chat_room, self.patient)
+        self.assertCounts(0, 1)
+        self.assertEqual(self.chat_room.patient_last_read_id, latest.id)
+        self.assertTrue(self.chat_room.is_message_read(latest))
+
+    def test_backfill_from_legacy_read_flags(self):
+        read = Message.objects.create(chat_room=self.chat_room, sender=self.doctor, content='Read', is_read=True)
+        Message.objects.create(chat_room=self.chat_room, sender=self.doctor, content='Unread')
+        Message.objects.create(chat_room=self.chat_room, sender=self.patient, content='Unread too')
+        call_command('backfill_chat_read_state', stdout=StringIO())
+        self.assertCounts(1, 1)
+        self.assertEqual((self.chat_room.patient_last_read_id, self.chat_room.doctor_last_read_id), (read.id, 0))
+
+    def test_check_and_repair(self):
+        create_message(self.chat_room, self.doctor, content='Hello')
+        call_command('check_chat_read_state', stdout=StringIO())
+
+        ChatRoom.objects.filter(pk=self.chat_room.pk).update(patient_unread_count=7, doctor_unread_count=3)
+        with self.assertRaises(CommandError):
+            call_command('check_chat_read_state', stdout=StringIO())
+        call_command('check_chat_read_state', '--fix', stdout=StringIO())
+        self.assertCounts(1, 0)
+        call_command('check_chat_read_state', stdout=StringIO())
+
+
+class ReadUpToTests(TestCase):
+    def setUp(self):
+        self.chat_room = create_chat_room()
+        self.messages = [
+            create_message(self.chat_room, self.chat_room.doctor, content=f'Message {i}') for i in range(3)
+        ]
+
+    def test_moves_the_watermark_and_recounts(self):
+        mark_read_up_to(self.chat_room, self.chat_room.patient_id, self.messages[1].id)
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.patient_last_read_id, self.messages[1].id)
+        self.assertEqual(self.chat_room.patient_unread_count, 1)
+
+    def test_positions_past_the_latest_message_are_clamped(self):
+        mark_read_up_to(self.chat_room, self.chat_room.patient_id, 2 ** 31)
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.patient_last_read_id, self.messages[-1].id)
+
+        later = create_message(self.chat_room, self.chat_room.doctor, content='Later')
+        self.chat_room.refresh_from_db()
+        self.assertFalse(self.chat_room.is_message_read(later))
+        self.assertEqual(self.chat_room.patient_unread_count, 1)
+
+
+class ReadUpToConsumerTests(TransactionTestCase):
+    def setUp(self):
+        room_members.clear()
+        self.chat_room = create_chat_room()
+        self.patient, self.doctor = self.chat_room.patient, self.chat_room.doctor
+        self.message = create_message(self.chat_room, self.doctor, content='Hello')
+
+    def test_only_stored_positions_are_broadcast(self):
+        async def scenario():
+            application = URLRouter(websocket_urlpatterns)
+            reader = WebsocketCommunicator(application, f'/ws/chat/{self.chat_room.id}/')
+            reader.scope['user'] = self.patient
+            watcher = WebsocketCommunicator(application, f'/ws/chat/{self.chat_room.id}/')
+            watcher.scope['user'] = self.doctor
+            self.assertTrue((await reader.connect())[0])
+            self.assertTrue((await watcher.connect())[0])
+
+            await reader.send_to(text_data=json.dumps({'type': 'read_up_to', 'message_id': 2 ** 31}))
+            await reader.send_to(text_data=json.dumps({'type': 'read_up_to', 'message_id': self.message.id}))
+            receipt = json.loads(await watcher.receive_from())
+            nothing_else = await watcher.receive_nothing()
+            await reader.disconnect()
+            await watcher.disconnect()
+            return receipt, nothing_else
+
+        receipt, nothing_else = asyncio.run(scenario())
+        self.assertEqual((receipt['type'], receipt['message_id']), ('read_up_to', self.message.id))
+        self.assertTrue(nothing_else)
+
+
+class MessagePollingTests(TestCase):
+    def setUp(self):
+        self.chat_room = create_chat_room()
+        self.patient, self.doctor = self.chat_room.patient, self.chat_room.doctor
+        self.messages = [create_message(self.chat_room, self.doctor, content=f'Message {i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+        self.url = f'/api/chat/rooms/{self.chat_room.id}/messages/'
+
+    def poll(self, since, **headers):
+        return self.client.get(self.url, {'since': since, 'page_size': 2}, **headers)
+
+    def test_since_returns_at_most_a_page(self):
+        response = self.poll(0)
+        self.assertEqual([message['id'] for message in response.data['results']],
+                         [message.id for message in self.messages[:2]])
+        self.assertTrue(response.data['has_more'])
+        # No ETag until the client has caught up, so the follow-up poll is never answered 304
+        self.assertNotIn('ETag', response)
+
+        response = self.poll(self.messages[1].id)
+        self.assertEqual([message['id'] for message in response.data['results']], [self.messages[2].id])
+        self.assertFalse(response.data['has_more'])
+
+    def test_caught_up_clients_get_304(self):
+        etag = self.poll(self.messages[1].id)['ETag']
+        response = self.poll(self.messages[2].id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        create_message(self.chat_room, self.doctor, content='Another one')
+        response = self.poll(self.messages[2].id, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_read_receipts_change_the_etag(self):
+        own = create_message(self.chat_room, self.patient, content='Hello')
+        response = self.poll(self.messages[2].id)
+        self.assertFalse(response.data['results'][0]['is_read'])
+        etag = response['ETag']
+        self.assertEqual(self.poll(own.id, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        mark_room_read(self.chat_room, self.doctor)
+        self.assertEqual(self.poll(own.id, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertTrue(self.poll(self.messages[2].id).data['results'][0]['is_read'])
+
+    def test_invalid_since(self):
+        for since in ('abc', '-1', ''):
+            response = self.poll(since)
+            self.assertEqual(response.status_code, 400, since)
+
+    def test_non_participants_get_nothing(self):
+        outsider = User.objects.create_user(
+            email='outsider@example.com', password='password', first_name='Out', last_name='Sider'
+        )
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.poll(0).data, {'results': [], 'has_more': False})
+
+
+class ByteRangeTests(TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_byte_range('bytes=90-200', 100), (90, 99))
+
+    def test_open_ended_range(self):
+        self.assertEqual(parse_byte_range('bytes=40-', 100), (40, 99))
+
+    def test_suffix_range(self):
+        self.assertEqual(parse_byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_byte_range('bytes=-500', 100), (0, 99))
+
+    def test_unsatisfiable_ranges(self):
+        self.assertIs(parse_byte_range('bytes=100-', 100), False)
+        self.assertIs(parse_byte_range('bytes=100-200', 100), False)
+        self.assertIs(parse_byte_range('bytes=-0', 100), False)
+        self.assertIs(parse_byte_range('bytes=-10', 0), False)
+
+    def test_multiple_or_malformed_ranges_send_the_whole_file(self):
+        self.assertIsNone(parse_byte_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_byte_range('bytes=-', 100))
+        self.assertIsNone(parse_byte_range('items=0-1', 100))
+
+    def test_ranges_ending_before_they_start_send_the_whole_file(self):
+        self.assertIsNone(parse_byte_range('bytes=5-3', 100))
+        self.assertIsNone(parse_byte_range('bytes=150-10', 100))
+
+
+class AttachmentTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.chat_room = create_chat_room()
+        self.client = APIClient()
+        self.client.force_authenticate(self.chat_room.patient)
+        self.message = Message.objects.create(chat_room=self.chat_room, sender=self.chat_room.doctor, message_type='file')
+        self.message.file_attachment.save('report.txt', ContentFile(bytes(range(100))))
+        self.url = reverse('message-attachment', kwargs={
+            'chat_room_id': self.chat_room.id, 'pk': self.message.id, 'kind': 'file'
+        })
+
+    def test_messages_link_attachments_through_the_download_view(self):
+        self.message.file_attachment_variants = {
+            'source': self.message.file_attachment.name, 'thumb': {'jpeg': 'chat_files/thumb.jpg'}
+        }
+        self.message.save(update_fields=['file_attachment_variants'])
+        response = self.client.get(reverse('message-list-create', kwargs={'chat_room_id': self.chat_room.id}))
+        message = response.data['results'][0]
+        self.assertEqual(message['file_attachment'], f'http://testserver{self.url}')
+        self.assertIsNone(message['image_attachment'])
+        self.assertEqual(message['file_attachment_variants'],
+                         {'thumb': {'jpeg': f'http://testserver{self.url}?variant=thumb&format=jpeg'}})
+
+    def test_range_request(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 90-99/100')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(90, 100)))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=200-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_invalid_range_is_ignored(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-3')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Range', response)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+
+    def test_range_is_ignored_when_if_range_does_not_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+
+    @override_settings(CHAT_ATTACHMENT_MAX_BYTES=1024)
+    def test_oversized_uploads_are_refused(self):
+        url = reverse('message-list-create', kwargs={'chat_room_id': self.chat_room.id})
+        # Refused from Content-Length before the body is read, and by the upload handler while reading it
+        for size in (200 * 1024, 8 * 1024):
+            response = self.client.post(url, {
+                'message_type': 'file', 'file_attachment': SimpleUploadedFile('big.bin', b'x' * size),
+            }, format='multipart')
+            self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.chat_room.messages.count(), 1)
+
+
+class WriteBehindTests(TestCase):
+    def setUp(self):
+        self.chat_room = create_chat_room()
+        self.other_room = create_chat_room('-2')
+        self.patient, self.doctor = self.chat_room.patient, self.chat_room.doctor
+
+    def test_client_ids_are_scoped_to_room_and_sender(self):
+        client_id = uuid.uuid4()
+        messages = [
+            Message(chat_room=self.chat_room, sender=self.chat_room.patient, client_id=client_id, content='Hi'),
+            Message(chat_room=self.other_room, sender=self.other_room.patient, client_id=client_id, content='Hi'),
+        ]
+        self.assertEqual(len(persist_messages(messages)), 2)
+
+        retried = Message(chat_room=self.chat_room, sender=self.chat_room.patient, client_id=client_id, content='Hi')
+        self.assertEqual(persist_messages([retried]), [])
+        self.assertEqual(Message.objects.filter(client_id=client_id).count(), 2)
+        self.chat_room.refresh_from_db()
+        self.assertEqual(self.chat_room.doctor_unread_count, 1)
+
+    def test_retried_sends_are_queued_once(self):
+        buffer = MessageBuffer()
+        client_id = uuid.uuid4()
+
+        async def send_twice():
+            first = await buffer.add(self.chat_room, self.patient, client_id=client_id, content='Hi')
+            second = await buffer.add(self.chat_room, self.patient, client_id=client_id, content='Hi')
+            other = await buffer.add(self.chat_room, self.doctor, client_id=client_id, content='Hi')
+            return first, second, other
+
+        first, second, other = asyncio.run(send_twice())
+        self.assertIs(first, second)
+        self.assertEqual(buffer.pending, [first, other])
+
+    @override_settings(CHAT_FLUSH_BATCH_SIZE=2)
+    def test_a_failed_full_batch_flush_keeps_the_messages(self):
+        buffer = MessageBuffer()
+
+        async def send_batch():
+            first = await buffer.add(self.chat_room, self.patient, content='Hi')
+            second = await buffer.add(self.chat_room, self.patient, content='Still there?')
+            return [first, second], buffer.flush_task is not None and not buffer.flush_task.done()
+
+        with mock.patch('chat.buffer.persist_messages', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('chat.buffer', 'ERROR'):
+                messages, retry_scheduled = asyncio.run(send_batch())
+        self.assertEqual(buffer.pending, messages)
+        self.assertTrue(retry_scheduled)
+
+        with mock.patch('chat.buffer.persist_messages', return_value=[]) as persist:
+            asyncio.run(buffer.flush())
+        persist.assert_called_once_with(messages)
+        self.assertEqual(buffer.pending, [])
+
+    @override_settings(CHAT_FLUSH_MAX_ATTEMPTS=3)
+    def test_failing_messages_are_dropped_after_max_attempts(self):
+        buffer = MessageBuffer()
+        buffer.pending = [Message(chat_room=self.chat_room, sender=self.chat_room.patient,
+                                  client_id=uuid.uuid4(), content='Hi')]
+
+        with mock.patch('chat.buffer.persist_messages', side_effect=OperationalError('database is locked')):
+            for _ in range(2):
+                with self.assertRaises(OperationalError):
+                    asyncio.run(buffer.flush())
+                self.assertEqual(len(buffer.pending), 1)
+            with self.assertLogs('chat.buffer', 'ERROR'):
+                asyncio.run(buffer.flush())
+        self.assertEqual(buffer.pending, [])
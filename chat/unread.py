@@ -0,0 +1,118 @@
+"""
+Per-participant read state of chat rooms.
+
+Each ChatRoom stores, for its patient and doctor, the id of the last message
+they have read and how many messages from the other side arrived after it.
+New messages bump the recipient's counter and marking a room as read is a
+single UPDATE of the room row, so neither depends on the size of the
+message table.
+"""
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, Least
+from .models import ChatRoom, Message
+
+
+def recipient_counter_fields(chat_room, sender_id):
+    """Unread counter fields that a message from ``sender_id`` increments."""
+    sender_fields = chat_room.read_state_fields(sender_id)
+    return [
+        fields[0]
+        for fields in (chat_room.read_state_fields(chat_room.patient_id),
+                       chat_room.read_state_fields(chat_room.doctor_id))
+        if fields != sender_fields
+    ]
+
+
+def record_new_message(message):
+    """Count ``message`` as unread for its recipients. Call in the transaction that created it."""
+    chat_room = message.chat_room
+    ChatRoom.objects.filter(pk=chat_room.pk).update(**{
+        field: models.F(field) + 1
+        for field in recipient_counter_fields(chat_room, message.sender_id)
+    })
+
+
+def create_message(chat_room, sender, **fields):
+    """Create a message and update the room's unread counters atomically."""
+    with transaction.atomic():
+        message = Message.objects.create(chat_room=chat_room, sender=sender, **fields)
+        record_new_message(message)
+    return message
+
+
+def mark_room_read(chat_room, user):
+    """Mark every message in ``chat_room`` as read by ``user`` with one UPDATE."""
+    fields = chat_room.read_state_fields(user.id)
+    if fields is None:
+        return
+    unread_field, last_read_field = fields
+    latest_id = Message.objects.filter(
+        chat_room=models.OuterRef('pk')
+    ).order_by('-id').values('id')[:1]
+    ChatRoom.objects.filter(pk=chat_room.pk).update(**{
+        unread_field: 0,
+        last_read_field: Coalesce(models.Subquery(latest_id), models.F(last_read_field)),
+    })
+
+
+def mark_read_up_to(chat_room, user_id, message_id):
+    """
+    Move ``user_id``'s read watermark forward to ``message_id`` and recount
+    what is still unread after it, in one UPDATE. Never moves it backwards,
+    nor past the room's latest message.
+    """
+    fields = chat_room.read_state_fields(user_id)
+    if fields is None:
+        return
+    unread_field, last_read_field = fields
+    still_unread = Message.objects.filter(
+        chat_room=models.OuterRef('pk'),
+        id__gt=message_id
+    ).exclude(sender_id=user_id).values('chat_room').annotate(
+        count=models.Count('id')
+    ).values('count')
+    latest_id = Message.objects.filter(
+        chat_room=models.OuterRef('pk')
+    ).order_by('-id').values('id')[:1]
+    ChatRoom.objects.filter(**{'pk': chat_room.pk, f'{last_read_field}__lt': message_id}).update(**{
+        last_read_field: Least(models.Value(message_id), Coalesce(models.Subquery(latest_id), 0)),
+        unread_field: Coalesce(models.Subquery(still_unread), 0),
+    })
+
+
+def with_expected_counts(queryset):
+    """
+    Annotate rooms with the unread counts implied by their read watermarks,
+    counted from the message table. Used to backfill and verify the counters.
+    """
+    return queryset.annotate(
+        expected_patient_unread=models.Count('messages', filter=(
+            models.Q(messages__id__gt=models.F('patient_last_read_id')) &
+            ~models.Q(messages__sender_id=models.F('patient_id'))
+        )),
+        expected_doctor_unread=models.Count('messages', filter=(
+            models.Q(messages__id__gt=models.F('doctor_last_read_id')) &
+            ~models.Q(messages__sender_id=models.F('doctor_id'))
+        )),
+    )
+
+
+def inconsistent_rooms(queryset=None):
+    """Rooms whose stored unread counters differ from the message table."""
+    queryset = ChatRoom.objects.all() if queryset is None else queryset
+    return with_expected_counts(queryset).exclude(
+        patient_unread_count=models.F('expected_patient_unread'),
+        doctor_unread_count=models.F('expected_doctor_unread'),
+    ).order_by('pk')
+
+
+def repair_unread_counts(rooms, batch_size=500):
+    """Overwrite the counters of rooms annotated by with_expected_counts()."""
+    rooms = list(rooms)
+    for chat_room in rooms:
+        chat_room.patient_unread_count = chat_room.expected_patient_unread
+        chat_room.doctor_unread_count = chat_room.expected_doctor_unread
+    ChatRoom.objects.bulk_update(
+        rooms, ['patient_unread_count', 'doctor_unread_count'], batch_size=batch_size
+    )
+    return len(rooms)
@@ -1,9 +1,11 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     path('rooms/', views.ChatRoomListCreateView.as_view(), name='chatroom-list-create'),
     path('rooms/<int:pk>/', views.ChatRoomDetailView.as_view(), name='chatroom-detail'),
     path('rooms/<int:chat_room_id>/messages/', views.MessageListCreateView.as_view(), name='message-list-create'),
+    re_path(r'^rooms/(?P<chat_room_id>\d+)/messages/(?P<pk>\d+)/(?P<kind>file|image)/$',
+            views.MessageAttachmentView.as_view(), name='message-attachment'),
     path('rooms/<int:chat_room_id>/mark-read/', views.MarkMessagesReadView.as_view(), name='mark-messages-read'),
 ]
\ No newline at end of file
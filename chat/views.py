@@ -3,15 +3,22 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from django.db import models
+from django.shortcuts import get_object_or_404
+from django.template.defaultfilters import filesizeformat
+from django.utils.http import parse_etags
+from .attachments import SizeLimitUploadHandler, max_upload_bytes, serve_attachment
 from .models import ChatRoom, Message
+from .pagination import MessageCursorPagination
 from .serializers import (
     ChatRoomSerializer, ChatRoomCreateSerializer,
     MessageSerializer, MessageCreateSerializer
 )
+from .unread import mark_room_read
 from accounts.permissions import IsAppointmentParticipant, IsAdminUser
+from healthcare_backend.stats import get_stats, wants_fresh_stats
 
 class ChatRoomListCreateView(generics.ListCreateAPIView):
+    query_budget = 6
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
     ordering = ['-updated_at']
@@ -19,11 +26,9 @@ class ChatRoomListCreateView(generics.ListCreateAPIView):
     def get_queryset(self):
         user = self.request.user
         if user.role == 'admin':
-            return ChatRoom.objects.all()
+            return ChatRoom.objects.with_summary(user)
         else:
-            return ChatRoom.objects.filter(
-                models.Q(patient=user) | models.Q(doctor=user)
-            )
+            return ChatRoom.objects.for_user(user).with_summary(user)
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -32,26 +37,77 @@ class ChatRoomListCreateView(generics.ListCreateAPIView):
 
 
 class ChatRoomDetailView(generics.RetrieveAPIView):
-    queryset = ChatRoom.objects.all()
     serializer_class = ChatRoomSerializer
     permission_classes = [IsAppointmentParticipant]
+    
+    def get_queryset(self):
+        return ChatRoom.objects.with_summary(self.request.user)
 
 
 class MessageListCreateView(generics.ListCreateAPIView):
+    query_budget = 6
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [filters.OrderingFilter]
-    ordering = ['timestamp']
+    pagination_class = MessageCursorPagination
+    
+    def get_chat_room(self):
+        if not hasattr(self, '_chat_room'):
+            self._chat_room = get_object_or_404(ChatRoom, id=self.kwargs.get('chat_room_id'))
+        return self._chat_room
+    
+    def can_read(self, chat_room):
+        user = self.request.user
+        return user.id in (chat_room.patient_id, chat_room.doctor_id) or user.role == 'admin'
     
     def get_queryset(self):
-        chat_room_id = self.kwargs.get('chat_room_id')
-        chat_room = ChatRoom.objects.get(id=chat_room_id)
+        chat_room = self.get_chat_room()
         
         # Check if user is participant in this chat room
-        user = self.request.user
-        if user not in [chat_room.patient, chat_room.doctor] and user.role != 'admin':
+        if not self.can_read(chat_room):
             return Message.objects.none()
         
-        return Message.objects.filter(chat_room_id=chat_room_id)
+        queryset = Message.objects.filter(chat_room=chat_room).select_related('sender', 'chat_room')
+        if 'since' in self.request.query_params:
+            queryset = queryset.filter(id__gt=self.request.query_params['since'])
+        return queryset
+    
+    def list(self, request, *args, **kwargs):
+        """
+        With ?since=<message_id> only newer messages are returned, at most a
+        page of them, as ``{"results": [...], "has_more": bool}``; poll again
+        from the last id while ``has_more``. If-None-Match is answered with
+        304 when no message was added and nothing more was read.
+        """
+        if 'since' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        
+        since = request.query_params['since']
+        if not since.isdigit():
+            return Response(
+                {'error': 'since must be a message id'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        chat_room = self.get_chat_room()
+        if not self.can_read(chat_room):
+            return Response({'results': [], 'has_more': False})
+        
+        since = int(since)
+        latest_id = chat_room.latest_message_id()
+        etag = chat_room.messages_etag(since, latest_id)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        
+        # By id, so the next poll from the last id returned cannot skip a message
+        page_size = self.paginator.get_page_size(request)
+        messages = list(self.get_queryset().order_by('id')[:page_size + 1])
+        has_more = len(messages) > page_size
+        messages = messages[:page_size]
+        serializer = self.get_serializer(messages, many=True)
+        response = Response({'results': serializer.data, 'has_more': has_more})
+        if not has_more:
+            # Matches the next poll, which starts after the last message returned
+            response['ETag'] = chat_room.messages_etag(messages[-1].id if messages else since, latest_id)
+        return response
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -70,15 +126,72 @@ class MessageListCreateView(generics.ListCreateAPIView):
         
         # Check if user is participant in this chat room
         user = request.user
-        if user not in [chat_room.patient, chat_room.doctor]:
+        if user.pk not in (chat_room.patient_id, chat_room.doctor_id):
             return Response(
                 {'error': 'You are not a participant in this chat room'}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Add chat_room to request data
-        request.data['chat_room'] = chat_room_id
-        return super().create(request, *args, **kwargs)
+        # Refuse oversized uploads before reading the body, and stop reading once a file passes the limit
+        limit = max_upload_bytes()
+        content_length = request.META.get('CONTENT_LENGTH') or '0'
+        if content_length.isdigit() and int(content_length) > limit + 64 * 1024:
+            return self.too_large(limit)
+        size_limit = SizeLimitUploadHandler(request, limit)
+        request._request.upload_handlers.insert(0, size_limit)
+        
+        serializer = self.get_serializer(data=request.data)
+        if size_limit.exceeded:
+            return self.too_large(limit)
+        serializer.is_valid(raise_exception=True)
+        # Multipart request.data is immutable, so the room is passed to save()
+        serializer.save(chat_room=chat_room)
+        headers = self.get_success_headers(serializer.data)
+        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+    
+    def too_large(self, limit):
+        return Response(
+            {'error': f'Attachments may be at most {filesizeformat(limit)}'},
+            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+
+
+class MessageAttachmentView(APIView):
+    """
+    Download a message's file or image attachment, or with ?variant=<name>&format=jpeg|webp
+    one of its resized copies. Only the room's participants and admins may read it.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request, chat_room_id, pk, kind):
+        participants = ChatRoom.objects.filter(id=chat_room_id).values_list('patient_id', 'doctor_id').first()
+        if participants is None:
+            return Response(
+                {'error': 'Chat room not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        if request.user.id not in participants and request.user.role != 'admin':
+            return Response(
+                {'error': 'You are not a participant in this chat room'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        message = get_object_or_404(
+            Message.objects.only('file_attachment', 'image_attachment', 'file_attachment_variants',
+                                 'image_attachment_variants'),
+            pk=pk, chat_room_id=chat_room_id
+        )
+        field_file = getattr(message, f'{kind}_attachment')
+        variant = request.query_params.get('variant')
+        if variant:
+            variants = getattr(message, f'{kind}_attachment_variants')
+            name = variants.get(variant, {}).get(request.query_params.get('format', 'jpeg')) if variant != 'source' else None
+            if not field_file or name is None or variants.get('source') != field_file.name:
+                return Response({'error': 'Variant not found'}, status=status.HTTP_404_NOT_FOUND)
+            field_file.name = name
+        if not field_file:
+            return Response({'error': 'Attachment not found'}, status=status.HTTP_404_NOT_FOUND)
+        return serve_attachment(request, field_file, as_attachment=kind == 'file')
 
 
 class MarkMessagesReadView(APIView):
@@ -95,17 +208,14 @@ class MarkMessagesReadView(APIView):
         
         # Check if user is participant in this chat room
         user = request.user
-        if user not in [chat_room.patient, chat_room.doctor]:
+        if user.pk not in (chat_room.patient_id, chat_room.doctor_id):
             return Response(
                 {'error': 'You are not a participant in this chat room'}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Mark all messages as read except sender's own messages
-        Message.objects.filter(
-            chat_room=chat_room,
-            is_read=False
-        ).exclude(sender=user).update(is_read=True)
+        # Move the user's read watermark to the latest message and reset their unread counter
+        mark_room_read(chat_room, user)
         
         return Response({'message': 'Messages marked as read'})
 
@@ -114,13 +224,4 @@ class ChatStatsView(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        total_chat_rooms = ChatRoom.objects.count()
-        active_chat_rooms = ChatRoom.objects.filter(is_active=True).count()
-        total_messages = Message.objects.count()
-        
-        stats = {
-            'total_chat_rooms': total_chat_rooms,
-            'active_chat_rooms': active_chat_rooms,
-            'total_messages': total_messages,
-        }
-        return Response(stats)
\ No newline at end of file
+        return Response(get_stats(fresh=wants_fresh_stats(request))['chat'])
\ No newline at end of file
@@ -8,7 +8,7 @@ class DoctorAdmin(admin.ModelAdmin):
     list_filter = ('specialization', 'is_available', 'created_at')
     search_fields = ('user__first_name', 'user__last_name', 'user__email', 
                     'license_number', 'hospital_affiliation')
-    readonly_fields = ('created_at', 'updated_at', 'rating', 'total_reviews')
+    readonly_fields = ('created_at', 'updated_at', 'rating', 'rating_sum', 'total_reviews')
     
     fieldsets = (
         ('User Information', {
@@ -23,7 +23,7 @@ class DoctorAdmin(admin.ModelAdmin):
                       'is_available', 'hospital_affiliation', 'languages_spoken')
         }),
         ('Ratings', {
-            'fields': ('rating', 'total_reviews'),
+            'fields': ('rating', 'rating_sum', 'total_reviews'),
             'classes': ('collapse',)
         }),
         ('Timestamps', {
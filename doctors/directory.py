@@ -0,0 +1,117 @@
+"""
+Cached public doctor directory.
+
+The public doctor listings are the same for every visitor, so their
+serialized payloads are stored gzip-compressed in the cache under a
+directory version. Any change to a doctor (profile, user account or
+rating) bumps the version instead of deleting individual entries, which
+also gives every payload a cheap ETag and Last-Modified for revalidation.
+"""
+import gzip
+import hashlib
+import pickle
+import time
+from contextlib import contextmanager
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+VERSION_KEY = 'doctor-directory:version'
+SNAPSHOT_TIMEOUT = 60 * 60
+
+
+def get_directory_version():
+    """Timestamp of the last directory change, used as the cache version."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time(), None)
+        version = cache.get(VERSION_KEY, time.time())
+    return version
+
+
+def bump_directory_version():
+    """Invalidate every directory snapshot once the current transaction commits."""
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, time.time(), None))
+
+
+def snapshot_id(name, version):
+    return hashlib.md5(f'{version}:{name}'.encode()).hexdigest()
+
+
+def get_snapshot(name, build, version=None):
+    """Return the compressed payload of ``name``, calling ``build()`` for its bytes on a miss."""
+    if version is None:
+        version = get_directory_version()
+    key = f'doctor-directory:{snapshot_id(name, version)}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = gzip.compress(build(), compresslevel=6)
+        cache.set(key, payload, SNAPSHOT_TIMEOUT)
+    return payload
+
+
+def get_cached_rows(name, build):
+    """Cached list of plain rows for server-rendered pages."""
+    payload = get_snapshot(name, lambda: pickle.dumps(build(), pickle.HIGHEST_PROTOCOL))
+    return pickle.loads(gzip.decompress(payload))
+
+
+def snapshot_name(request, params):
+    """
+    Name of the snapshot answering ``request``: its path and the query
+    parameters in ``params`` in sorted order. Parameters the view ignores,
+    their order in the URL and the Host header do not create new snapshots.
+    """
+    query = urlencode([(key, value) for key in sorted(params) for value in request.GET.getlist(key)])
+    return f'{request.path}?{query}'
+
+
+@contextmanager
+def relative_links(request):
+    """
+    Make ``request.build_absolute_uri()`` return site-relative URLs, so the
+    links in a snapshot (pagination, pictures) are the same whatever Host
+    the request that built it was sent to.
+    """
+    http_request = getattr(request, '_request', request)
+    http_request.build_absolute_uri = lambda location=None: location or http_request.get_full_path()
+    try:
+        yield
+    finally:
+        del http_request.build_absolute_uri
+
+
+def snapshot_response(request, build, params, content_type='application/json'):
+    """
+    Serve the snapshot of the requested list, building it with ``build()`` on
+    a miss. ``params`` are the query parameters that change the list. Answers
+    304 when the client's ETag or Last-Modified is current and sends the
+    stored gzip bytes as-is to clients that accept them.
+    """
+    name = snapshot_name(request, params)
+    version = get_directory_version()
+    etag = '"%s"' % snapshot_id(name, version)
+    last_modified = int(version)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        def build_relative():
+            with relative_links(request):
+                return build()
+
+        payload = get_snapshot(name, build_relative, version)
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = HttpResponse(payload, content_type=content_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(gzip.decompress(payload), content_type=content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from doctors.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute doctor ratings and review counts from the review table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = recompute_ratings(options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Updated ratings of {updated} doctors'))
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:18
+
+import django.contrib.postgres.search
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+# GIN indexes only exist on PostgreSQL; other databases use the plain
+# column fallback in doctors.search.
+SEARCH_INDEXES = [
+    GinIndex(fields=['search_vector'], name='doctor_search_vector_idx'),
+    GinIndex(fields=['search_name'], name='doctor_search_name_trgm_idx', opclasses=['gin_trgm_ops']),
+    GinIndex(fields=['specialization'], name='doctor_specialization_trgm_idx', opclasses=['gin_trgm_ops']),
+]
+
+
+def fill_search_columns(apps, schema_editor):
+    Doctor = apps.get_model('doctors', 'Doctor')
+    
+    doctors = list(Doctor.objects.select_related('user'))
+    for doctor in doctors:
+        doctor.search_name = f"{doctor.user.first_name} {doctor.user.last_name}"
+    Doctor.objects.bulk_update(doctors, ['search_name'], batch_size=500)
+    
+    if schema_editor.connection.vendor == 'postgresql':
+        Doctor.objects.update(search_vector=(
+            SearchVector('search_name', 'specialization', weight='A', config='simple')
+            + SearchVector('hospital_affiliation', 'languages_spoken', weight='B', config='simple')
+            + SearchVector('bio', weight='C', config='simple')
+        ))
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        Doctor = apps.get_model('doctors', 'Doctor')
+        for index in SEARCH_INDEXES:
+            schema_editor.add_index(Doctor, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        Doctor = apps.get_model('doctors', 'Doctor')
+        for index in SEARCH_INDEXES:
+            schema_editor.remove_index(Doctor, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0003_doctor_rating_sum'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='doctor',
+            name='search_name',
+            field=models.CharField(blank=True, editable=False, max_length=61),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_columns, migrations.RunPython.noop),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
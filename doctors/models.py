@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from accounts.models import User
 
@@ -31,8 +32,13 @@ class Doctor(models.Model):
     is_available = models.BooleanField(default=True)
     hospital_affiliation = models.CharField(max_length=200, blank=True)
     languages_spoken = models.CharField(max_length=200, blank=True, help_text="Comma-separated languages")
+    # Maintained incrementally from reviews by doctors.ratings
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
+    rating_sum = models.PositiveIntegerField(default=0, help_text="Sum of all review ratings")
     total_reviews = models.PositiveIntegerField(default=0)
+    # Search columns maintained by doctors.signals, see doctors.search
+    search_name = models.CharField(max_length=61, blank=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -41,3 +47,10 @@ class Doctor(models.Model):
     
     class Meta:
         ordering = ['-rating', 'user__first_name']
+        indexes = [
+            models.Index(fields=['-rating'], name='doctor_rating_idx'),
+            models.Index(fields=['is_available', '-rating'], name='doctor_available_rating_idx'),
+            # Directory by specialization, which only lists available doctors
+            models.Index(fields=['specialization', '-rating'], name='doctor_available_spec_idx',
+                         condition=models.Q(is_available=True)),
+        ]
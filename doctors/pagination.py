@@ -0,0 +1,8 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PatientRosterCursorPagination(CursorPagination):
+    """Keyset pagination over patient ids, newest patients first."""
+    ordering = ('-id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
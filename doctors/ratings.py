@@ -0,0 +1,69 @@
+"""
+Incremental doctor ratings.
+
+Doctor.rating_sum and Doctor.total_reviews are adjusted with F() expressions
+whenever a review is created, changed or deleted, and Doctor.rating is
+recomputed from them in the same UPDATE, so listings ordered by rating never
+aggregate over reviews. The cached directory is only invalidated when the
+stored rating changes; review counts shown in directory snapshots may lag
+until the next directory change or SNAPSHOT_TIMEOUT.
+"""
+from django.db.models import Count, DecimalField, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from .directory import bump_directory_version
+from .models import Doctor
+
+
+def average_rating(rating_sum, total_reviews):
+    """SQL expression for the average rating, 0 when there are no reviews."""
+    return Cast(
+        Coalesce(Cast(rating_sum, FloatField()) / NullIf(total_reviews, Value(0)), Value(0.0)),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def apply_review_change(doctor_id, rating_delta, count_delta):
+    """
+    Atomically add ``rating_delta`` stars and ``count_delta`` reviews to a
+    doctor. One UPDATE when the rating changes, which also invalidates the
+    directory; a second one when it does not.
+    """
+    rating_sum = F('rating_sum') + rating_delta
+    total_reviews = F('total_reviews') + count_delta
+    fields = {
+        'rating_sum': rating_sum,
+        'total_reviews': total_reviews,
+        'rating': average_rating(rating_sum, total_reviews),
+    }
+    doctor = Doctor.objects.filter(pk=doctor_id)
+    if doctor.exclude(rating=fields['rating']).update(**fields):
+        bump_directory_version()
+    else:
+        doctor.update(**fields)
+
+
+def recompute_ratings(batch_size=500):
+    """Rebuild every doctor's rating from one grouped query over reviews."""
+    from appointments.models import Review
+
+    totals = {
+        row['doctor']: (row['rating_sum'], row['total_reviews'])
+        for row in Review.objects.values('doctor').annotate(
+            rating_sum=Sum('rating'), total_reviews=Count('id')
+        ).order_by()
+    }
+
+    changed = []
+    for doctor in Doctor.objects.only('id', 'rating', 'rating_sum', 'total_reviews').iterator():
+        rating_sum, total_reviews = totals.get(doctor.id, (0, 0))
+        rating = round(rating_sum / total_reviews, 2) if total_reviews else 0
+        if (doctor.rating_sum, doctor.total_reviews, float(doctor.rating)) != (rating_sum, total_reviews, rating):
+            doctor.rating_sum = rating_sum
+            doctor.total_reviews = total_reviews
+            doctor.rating = rating
+            changed.append(doctor)
+
+    Doctor.objects.bulk_update(changed, ['rating', 'rating_sum', 'total_reviews'], batch_size=batch_size)
+    if changed:
+        bump_directory_version()
+    return len(changed)
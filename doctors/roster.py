@@ -0,0 +1,53 @@
+"""
+A doctor's patient roster.
+
+patient_roster() lists the patients who have booked with a doctor, annotated
+with the ids of their latest pending and latest accepted appointment with
+that doctor (correlated subqueries served by the (patient, status,
+-appointment_date) index). After slicing or paginating,
+attach_latest_appointments() loads those appointments with one query, so a
+roster of any size costs two queries.
+"""
+from django.db.models import OuterRef, Subquery
+
+from appointments.models import Appointment
+from patients.models import Patient
+
+
+def latest_appointment_id(doctor, status):
+    return Subquery(
+        Appointment.objects.filter(
+            patient=OuterRef('pk'), doctor=doctor, status=status
+        ).order_by('-appointment_date', '-id').values('id')[:1]
+    )
+
+
+def patient_roster(doctor):
+    """Patients with at least one appointment with ``doctor``."""
+    return Patient.objects.filter(
+        id__in=Appointment.objects.filter(doctor=doctor).values('patient_id')
+    ).select_related('user').annotate(
+        pending_appointment_id=latest_appointment_id(doctor, 'pending'),
+        accepted_appointment_id=latest_appointment_id(doctor, 'accepted'),
+    )
+
+
+def attach_latest_appointments(patients, doctor):
+    """
+    Set ``pending_appointment`` and ``accepted_appointment`` (or None) on
+    patients from patient_roster(), and ``current_doctor`` on those with an
+    accepted appointment.
+    """
+    patients = list(patients)
+    ids = [
+        appointment_id
+        for patient in patients
+        for appointment_id in (patient.pending_appointment_id, patient.accepted_appointment_id)
+        if appointment_id is not None
+    ]
+    appointments = Appointment.objects.in_bulk(ids) if ids else {}
+    for patient in patients:
+        patient.pending_appointment = appointments.get(patient.pending_appointment_id)
+        patient.accepted_appointment = appointments.get(patient.accepted_appointment_id)
+        patient.current_doctor = doctor if patient.accepted_appointment else None
+    return patients
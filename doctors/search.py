@@ -0,0 +1,79 @@
+"""
+Doctor directory search.
+
+On PostgreSQL every doctor row carries a weighted ``search_vector`` (name,
+specialization, hospital, languages and bio) with a GIN index, and pg_trgm
+GIN indexes on ``search_name`` and ``specialization`` make the search
+tolerant to typos. The doctor's name is copied into ``search_name`` so a
+search never joins the users table. Other databases fall back to
+case-insensitive matching on the same columns.
+"""
+import re
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity,
+)
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+SEARCH_CONFIG = 'simple'
+MAX_SEARCH_TERMS = 8
+
+FALLBACK_SEARCH_FIELDS = ('search_name', 'specialization', 'hospital_affiliation', 'languages_spoken', 'bio')
+
+
+def uses_postgres_search():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector_expression():
+    """Weighted search document built from columns of the doctor row."""
+    return (
+        SearchVector('search_name', 'specialization', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('hospital_affiliation', 'languages_spoken', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('bio', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def refresh_search_index(queryset):
+    """Rebuild the stored search vector of every doctor in ``queryset``."""
+    if uses_postgres_search():
+        queryset.update(search_vector=search_vector_expression())
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_SEARCH_TERMS]
+
+
+def search_doctors(queryset, query):
+    """Filter ``queryset`` to doctors matching ``query``, best matches first."""
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    text = ' '.join(terms)
+
+    if not uses_postgres_search():
+        condition = Q()
+        for term in terms:
+            term_condition = Q()
+            for field in FALLBACK_SEARCH_FIELDS:
+                term_condition |= Q(**{f'{field}__icontains': term})
+            condition &= term_condition
+        return queryset.filter(condition).order_by('-rating', 'id')
+
+    # Prefix matching so results show up while the user is still typing
+    search_query = SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG
+    )
+    return queryset.filter(
+        Q(search_vector=search_query)
+        | Q(search_name__trigram_word_similar=text)
+        | Q(specialization__trigram_word_similar=text)
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query),
+        similarity=Greatest(
+            TrigramWordSimilarity(text, 'search_name'),
+            TrigramWordSimilarity(text, 'specialization'),
+        ),
+    ).order_by('-rank', '-similarity', '-rating', 'id')
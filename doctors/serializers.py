@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from .models import Doctor
+from appointments.models import Appointment
+from patients.models import Patient
 from accounts.serializers import UserProfileSerializer
+from healthcare_backend.images import ImageVariantsField
 
 class DoctorSerializer(serializers.ModelSerializer):
     user = UserProfileSerializer(read_only=True)
@@ -8,13 +11,14 @@ class DoctorSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Doctor
-        fields = '__all__'
+        exclude = ('search_name', 'search_vector')
+        read_only_fields = ('rating', 'rating_sum', 'total_reviews')
 
 
 class DoctorCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Doctor
-        exclude = ('user', 'rating', 'total_reviews')
+        exclude = ('user', 'rating', 'rating_sum', 'total_reviews', 'search_name', 'search_vector')
     
     def create(self, validated_data):
         user = self.context['request'].user
@@ -30,22 +34,44 @@ class DoctorListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Doctor
         fields = ('id', 'user_name', 'user_email', 'specialization', 'specialization_display', 
-                 'years_of_experience', 'consultation_fee', 'rating', 'is_available')
+                 'experience_years', 'consultation_fee', 'rating', 'is_available')
 
 
 class DoctorPublicSerializer(serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.full_name', read_only=True)
     profile_picture = serializers.ImageField(source='user.profile_picture', read_only=True)
+    profile_picture_variants = ImageVariantsField(source='user.profile_picture', variants_field='profile_picture_variants')
     specialization_display = serializers.CharField(source='get_specialization_display', read_only=True)
     
     class Meta:
         model = Doctor
-        fields = ('id', 'user_name', 'profile_picture', 'specialization', 'specialization_display',
-                 'years_of_experience', 'bio', 'consultation_fee', 'available_from', 'available_to',
+        fields = ('id', 'user_name', 'profile_picture', 'profile_picture_variants', 'specialization', 'specialization_display',
+                 'experience_years', 'bio', 'consultation_fee', 'available_from', 'available_to',
                  'is_available', 'hospital_affiliation', 'languages_spoken', 'rating', 'total_reviews')
 
 
 class DoctorUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Doctor
-        exclude = ('user', 'rating', 'total_reviews', 'created_at')
+        exclude = ('user', 'rating', 'rating_sum', 'total_reviews', 'search_name', 'search_vector', 'created_at')
+
+
+class RosterAppointmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Appointment
+        fields = ('id', 'appointment_date', 'appointment_type', 'status', 'reason_for_visit', 'symptoms', 'created_at')
+
+
+class RosterPatientSerializer(serializers.ModelSerializer):
+    """A patient in a doctor's roster, with their latest pending and accepted appointment with that doctor."""
+    user_name = serializers.CharField(source='user.full_name', read_only=True)
+    email = serializers.EmailField(source='user.email', read_only=True)
+    phone_number = serializers.CharField(source='user.phone_number', read_only=True)
+    date_of_birth = serializers.DateField(source='user.date_of_birth', read_only=True)
+    pending_appointment = RosterAppointmentSerializer(read_only=True)
+    accepted_appointment = RosterAppointmentSerializer(read_only=True)
+    
+    class Meta:
+        model = Patient
+        fields = ('id', 'user_name', 'email', 'phone_number', 'date_of_birth', 'gender', 'blood_group',
+                 'allergies', 'symptoms', 'pending_appointment', 'accepted_appointment')
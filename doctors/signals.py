@@ -0,0 +1,80 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from accounts.models import User
+from appointments.models import Review
+from .models import Doctor
+from .directory import bump_directory_version
+from .ratings import apply_review_change
+from .search import refresh_search_index
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    """
+    Keep the stored doctor and rating of an edited review for post_save.
+    Loaded reviews remember them from Review.from_db(); only instances
+    built by hand, or loaded without those fields, need a query. Saving a
+    copy loaded before another save of the same review counts from stale
+    values; recompute_doctor_ratings repairs that.
+    """
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = getattr(instance, '_stored_rating', None) or Review.objects.filter(
+            pk=instance.pk
+        ).values_list('doctor_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_review_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    instance._stored_rating = (instance.doctor_id, instance.rating)
+    if created or previous is None:
+        apply_review_change(instance.doctor_id, instance.rating, 1)
+        return
+
+    previous_doctor_id, previous_rating = previous
+    if previous_doctor_id != instance.doctor_id:
+        apply_review_change(previous_doctor_id, -previous_rating, -1)
+        apply_review_change(instance.doctor_id, instance.rating, 1)
+    elif previous_rating != instance.rating:
+        apply_review_change(instance.doctor_id, instance.rating - previous_rating, 0)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_review_delete(sender, instance, **kwargs):
+    apply_review_change(instance.doctor_id, -instance.rating, -1)
+
+
+@receiver(pre_save, sender=Doctor)
+def copy_search_name(sender, instance, **kwargs):
+    instance.search_name = instance.user.full_name
+
+
+@receiver(post_save, sender=Doctor)
+def update_search_vector(sender, instance, **kwargs):
+    refresh_search_index(Doctor.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=User)
+def update_search_name_on_rename(sender, instance, update_fields=None, **kwargs):
+    """Keep the copied name of a doctor in sync with their user account."""
+    if instance.role != 'doctor':
+        return
+    if update_fields is not None and not update_fields & {'first_name', 'last_name'}:
+        return
+    renamed = Doctor.objects.filter(user=instance).exclude(search_name=instance.full_name)
+    if renamed.update(search_name=instance.full_name):
+        refresh_search_index(Doctor.objects.filter(user=instance))
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def invalidate_directory_on_doctor_change(sender, instance, **kwargs):
+    bump_directory_version()
+
+
+@receiver(post_save, sender=User)
+def invalidate_directory_on_user_change(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which the directory does not show
+    if instance.role == 'doctor' and update_fields != frozenset({'last_login'}):
+        bump_directory_version()
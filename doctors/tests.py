@@ -0,0 +1,262 @@
+"""
+Doctor directory search, cached directory snapshots, incremental ratings and
+patient rosters.
+
+Ranking by relevance and typo tolerance need PostgreSQL; other databases
+fall back to case-insensitive matching ordered by rating.
+"""
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Avg, Count
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from appointments.models import Appointment, Review
+from patients.models import Patient
+from .directory import snapshot_name
+from .models import Doctor
+from .ratings import recompute_ratings
+from .search import search_doctors, uses_postgres_search
+
+
+def create_doctor(first_name, last_name, rating, **fields):
+    user = User.objects.create_user(
+        email=f'{first_name.lower()}.{last_name.lower()}@example.com', password='password',
+        first_name=first_name, last_name=last_name, role='doctor'
+    )
+    return Doctor.objects.create(user=user, rating=rating, **fields)
+
+
+class DoctorSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.smith = create_doctor('John', 'Smith', 4.0, specialization='cardiology')
+        cls.lee = create_doctor('Ann', 'Lee', 4.9, specialization='cardiology')
+        cls.khan = create_doctor('Sara', 'Khan', 4.5, specialization='dermatology',
+                                 bio='Worked with Dr. Smith on skin conditions of the heart patients')
+
+    def search(self, query):
+        return list(search_doctors(Doctor.objects.all(), query))
+
+    def test_matches_are_ordered_by_rating_when_equally_relevant(self):
+        self.assertEqual(self.search('cardiology'), [self.lee, self.smith])
+
+    def test_terms_match_prefixes_and_must_all_match(self):
+        self.assertEqual(self.search('cardio'), [self.lee, self.smith])
+        self.assertEqual(self.search('john cardio'), [self.smith])
+
+    def test_empty_query_matches_nothing(self):
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(self.search('  ?! '), [])
+
+    @skipUnless(uses_postgres_search(), 'ranking needs PostgreSQL full text search')
+    def test_name_matches_rank_above_bio_matches(self):
+        # Khan is rated higher but only mentions the name in the bio
+        self.assertEqual(self.search('smith'), [self.smith, self.khan])
+
+    @skipUnless(uses_postgres_search(), 'typo tolerance needs pg_trgm')
+    def test_misspelled_terms_still_match(self):
+        self.assertEqual(set(self.search('cardiolgy')), {self.smith, self.lee})
+
+    def test_search_endpoint(self):
+        response = self.client.get('/api/doctors/search/', {'q': 'cardiology'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([doctor['id'] for doctor in response.json()['results']], [self.lee.id, self.smith.id])
+
+        response = self.client.get('/api/doctors/search/', {'q': 'cardiology', 'specialization': 'dermatology'})
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_search_endpoint_without_a_query(self):
+        for params in ({}, {'q': ''}):
+            response = self.client.get('/api/doctors/search/', params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['count'], 0)
+
+    def test_renaming_a_doctor_updates_the_search_name(self):
+        user = self.smith.user
+        user.last_name = 'Smyth'
+        user.save()
+        self.smith.refresh_from_db()
+        self.assertEqual(self.smith.search_name, 'John Smyth')
+
+    def test_saves_that_keep_the_name_do_not_touch_doctors(self):
+        patient = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        for user, fields in ((self.smith.user, ['last_login']), (self.smith.user, ['phone_number']), (patient, None)):
+            with CaptureQueriesContext(connection) as queries:
+                user.save(update_fields=fields)
+            self.assertFalse([query['sql'] for query in queries if 'doctors_doctor' in query['sql']], fields)
+
+
+class DirectorySnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_doctor('John', 'Smith', 4.0, specialization='cardiology')
+        create_doctor('Sara', 'Khan', 4.5, specialization='dermatology')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_snapshot_names_keep_only_the_given_params_in_sorted_order(self):
+        factory = RequestFactory()
+        params = {'specialization', 'ordering', 'page'}
+        name = snapshot_name(factory.get('/api/doctors/', {'specialization': 'cardiology', 'ordering': 'rating'}), params)
+        self.assertEqual(name, '/api/doctors/?ordering=rating&specialization=cardiology')
+        reordered = factory.get('/api/doctors/?utm_source=mail&ordering=rating&specialization=cardiology')
+        self.assertEqual(snapshot_name(reordered, params), name)
+
+    def test_ignored_params_share_a_snapshot(self):
+        first = self.client.get('/api/doctors/', {'specialization': 'cardiology', 'ordering': 'rating'})
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/doctors/?cachebuster=1&ordering=rating&specialization=cardiology')
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.content, first.content)
+
+        other = self.client.get('/api/doctors/', {'specialization': 'dermatology', 'ordering': 'rating'})
+        self.assertNotEqual(other['ETag'], first['ETag'])
+        self.assertEqual(len(other.json()['results']), 1)
+
+    def test_host_header_does_not_change_the_snapshot(self):
+        # Enough doctors for a second page, so the payload has a next link
+        for i in range(9):
+            create_doctor('Extra', f'Doctor{i}', 3.0, specialization='neurology')
+        response = self.client.get('/api/doctors/', HTTP_HOST='evil.example')
+        self.assertEqual(response.json()['next'], '/api/doctors/?page=2')
+        with self.assertNumQueries(0):
+            other = self.client.get('/api/doctors/', HTTP_HOST='testserver')
+        self.assertEqual(other['ETag'], response['ETag'])
+        self.assertEqual(other.content, response.content)
+
+
+class RatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.smith = create_doctor('John', 'Smith', 0, specialization='cardiology')
+        cls.lee = create_doctor('Ann', 'Lee', 0, specialization='cardiology')
+        patient_user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        cls.patient = Patient.objects.create(user=patient_user)
+
+    def review(self, doctor, rating):
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=doctor, reason_for_visit='Checkup', status='completed',
+            appointment_date=timezone.now() - timedelta(days=Appointment.objects.count() + 1)
+        )
+        return Review.objects.create(appointment=appointment, patient=self.patient, doctor=doctor, rating=rating)
+
+    def assertRatingsMatch(self):
+        for doctor in (self.smith, self.lee):
+            doctor.refresh_from_db()
+            expected = Review.objects.filter(doctor=doctor).aggregate(average=Avg('rating'), count=Count('id'))
+            self.assertEqual(doctor.total_reviews, expected['count'])
+            self.assertAlmostEqual(float(doctor.rating), expected['average'] or 0, places=2)
+
+    def test_reviews_keep_ratings_equal_to_the_average(self):
+        first, second = self.review(self.smith, 5), self.review(self.smith, 2)
+        self.assertRatingsMatch()
+
+        first.rating = 3
+        first.save()
+        self.assertRatingsMatch()
+
+        loaded = Review.objects.get(pk=second.pk)
+        loaded.rating = 4
+        loaded.save()
+        self.assertRatingsMatch()
+
+        # Moving a review to another doctor
+        loaded.doctor = self.lee
+        loaded.save()
+        self.assertRatingsMatch()
+
+        first.delete()
+        loaded.delete()
+        self.assertRatingsMatch()
+        self.assertEqual(recompute_ratings(), 0)
+
+    def test_editing_a_loaded_review_does_not_read_it_again(self):
+        review = Review.objects.get(pk=self.review(self.smith, 4).pk)
+        review.rating = 5
+        with self.assertNumQueries(2):  # the review UPDATE and the rating UPDATE
+            review.save()
+        self.assertRatingsMatch()
+
+    def test_directory_is_invalidated_only_when_the_rating_changes(self):
+        with mock.patch('doctors.ratings.bump_directory_version') as bump:
+            self.review(self.smith, 4)
+            self.assertEqual(bump.call_count, 1)
+            self.review(self.smith, 4)
+            self.assertEqual(bump.call_count, 1)
+            self.review(self.smith, 1)
+            self.assertEqual(bump.call_count, 2)
+        self.assertRatingsMatch()
+
+
+class DoctorPatientsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.smith = create_doctor('John', 'Smith', 0, specialization='cardiology')
+        cls.lee = create_doctor('Ann', 'Lee', 0, specialization='cardiology')
+        cls.patients = [
+            Patient.objects.create(user=User.objects.create_user(
+                email=f'patient{index}@example.com', password='password',
+                first_name='Pat', last_name=f'Roe{index}', role='patient'
+            ))
+            for index in range(4)
+        ]
+        now = timezone.now()
+        cls.first, cls.second = cls.patients[:2]
+        cls.book(cls.first, cls.smith, now + timedelta(days=1), 'pending')
+        cls.latest_pending = cls.book(cls.first, cls.smith, now + timedelta(days=2), 'pending')
+        cls.accepted = cls.book(cls.first, cls.smith, now + timedelta(days=3), 'accepted')
+        cls.book(cls.first, cls.lee, now + timedelta(days=4), 'pending')
+        cls.book(cls.second, cls.smith, now - timedelta(days=1), 'completed')
+        cls.book(cls.patients[2], cls.lee, now + timedelta(days=1), 'accepted')
+
+    @classmethod
+    def book(cls, patient, doctor, appointment_date, status):
+        return Appointment.objects.create(
+            patient=patient, doctor=doctor, appointment_date=appointment_date,
+            reason_for_visit='Checkup', status=status
+        )
+
+    def get_roster(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(reverse('doctor-patients'))
+
+    def test_lists_only_the_doctors_own_patients(self):
+        response = self.get_roster(self.smith.user)
+        self.assertEqual(response.status_code, 200)
+        roster = {patient['id']: patient for patient in response.data['results']}
+        self.assertEqual(set(roster), {self.first.id, self.second.id})
+
+        first = roster[self.first.id]
+        self.assertEqual(first['pending_appointment']['id'], self.latest_pending.id)
+        self.assertEqual(first['accepted_appointment']['id'], self.accepted.id)
+        self.assertIsNone(roster[self.second.id]['pending_appointment'])
+        self.assertIsNone(roster[self.second.id]['accepted_appointment'])
+
+    def test_only_doctors_may_list_patients(self):
+        admin = User.objects.create_user(email='admin@example.com', password='password', role='admin')
+        for user in (self.first.user, admin):
+            self.assertEqual(self.get_roster(user).status_code, 403)
+        self.assertEqual(APIClient().get(reverse('doctor-patients')).status_code, 401)
+
+    def test_query_count_does_not_grow_with_the_roster(self):
+        with self.assertNumQueries(3):
+            self.get_roster(self.smith.user)
+        for patient in self.patients[2:]:
+            self.book(patient, self.smith, timezone.now() + timedelta(days=5), 'pending')
+            self.book(patient, self.smith, timezone.now() + timedelta(days=6), 'accepted')
+        with self.assertNumQueries(3):
+            self.assertEqual(len(self.get_roster(self.smith.user).data['results']), 4)
@@ -4,7 +4,10 @@ from . import views
 urlpatterns = [
     path('', views.DoctorListCreateView.as_view(), name='doctor-list-create'),
     path('<int:pk>/', views.DoctorDetailView.as_view(), name='doctor-detail'),
+    path('<int:pk>/slots/', views.DoctorSlotsView.as_view(), name='doctor-slots'),
     path('profile/', views.DoctorProfileView.as_view(), name='doctor-profile'),
+    path('me/patients/', views.DoctorPatientsView.as_view(), name='doctor-patients'),
+    path('search/', views.DoctorSearchView.as_view(), name='doctor-search'),
     path('available/', views.AvailableDoctorsView.as_view(), name='available-doctors'),
     path('specialization/<str:specialization>/', views.DoctorsBySpecializationView.as_view(), name='doctors-by-specialization'),
     path('stats/', views.DoctorStatsView.as_view(), name='doctor-stats'),
@@ -1,22 +1,57 @@
 from rest_framework import generics, permissions, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from django.db import models
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from .directory import snapshot_response
 from .models import Doctor
+from .pagination import PatientRosterCursorPagination
+from .roster import attach_latest_appointments, patient_roster
+from .search import search_doctors
 from .serializers import (
     DoctorSerializer, DoctorCreateSerializer, 
-    DoctorListSerializer, DoctorPublicSerializer, DoctorUpdateSerializer
+    DoctorListSerializer, DoctorPublicSerializer, DoctorUpdateSerializer,
+    RosterPatientSerializer
 )
-from accounts.permissions import IsAdminUser, IsDoctorOrAdmin, IsOwnerOrReadOnly
+from accounts.permissions import IsAdminUser, IsDoctor, IsDoctorOrAdmin, IsOwnerOrReadOnly
+from appointments.availability import MAX_RANGE_DAYS, build_slot_grid
+from healthcare_backend.stats import get_stats, wants_fresh_stats
 
-class DoctorListCreateView(generics.ListCreateAPIView):
-    queryset = Doctor.objects.all()
+class DirectorySnapshotMixin:
+    """Serve the public list from the cached directory snapshot of the request."""
+    
+    def get_snapshot_params(self):
+        """Query parameters the list depends on: filters, search, ordering and page."""
+        params = set(getattr(self, 'filterset_fields', ()))
+        for backend in self.filter_backends:
+            params.update(getattr(backend, name) for name in ('search_param', 'ordering_param')
+                          if hasattr(backend, name))
+        if self.paginator is not None:
+            params.update(getattr(self.paginator, name) for name in ('page_query_param', 'page_size_query_param')
+                          if getattr(self.paginator, name, None))
+        return params
+    
+    def list(self, request, *args, **kwargs):
+        build_list = super().list
+        return snapshot_response(
+            request,
+            lambda: JSONRenderer().render(build_list(request, *args, **kwargs).data),
+            self.get_snapshot_params()
+        )
+
+
+class DoctorListCreateView(DirectorySnapshotMixin, generics.ListCreateAPIView):
+    query_budget = 8
+    queryset = Doctor.objects.select_related('user')
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['specialization', 'is_available']
-    search_fields = ['user__first_name', 'user__last_name', 'specialization', 'hospital_affiliation']
-    ordering_fields = ['created_at', 'user__first_name', 'rating', 'years_of_experience']
+    search_fields = ['search_name', 'specialization', 'hospital_affiliation']
+    ordering_fields = ['created_at', 'user__first_name', 'rating', 'experience_years']
     ordering = ['-rating', 'user__first_name']
     
     def get_serializer_class(self):
@@ -50,13 +85,19 @@ class DoctorListCreateView(generics.ListCreateAPIView):
 
 
 class DoctorDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Doctor.objects.all()
+    queryset = Doctor.objects.select_related('user')
     permission_classes = [permissions.AllowAny]  # Public view for general users
     
+    def get_object(self):
+        # get_serializer_class() needs the doctor too
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+    
     def get_serializer_class(self):
         user = self.request.user
         if user.is_authenticated and (user.role in ['doctor', 'admin'] and 
-                                     (user.role == 'admin' or self.get_object().user == user)):
+                                     (user.role == 'admin' or self.get_object().user_id == user.pk)):
             if self.request.method in ['PUT', 'PATCH']:
                 return DoctorUpdateSerializer
             return DoctorSerializer
@@ -91,16 +132,17 @@ class DoctorProfileView(generics.RetrieveUpdateAPIView):
         return Response(serializer.data)
 
 
-class DoctorsBySpecializationView(generics.ListAPIView):
+class DoctorsBySpecializationView(DirectorySnapshotMixin, generics.ListAPIView):
+    query_budget = 4
     serializer_class = DoctorPublicSerializer
     permission_classes = [permissions.AllowAny]
     filter_backends = [filters.OrderingFilter]
-    ordering_fields = ['rating', 'years_of_experience', 'consultation_fee']
+    ordering_fields = ['rating', 'experience_years', 'consultation_fee']
     ordering = ['-rating']
     
     def get_queryset(self):
         specialization = self.kwargs.get('specialization')
-        return Doctor.objects.filter(
+        return Doctor.objects.select_related('user').filter(
             specialization=specialization, 
             is_available=True
         )
@@ -110,30 +152,80 @@ class DoctorStatsView(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        total_doctors = Doctor.objects.count()
-        available_doctors = Doctor.objects.filter(is_available=True).count()
-        by_specialization = Doctor.objects.values('specialization').annotate(
-            count=models.Count('specialization')
-        )
-        avg_rating = Doctor.objects.aggregate(
-            avg_rating=models.Avg('rating')
-        )['avg_rating']
-        
-        stats = {
-            'total_doctors': total_doctors,
-            'available_doctors': available_doctors,
-            'by_specialization': list(by_specialization),
-            'average_rating': round(avg_rating, 2) if avg_rating else 0,
-        }
-        return Response(stats)
+        return Response(get_stats(fresh=wants_fresh_stats(request))['doctors'])
 
 
-class AvailableDoctorsView(generics.ListAPIView):
-    queryset = Doctor.objects.filter(is_available=True)
+class AvailableDoctorsView(DirectorySnapshotMixin, generics.ListAPIView):
+    query_budget = 4
+    queryset = Doctor.objects.select_related('user').filter(is_available=True)
     serializer_class = DoctorPublicSerializer
     permission_classes = [permissions.AllowAny]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['specialization']
-    search_fields = ['user__first_name', 'user__last_name', 'specialization']
-    ordering_fields = ['rating', 'years_of_experience', 'consultation_fee']
+    search_fields = ['search_name', 'specialization']
+    ordering_fields = ['rating', 'experience_years', 'consultation_fee']
     ordering = ['-rating']
+
+
+class DoctorSearchView(generics.ListAPIView):
+    """Ranked, typo tolerant doctor search, e.g. ?q=cardiology or ?q=jon smth"""
+    query_budget = 4
+    serializer_class = DoctorPublicSerializer
+    permission_classes = [permissions.AllowAny]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['specialization', 'is_available']
+    
+    def get_queryset(self):
+        return search_doctors(
+            Doctor.objects.select_related('user').defer('search_vector'),
+            self.request.query_params.get('q', '')
+        )
+
+
+class DoctorSlotsView(APIView):
+    """Bookable slot grid of a doctor, e.g. ?from=2025-10-20&to=2025-10-26"""
+    permission_classes = [permissions.AllowAny]
+    
+    def get(self, request, pk):
+        doctor = get_object_or_404(Doctor, pk=pk)
+        
+        try:
+            date_from = parse_date(request.query_params.get('from') or timezone.localdate().isoformat())
+            date_to = (parse_date(request.query_params['to']) if request.query_params.get('to')
+                       else date_from and date_from + timedelta(days=6))
+        except ValueError:
+            date_from = date_to = None
+        if date_from is None or date_to is None:
+            return Response(
+                {'error': 'Dates must use the YYYY-MM-DD format'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if date_to < date_from or (date_to - date_from).days >= MAX_RANGE_DAYS:
+            return Response(
+                {'error': f'Date range must be between 1 and {MAX_RANGE_DAYS} days'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'doctor': doctor.id,
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat(),
+            'days': build_slot_grid(doctor, date_from, date_to),
+        })
+
+
+class DoctorPatientsView(generics.ListAPIView):
+    """The signed-in doctor's patients with their latest pending and accepted appointment."""
+    query_budget = 4
+    serializer_class = RosterPatientSerializer
+    permission_classes = [IsDoctor]
+    pagination_class = PatientRosterCursorPagination
+    
+    def get_doctor(self):
+        return get_object_or_404(Doctor, user=self.request.user)
+    
+    def list(self, request, *args, **kwargs):
+        doctor = self.get_doctor()
+        page = self.paginate_queryset(patient_roster(doctor))
+        serializer = self.get_serializer(attach_latest_appointments(page, doctor), many=True)
+        return self.get_paginated_response(serializer.data)
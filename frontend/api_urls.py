@@ -1,4 +1,6 @@
 from django.urls import path, include
+from healthcare_backend.metrics import metrics_view
+from .api_views import StatsView
 
 # API URL patterns - consolidating all API routes
 urlpatterns = [
@@ -7,4 +9,6 @@ urlpatterns = [
     path('doctors/', include('doctors.urls')),
     path('appointments/', include('appointments.urls')),
     path('chat/', include('chat.urls')),
+    path('stats/', StatsView.as_view(), name='stats'),
+    path('_metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,13 @@
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from accounts.permissions import IsAdminUser
+from healthcare_backend.stats import get_stats, wants_fresh_stats
+
+
+class StatsView(APIView):
+    """All admin dashboard counters in one response; ?fresh=1 skips the cache."""
+    query_budget = 8
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response(get_stats(fresh=wants_fresh_stats(request)))
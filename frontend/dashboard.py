@@ -0,0 +1,151 @@
+"""
+Cached dashboard summaries.
+
+The dashboard is the login redirect, so each patient's and doctor's summary
+(profile id, appointment counts, latest appointments and messages) is built
+once and stored in the cache under ``dashboard:<user id>``; a repeat visit
+is a single cache get. Summaries hold plain values and dicts rather than
+model instances, so entries stay small and survive model changes. The
+receivers in frontend.signals drop a user's entry after commit when one of
+their appointments is created, changed or deleted, when a message arrives
+for them, or when their profile changes. Entries
+also expire after DASHBOARD_CACHE_TIMEOUT, which bounds how long changes
+nothing signals (such as the other side renaming) can be stale.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Concat
+
+DASHBOARD_CACHE_TIMEOUT = 10 * 60
+DASHBOARD_LIST_SIZE = 5
+
+
+def dashboard_key(user_id):
+    return f'dashboard:{user_id}'
+
+
+def appointment_counts(appointments):
+    return appointments.aggregate(
+        total=Count('pk'),
+        pending=Count('pk', filter=Q(status='pending')),
+        accepted=Count('pk', filter=Q(status='accepted')),
+    )
+
+
+def full_name(user_path):
+    return Concat(F(f'{user_path}__first_name'), Value(' '), F(f'{user_path}__last_name'))
+
+
+def appointment_rows(appointments, partner):
+    """Plain rows of ``appointments``, with the id and name of the ``partner`` ('patient' or 'doctor') user."""
+    return appointments.values(
+        'id', 'appointment_date', 'status',
+        partner_id=F(f'{partner}__user_id'), partner_name=full_name(f'{partner}__user'),
+    )
+
+
+def message_rows(messages):
+    """Plain rows of ``messages`` with their sender's name and the room's appointment id."""
+    return messages.values(
+        'id', 'content', 'timestamp', 'sender_id',
+        sender_name=full_name('sender'), appointment_id=F('chat_room__appointment_id'),
+    )
+
+
+def patient_lists(patient, user):
+    """Querysets of the lists on a patient's dashboard, in display order."""
+    from appointments.models import Appointment
+    from chat.models import Message
+
+    appointments = appointment_rows(Appointment.objects.filter(patient=patient), 'doctor')
+    return {
+        'accepted_appointments': appointments.filter(status='accepted').order_by('-appointment_date'),
+        'recent_appointments': appointments.order_by('-created_at'),
+        'recent_messages': message_rows(Message.objects.filter(
+            chat_room__patient=user,
+            sender__role='doctor'
+        ).order_by('-timestamp')),
+    }
+
+
+def doctor_lists(doctor, user):
+    """Querysets of the lists on a doctor's dashboard, in display order."""
+    from appointments.models import Appointment
+    from chat.models import Message
+
+    appointments = appointment_rows(Appointment.objects.filter(doctor=doctor), 'patient')
+    return {
+        'accepted_appointments': appointments.filter(status='accepted').order_by('-appointment_date'),
+        'pending_appointments': appointments.filter(status='pending').order_by('-created_at'),
+        'recent_appointments': appointments.order_by('-created_at'),
+        'recent_messages': message_rows(Message.objects.filter(
+            chat_room__doctor=user,
+            sender__role='patient'
+        ).order_by('-timestamp')),
+    }
+
+
+def first_items(querysets):
+    return {name: list(queryset[:DASHBOARD_LIST_SIZE]) for name, queryset in querysets.items()}
+
+
+def patient_summary(user):
+    from appointments.models import Appointment
+    from patients.models import Patient
+
+    patient = Patient.objects.filter(user=user).first()
+    if patient is None:
+        return None
+    counts = appointment_counts(Appointment.objects.filter(patient=patient))
+    return {
+        'patient_id': patient.pk,
+        **first_items(patient_lists(patient, user)),
+        'total_appointments': counts['total'],
+        'pending_appointments': counts['pending'],
+        'accepted_count': counts['accepted'],
+    }
+
+
+def doctor_summary(user):
+    from appointments.models import Appointment
+    from doctors.models import Doctor
+
+    doctor = Doctor.objects.filter(user=user).first()
+    if doctor is None:
+        return None
+    counts = appointment_counts(Appointment.objects.filter(doctor=doctor))
+    return {
+        'doctor_id': doctor.pk,
+        **first_items(doctor_lists(doctor, user)),
+        'total_appointments': counts['total'],
+        'pending_count': counts['pending'],
+        'accepted_count': counts['accepted'],
+    }
+
+
+SUMMARIES = {
+    'patient': patient_summary,
+    'doctor': doctor_summary,
+}
+
+
+def get_dashboard_summary(user):
+    """
+    Dashboard context of a patient or doctor, from the cache when possible.
+    None when the user has no profile for their role yet.
+    """
+    key = dashboard_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        summary = SUMMARIES[user.role](user)
+        if summary is not None:
+            cache.set(key, summary, DASHBOARD_CACHE_TIMEOUT)
+    return summary
+
+
+def forget_dashboards(*user_ids):
+    """Drop the cached summaries of ``user_ids`` once the current transaction commits."""
+    keys = [dashboard_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
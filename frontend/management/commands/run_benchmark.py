@@ -0,0 +1,156 @@
+import json
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.utils import timezone
+
+from accounts.authentication import UserRefreshToken
+from accounts.models import User
+from appointments.models import Appointment
+from chat.models import ChatRoom
+from .seed_benchmark import BENCHMARK_DOMAIN
+
+# doctors, patients, appointments, messages per room
+SCALES = {
+    'small': (20, 200, 1000, 10),
+    'medium': (100, 2000, 10000, 20),
+    'large': (500, 10000, 50000, 20),
+}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = ('Seed the benchmark database at several scales and record query counts and '
+            'p50/p95 latencies of the key pages and endpoints as JSON. Flushes the database; '
+            'run with DJANGO_SETTINGS_MODULE=healthcare_backend.settings_benchmark')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', nargs='+', default=['small'], choices=sorted(SCALES))
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--output', default='benchmark-results.json')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('run_benchmark flushes the database; use healthcare_backend.settings_benchmark')
+
+        # Test environment: allows the test client on any host and records template contexts
+        setup_test_environment()
+        results = {
+            'generated_at': timezone.now().isoformat(),
+            'git_commit': self.git_commit(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'scales': [],
+        }
+        for scale in options['scales']:
+            results['scales'].append(self.run_scale(scale, options['iterations']))
+
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def run_scale(self, scale, iterations):
+        doctors, patients, appointments, messages_per_room = SCALES[scale]
+        self.stdout.write(f'== {scale}: seeding')
+        call_command('flush', interactive=False, verbosity=0)
+        cache.clear()
+        started = time.monotonic()
+        call_command(
+            'seed_benchmark', doctors=doctors, patients=patients, appointments=appointments,
+            messages_per_room=messages_per_room, verbosity=0
+        )
+        seed_seconds = time.monotonic() - started
+
+        endpoints = {}
+        for name, client, url in self.endpoints():
+            endpoints[name] = self.measure(client, url, iterations)
+            self.stdout.write(
+                f"{name:<24} {endpoints[name]['queries']:>4} queries  "
+                f"p50 {endpoints[name]['p50_ms']:>8.2f} ms  p95 {endpoints[name]['p95_ms']:>8.2f} ms"
+            )
+        return {
+            'scale': scale,
+            'doctors': doctors,
+            'patients': patients,
+            'appointments': appointments,
+            'messages_per_room': messages_per_room,
+            'seed_seconds': round(seed_seconds, 2),
+            'endpoints': endpoints,
+        }
+
+    def endpoints(self):
+        """(name, client, url) of every measured request, using the busiest generated accounts."""
+        busiest = Appointment.objects.values('doctor__user', 'patient__user').annotate(
+            total=Count('id')
+        ).order_by('-total').first()
+        doctor = User.objects.get(pk=busiest['doctor__user'])
+        patient = User.objects.get(pk=busiest['patient__user'])
+        admin = User.objects.get(email=f'admin@{BENCHMARK_DOMAIN}')
+        room = ChatRoom.objects.filter(patient=patient).order_by('-id').first()
+
+        def session(user):
+            client = Client()
+            client.force_login(user)
+            return client
+
+        def api(user):
+            token = UserRefreshToken.for_user(user).access_token
+            return Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        anonymous = Client()
+        measured = [
+            ('dashboard_patient', session(patient), '/dashboard/'),
+            ('dashboard_doctor', session(doctor), '/dashboard/'),
+            ('chat_page', session(patient), '/chat/'),
+            ('chat_rooms_api', api(patient), '/api/chat/rooms/'),
+            ('doctor_directory_page', anonymous, '/doctors/'),
+            ('doctor_directory_api', anonymous, '/api/doctors/available/'),
+            ('doctor_search_api', anonymous, '/api/doctors/search/?q=card'),
+            ('appointments_page', session(doctor), '/appointments/'),
+            ('appointments_api', api(doctor), '/api/appointments/'),
+            ('stats_api', api(admin), '/api/stats/?fresh=1'),
+        ]
+        if room is not None:
+            measured.append(('message_history_api', api(patient),
+                             f'/api/chat/rooms/{room.id}/messages/?history=1'))
+        return measured
+
+    def measure(self, client, url, iterations):
+        # One warm-up request fills caches the way a running server would have them
+        client.get(url)
+        timings = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+        return {
+            'url': url,
+            'status': response.status_code,
+            'queries': len(queries),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'mean_ms': round(statistics.mean(timings), 2),
+        }
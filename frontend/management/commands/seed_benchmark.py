@@ -0,0 +1,207 @@
+import random
+import time as clock
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User
+from appointments.models import Appointment, Review
+from appointments.rollups import rebuild_rollups
+from chat.models import ChatRoom, Message
+from doctors.directory import bump_directory_version
+from doctors.models import Doctor
+from doctors.ratings import recompute_ratings
+from doctors.search import refresh_search_index
+from patients.models import Patient
+
+# Every generated account uses this email domain, so the data can be removed again
+BENCHMARK_DOMAIN = 'bench.example.com'
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda',
+               'David', 'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica',
+               'Priya', 'Arjun', 'Wei', 'Fatima', 'Carlos', 'Sofia', 'Yuki', 'Omar']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis',
+              'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson', 'Thomas', 'Taylor',
+              'Sharma', 'Singh', 'Chen', 'Khan', 'Silva', 'Rossi', 'Tanaka', 'Haddad']
+HOSPITALS = ['City General Hospital', 'St. Mary Medical Center', 'Riverside Clinic',
+             'Northside Health', 'University Hospital']
+LANGUAGES = ['English', 'English, Spanish', 'English, Hindi', 'English, Mandarin', 'English, French']
+MESSAGES = ['Hello doctor, I have a question about my prescription.',
+            'Sure, how can I help?', 'Should I take it before or after meals?',
+            'After meals, twice a day.', 'Thank you!', 'Please book a follow-up next week.']
+
+# 30 minute slots between 09:00 and 17:30
+SLOTS_PER_DAY = 17
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic doctors, patients, appointments and chat messages for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=500)
+        parser.add_argument('--appointments', type=int, default=5000)
+        parser.add_argument('--messages-per-room', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible data')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true', help='Delete previously generated data first')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = clock.monotonic()
+
+        with transaction.atomic():
+            if options['clear']:
+                deleted, _ = User.objects.filter(email__endswith=f'@{BENCHMARK_DOMAIN}').delete()
+                self.stdout.write(f'Deleted {deleted} existing benchmark rows')
+
+            # Hash once; every generated account shares the same password
+            self.password = make_password(BENCHMARK_PASSWORD)
+            self.create_admin()
+            doctors = self.create_doctors(options['doctors'])
+            patients = self.create_patients(options['patients'])
+            appointments = self.create_appointments(doctors, patients, options['appointments'])
+            rooms = self.create_chat_rooms(appointments, options['messages_per_room'])
+            self.create_messages(rooms, options['messages_per_room'])
+            self.create_reviews(appointments)
+
+            # bulk_create skips signals, so rebuild the derived data in bulk
+            refresh_search_index(Doctor.objects.all())
+            recompute_ratings(self.batch_size)
+            rebuild_rollups(self.batch_size)
+            bump_directory_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(doctors)} doctors, {len(patients)} patients, {len(appointments)} appointments, '
+            f'{len(rooms)} chat rooms in {clock.monotonic() - started:.1f}s'
+        ))
+
+    def make_users(self, role, count):
+        batch = self.random.randrange(10 ** 6)
+        return User.objects.bulk_create([
+            User(
+                email=f'{role}-{batch}-{i}@{BENCHMARK_DOMAIN}',
+                password=self.password,
+                role=role,
+                first_name=self.random.choice(FIRST_NAMES),
+                last_name=self.random.choice(LAST_NAMES),
+                phone_number=f'555{self.random.randrange(10 ** 7):07d}',
+            )
+            for i in range(count)
+        ], batch_size=self.batch_size)
+
+    def create_admin(self):
+        User.objects.get_or_create(
+            email=f'admin@{BENCHMARK_DOMAIN}',
+            defaults={'password': self.password, 'role': 'admin', 'is_staff': True,
+                      'first_name': 'Bench', 'last_name': 'Admin'},
+        )
+
+    def create_doctors(self, count):
+        specializations = [value for value, _ in Doctor.SPECIALIZATION_CHOICES]
+        return Doctor.objects.bulk_create([
+            Doctor(
+                user=user,
+                search_name=user.full_name,
+                specialization=self.random.choice(specializations),
+                experience_years=self.random.randint(1, 35),
+                bio=f'{user.full_name} has been practising for many years.',
+                consultation_fee=self.random.choice([50, 75, 100, 150, 200]),
+                available_from=time(9, 0),
+                available_to=time(17, 30),
+                is_available=self.random.random() < 0.9,
+                hospital_affiliation=self.random.choice(HOSPITALS),
+                languages_spoken=self.random.choice(LANGUAGES),
+            )
+            for user in self.make_users('doctor', count)
+        ], batch_size=self.batch_size)
+
+    def create_patients(self, count):
+        genders = [value for value, _ in Patient.GENDER_CHOICES]
+        blood_groups = [value for value, _ in Patient.BLOOD_GROUP_CHOICES]
+        return Patient.objects.bulk_create([
+            Patient(
+                user=user,
+                gender=self.random.choice(genders),
+                blood_group=self.random.choice(blood_groups),
+                height=self.random.randint(150, 195),
+                weight=self.random.randint(45, 110),
+            )
+            for user in self.make_users('patient', count)
+        ], batch_size=self.batch_size)
+
+    def create_appointments(self, doctors, patients, count):
+        """Spread appointments over consecutive working-hour slots of each doctor, half in the past."""
+        if not doctors or not patients:
+            return []
+        tz = timezone.get_current_timezone()
+        slots_per_doctor = -(-count // len(doctors))
+        first_day = timezone.localdate() - timedelta(days=slots_per_doctor // SLOTS_PER_DAY // 2)
+        now = timezone.now()
+
+        appointments = []
+        for i in range(count):
+            slot = i // len(doctors)
+            day = first_day + timedelta(days=slot // SLOTS_PER_DAY)
+            start = timezone.make_aware(datetime.combine(day, time(9, 0)), tz)
+            appointment_date = start + timedelta(minutes=30 * (slot % SLOTS_PER_DAY))
+            if appointment_date < now:
+                status = self.random.choices(['completed', 'cancelled', 'rejected'], [8, 1, 1])[0]
+            else:
+                status = self.random.choices(['pending', 'accepted'], [1, 2])[0]
+            appointments.append(Appointment(
+                doctor=doctors[i % len(doctors)],
+                patient=self.random.choice(patients),
+                appointment_date=appointment_date,
+                appointment_type=self.random.choice(
+                    [value for value, _ in Appointment.APPOINTMENT_TYPE_CHOICES]
+                ),
+                status=status,
+                reason_for_visit='Routine consultation',
+            ))
+        return Appointment.objects.bulk_create(appointments, batch_size=self.batch_size)
+
+    def create_chat_rooms(self, appointments, messages_per_room):
+        # Patients send the first and every other message; nothing has been read yet
+        return ChatRoom.objects.bulk_create([
+            ChatRoom(
+                appointment=appointment,
+                patient_id=appointment.patient.user_id,
+                doctor_id=appointment.doctor.user_id,
+                doctor_unread_count=(messages_per_room + 1) // 2,
+                patient_unread_count=messages_per_room // 2,
+            )
+            for appointment in appointments
+            if appointment.status in ('accepted', 'completed')
+        ], batch_size=self.batch_size)
+
+    def create_messages(self, rooms, messages_per_room):
+        messages = []
+        for room in rooms:
+            for i in range(messages_per_room):
+                messages.append(Message(
+                    chat_room=room,
+                    sender_id=room.doctor_id if i % 2 else room.patient_id,
+                    content=MESSAGES[i % len(MESSAGES)],
+                ))
+            if len(messages) >= self.batch_size:
+                Message.objects.bulk_create(messages, batch_size=self.batch_size)
+                messages = []
+        Message.objects.bulk_create(messages, batch_size=self.batch_size)
+
+    def create_reviews(self, appointments):
+        Review.objects.bulk_create([
+            Review(
+                appointment=appointment,
+                patient=appointment.patient,
+                doctor=appointment.doctor,
+                rating=self.random.choices([1, 2, 3, 4, 5], [1, 1, 2, 4, 4])[0],
+            )
+            for appointment in appointments
+            if appointment.status == 'completed' and self.random.random() < 0.3
+        ], batch_size=self.batch_size)
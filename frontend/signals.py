@@ -0,0 +1,57 @@
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from accounts.models import User
+from appointments.models import Appointment
+from appointments.signals import appointments_bulk_updated
+from chat.models import Message
+from chat.signals import messages_bulk_created
+from doctors.models import Doctor
+from patients.models import Patient
+from .dashboard import forget_dashboards
+
+
+def participant_user_ids(appointment):
+    """User ids of an appointment's patient and doctor, from loaded profiles or one query."""
+    if Appointment.patient.is_cached(appointment) and Appointment.doctor.is_cached(appointment):
+        return [appointment.patient.user_id, appointment.doctor.user_id]
+    return User.objects.filter(
+        Q(patient_profile=appointment.patient_id) | Q(doctor_profile=appointment.doctor_id)
+    ).values_list('id', flat=True)
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def forget_dashboards_on_appointment_change(sender, instance, **kwargs):
+    """Both participants' dashboards count and list the appointment."""
+    forget_dashboards(*participant_user_ids(instance))
+
+
+@receiver(appointments_bulk_updated, sender=Appointment)
+def forget_dashboards_on_bulk_update(sender, appointments, **kwargs):
+    forget_dashboards(*(user_id for appointment in appointments for user_id in participant_user_ids(appointment)))
+
+
+def recipient_user_ids(message):
+    chat_room = message.chat_room
+    return [user_id for user_id in (chat_room.patient_id, chat_room.doctor_id) if user_id != message.sender_id]
+
+
+@receiver(post_save, sender=Message)
+def forget_recipient_dashboard(sender, instance, created, **kwargs):
+    """Dashboards list the latest messages from the other side."""
+    if created:
+        forget_dashboards(*recipient_user_ids(instance))
+
+
+@receiver(messages_bulk_created, sender=Message)
+def forget_recipient_dashboards(sender, messages, **kwargs):
+    forget_dashboards(*(user_id for message in messages for user_id in recipient_user_ids(message)))
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=Doctor)
+def forget_dashboard_on_profile_change(sender, instance, **kwargs):
+    forget_dashboards(instance.user_id)
@@ -0,0 +1,300 @@
+"""
+Query plans of the dashboard, chat and directory queries, the cached
+dashboard summaries, chat polling and the admin stats endpoint.
+
+Each QueryIndexTests test EXPLAINs a queryset built by the code its view
+runs and checks that the plan uses the index added for it. On PostgreSQL
+sequential scans are turned off, since the planner prefers them on the tiny
+test tables.
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, models
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from appointments.models import Appointment
+from chat.models import ChatRoom, Message
+from appointments.transitions import apply_transitions
+from chat.buffer import persist_messages
+from chat.unread import create_message
+from doctors.models import Doctor
+from frontend.dashboard import DASHBOARD_LIST_SIZE, dashboard_key, doctor_lists, patient_lists
+from frontend.signals import participant_user_ids
+from patients.models import Patient
+
+
+class QueryIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+        )
+        cls.patient_user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        cls.doctor = Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+        cls.patient = Patient.objects.create(user=cls.patient_user)
+        start = timezone.now() + timedelta(days=1)
+        for i, status in enumerate(['pending', 'accepted', 'completed', 'rejected']):
+            Appointment.objects.create(
+                patient=cls.patient, doctor=cls.doctor, appointment_date=start + timedelta(hours=i),
+                reason_for_visit='Checkup', status=status
+            )
+        cls.chat_room = ChatRoom.objects.get(appointment__status='accepted')
+        Message.objects.create(chat_room=cls.chat_room, sender=cls.patient_user, content='Hello')
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'{index_name} is not used:\n{plan}')
+
+    def test_doctor_dashboard_appointments_by_status(self):
+        lists = doctor_lists(self.doctor, self.doctor_user)
+        self.assertUsesIndex(lists['accepted_appointments'][:DASHBOARD_LIST_SIZE], 'appointment_doctor_status_idx')
+
+    def test_doctor_pending_queue(self):
+        lists = doctor_lists(self.doctor, self.doctor_user)
+        self.assertUsesIndex(lists['pending_appointments'][:DASHBOARD_LIST_SIZE], 'appointment_doctor_pending_idx')
+
+    def test_patient_dashboard_appointments_by_status(self):
+        lists = patient_lists(self.patient, self.patient_user)
+        self.assertUsesIndex(lists['accepted_appointments'][:DASHBOARD_LIST_SIZE], 'appointment_patient_status_idx')
+
+    def test_chat_room_list(self):
+        # The queryset of ChatRoomListCreateView, in its default order
+        for user, index_name in ((self.patient_user, 'chatroom_patient_updated_idx'),
+                                 (self.doctor_user, 'chatroom_doctor_updated_idx')):
+            self.assertUsesIndex(
+                ChatRoom.objects.for_user(user).with_summary(user).order_by('-updated_at'), index_name
+            )
+
+    def test_chat_message_history(self):
+        self.assertUsesIndex(
+            Message.objects.filter(chat_room=self.chat_room).order_by('-timestamp', '-id'),
+            'message_room_timestamp_idx'
+        )
+
+    def test_directory_by_specialization(self):
+        self.assertUsesIndex(
+            Doctor.objects.filter(specialization='cardiology', is_available=True).order_by('-rating'),
+            'doctor_available_spec_idx'
+        )
+
+
+class DashboardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+        )
+        cls.patient_user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        cls.doctor = Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+        cls.patient = Patient.objects.create(user=cls.patient_user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.doctor_user)
+
+    def book(self, status='pending'):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, appointment_date=timezone.now() + timedelta(days=1),
+            reason_for_visit='Checkup', status=status
+        )
+
+    def test_repeat_views_are_served_from_the_cache(self):
+        self.book()
+        self.client.get('/dashboard/')
+        with self.assertNumQueries(2):  # session and user
+            response = self.client.get('/dashboard/')
+        self.assertEqual(response.context['pending_count'], 1)
+
+    def test_building_a_summary_takes_a_fixed_number_of_queries(self):
+        for _ in range(3):
+            chat_room = ChatRoom.objects.get(appointment=self.book(status='accepted'))
+            create_message(chat_room, self.patient_user, content='Hello')
+            create_message(chat_room, self.doctor_user, content='Hi')
+        self.book()
+        # Session, user, profile, counts and four lists
+        with self.assertNumQueries(8):
+            response = self.client.get('/dashboard/')
+        self.assertEqual((response.context['accepted_count'], response.context['pending_count']), (3, 1))
+        self.client.force_login(self.patient_user)
+        # Session, user, profile, counts and three lists
+        with self.assertNumQueries(7):
+            response = self.client.get('/dashboard/')
+        self.assertEqual(len(response.context['recent_messages']), 3)
+
+    def test_appointment_changes_drop_both_dashboards(self):
+        self.client.get('/dashboard/')
+        cache.set(dashboard_key(self.patient_user.pk), {'total_appointments': 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = self.book()
+        self.assertIsNone(cache.get(dashboard_key(self.doctor_user.pk)))
+        self.assertIsNone(cache.get(dashboard_key(self.patient_user.pk)))
+
+        self.client.get('/dashboard/')
+        appointment.status = 'accepted'
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save(update_fields=['status', 'updated_at'])
+        response = self.client.get('/dashboard/')
+        self.assertEqual((response.context['pending_count'], response.context['accepted_count']), (0, 1))
+
+    def test_messages_drop_the_recipient_dashboard_only(self):
+        chat_room = ChatRoom.objects.get(appointment=self.book(status='accepted'))
+        self.client.get('/dashboard/')
+        cache.set(dashboard_key(self.patient_user.pk), {'recent_messages': []})
+        with self.captureOnCommitCallbacks(execute=True):
+            create_message(chat_room, self.doctor_user, content='Hello')
+        self.assertIsNotNone(cache.get(dashboard_key(self.doctor_user.pk)))
+        self.assertIsNone(cache.get(dashboard_key(self.patient_user.pk)))
+
+    def test_summaries_are_cached_as_plain_data(self):
+        chat_room = ChatRoom.objects.get(appointment=self.book(status='accepted'))
+        create_message(chat_room, self.patient_user, content='Hello')
+        response = self.client.get('/dashboard/')
+        self.assertContains(response, f'?partner={self.patient_user.pk}&appointment={chat_room.appointment_id}')
+        self.assertContains(response, 'Pat Roe')
+
+        def walk(value):
+            self.assertNotIsInstance(value, models.Model)
+            for item in value.values() if isinstance(value, dict) else value if isinstance(value, list) else ():
+                walk(item)
+
+        summary = cache.get(dashboard_key(self.doctor_user.pk))
+        walk(summary)
+        self.assertEqual(summary['recent_messages'][0]['sender_name'], 'Pat Roe')
+        self.assertEqual(summary['accepted_appointments'][0]['partner_id'], self.patient_user.pk)
+
+    def test_participants_are_resolved_from_loaded_profiles_or_one_query(self):
+        appointment = Appointment.objects.get(pk=self.book().pk)
+        with self.assertNumQueries(1):
+            self.assertCountEqual(participant_user_ids(appointment), [self.patient_user.pk, self.doctor_user.pk])
+        loaded = Appointment.objects.select_related('patient', 'doctor').get(pk=appointment.pk)
+        with self.assertNumQueries(0):
+            self.assertCountEqual(participant_user_ids(loaded), [self.patient_user.pk, self.doctor_user.pk])
+
+    def test_deleting_an_appointment_drops_both_dashboards(self):
+        appointment = Appointment.objects.get(pk=self.book().pk)
+        cache.set(dashboard_key(self.patient_user.pk), {})
+        cache.set(dashboard_key(self.doctor_user.pk), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+        self.assertIsNone(cache.get(dashboard_key(self.patient_user.pk)))
+        self.assertIsNone(cache.get(dashboard_key(self.doctor_user.pk)))
+
+    def test_bulk_status_changes_drop_both_dashboards(self):
+        appointment = self.book()
+        cache.set(dashboard_key(self.patient_user.pk), {})
+        cache.set(dashboard_key(self.doctor_user.pk), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_transitions(self.doctor, [{'id': appointment.id, 'status': 'accepted'}])
+        self.assertIsNone(cache.get(dashboard_key(self.patient_user.pk)))
+        self.assertIsNone(cache.get(dashboard_key(self.doctor_user.pk)))
+
+    def test_buffered_messages_drop_the_recipient_dashboard_only(self):
+        chat_room = ChatRoom.objects.get(appointment=self.book(status='accepted'))
+        cache.set(dashboard_key(self.patient_user.pk), {})
+        cache.set(dashboard_key(self.doctor_user.pk), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            persist_messages([Message(chat_room=chat_room, sender=self.doctor_user, content='Hello')])
+        self.assertIsNone(cache.get(dashboard_key(self.patient_user.pk)))
+        self.assertIsNotNone(cache.get(dashboard_key(self.doctor_user.pk)))
+
+
+class ChatPollingTests(TestCase):
+    def setUp(self):
+        doctor_user = User.objects.create_user(
+            email='doctor@example.com', password='password', first_name='Dana', last_name='Doe', role='doctor'
+        )
+        self.patient_user = User.objects.create_user(
+            email='patient@example.com', password='password', first_name='Pat', last_name='Roe', role='patient'
+        )
+        self.appointment = Appointment.objects.create(
+            patient=Patient.objects.create(user=self.patient_user),
+            doctor=Doctor.objects.create(user=doctor_user, specialization='cardiology'),
+            appointment_date=timezone.now() + timedelta(days=1), reason_for_visit='Checkup', status='accepted'
+        )
+        self.chat_room = ChatRoom.objects.get(appointment=self.appointment)
+        self.messages = [create_message(self.chat_room, doctor_user, content=f'Message {i}') for i in range(3)]
+        self.client.force_login(self.patient_user)
+        self.url = f'/chat/messages/{self.appointment.id}/'
+
+    @mock.patch('frontend.views.CHAT_PAGE_SIZE', 2)
+    def test_since_returns_at_most_a_page(self):
+        data = self.client.get(self.url, {'since': 0}).json()
+        self.assertEqual([message['id'] for message in data['messages']], [message.id for message in self.messages[:2]])
+        self.assertEqual(data['last_id'], self.messages[1].id)
+        self.assertTrue(data['has_more'])
+
+        response = self.client.get(self.url, {'since': data['last_id']})
+        data = response.json()
+        self.assertEqual([message['id'] for message in data['messages']], [self.messages[2].id])
+        self.assertFalse(data['has_more'])
+
+        response = self.client.get(self.url, {'since': data['last_id']}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'abc'}).status_code, 400)
+
+
+class StatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(email='admin@example.com', password='password', role='admin')
+        doctor_user = User.objects.create_user(email='doctor@example.com', password='password', role='doctor')
+        cls.patient_user = User.objects.create_user(email='patient@example.com', password='password', role='patient')
+        doctor = Doctor.objects.create(user=doctor_user, specialization='cardiology')
+        patient = Patient.objects.create(user=cls.patient_user, gender='F', blood_group='O+')
+        for status in ('accepted', 'pending', 'pending'):
+            Appointment.objects.create(
+                patient=patient, doctor=doctor, appointment_date=timezone.now(),
+                reason_for_visit='Checkup', status=status
+            )
+        create_message(ChatRoom.objects.get(patient=cls.patient_user), doctor_user, content='Hello')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_payload_and_query_count(self):
+        with self.assertNumQueries(6):
+            stats = self.client.get('/api/stats/').json()
+        self.assertEqual(stats['users'], {
+            'total_users': 3, 'active_users': 3, 'patients': 1, 'doctors': 1, 'admins': 1, 'general_users': 0,
+        })
+        self.assertEqual(stats['doctors']['by_specialization'], [{'specialization': 'cardiology', 'count': 1}])
+        self.assertEqual(stats['patients']['by_gender'], [{'gender': 'F', 'count': 1}])
+        self.assertEqual(stats['patients']['by_blood_group'], [{'blood_group': 'O+', 'count': 1}])
+        self.assertEqual(stats['appointments']['total_appointments'], 3)
+        self.assertEqual(stats['appointments']['today_appointments'], 3)
+        self.assertEqual(stats['appointments']['by_status'], [
+            {'status': 'pending', 'count': 2}, {'status': 'accepted', 'count': 1},
+        ])
+        self.assertEqual(stats['chat'], {'total_chat_rooms': 1, 'active_chat_rooms': 1, 'total_messages': 1})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/stats/').json(), stats)
+        with self.assertNumQueries(6):
+            self.client.get('/api/stats/?fresh=1')
+
+    def test_only_admins_see_stats(self):
+        self.client.force_authenticate(self.patient_user)
+        self.assertEqual(self.client.get('/api/stats/').status_code, 403)
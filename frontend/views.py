@@ -1,14 +1,24 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
+from accounts.hashing import HashingBusy, aauthenticate
 from accounts.models import User
 import requests
 from django.conf import settings
+from django.db import transaction
 import json
 from datetime import datetime, date, time
 from django.utils import timezone
+from healthcare_backend.metrics import query_budget
+
+# Rendering reads the session and request.user, which query the database
+arender = sync_to_async(render)
+
+# Number of messages rendered per chat page / "load older" request
+CHAT_PAGE_SIZE = 50
 
 def home(request):
     """Home page with overview of the healthcare system"""
@@ -18,15 +28,19 @@ def home(request):
     }
     return render(request, 'frontend/home.html', context)
 
-def login_view(request):
-    """Login page and handling"""
+async def login_view(request):
+    """Login page and handling; the password check awaits the hashing pool"""
     if request.method == 'POST':
         email = request.POST.get('email')
         password = request.POST.get('password')
         
-        user = authenticate(request, username=email, password=password)
+        try:
+            user = await aauthenticate(email, password)
+        except HashingBusy as exc:
+            messages.error(request, str(exc))
+            return await arender(request, 'frontend/login.html', status=503)
         if user:
-            login(request, user)
+            await sync_to_async(login)(request, user)
             messages.success(request, f'Welcome back, {user.first_name}!')
             # Redirect to dashboard or next URL
             next_url = request.GET.get('next', 'frontend:dashboard')
@@ -36,7 +50,7 @@ def login_view(request):
         else:
             messages.error(request, 'Invalid email or password.')
     
-    return render(request, 'frontend/login.html')
+    return await arender(request, 'frontend/login.html')
 
 def logout_view(request):
     """Logout and redirect to home"""
@@ -44,8 +58,8 @@ def logout_view(request):
     messages.success(request, 'You have been logged out successfully.')
     return redirect('frontend:home')
 
-def register_view(request):
-    """Registration page and handling"""
+async def register_view(request):
+    """Registration page and handling; the password is hashed in the hashing pool"""
     if request.method == 'POST':
         email = request.POST.get('email')
         password = request.POST.get('password')
@@ -59,14 +73,14 @@ def register_view(request):
         # Validation
         if password != confirm_password:
             messages.error(request, 'Passwords do not match.')
-        elif User.objects.filter(email=email).exists():
+        elif await User.objects.filter(email=email).aexists():
             messages.error(request, 'Email already exists.')
         elif role not in ['patient', 'doctor', 'user']:
             messages.error(request, 'Invalid role selected.')
         else:
             try:
                 # Create user
-                user = User.objects.create_user(
+                user = await User.objects.acreate_user(
                     email=email,
                     password=password,
                     first_name=first_name,
@@ -78,11 +92,15 @@ def register_view(request):
                 
                 messages.success(request, f'Registration successful! You can now login as a {role}.')
                 return redirect('frontend:login')
+            except HashingBusy as exc:
+                messages.error(request, str(exc))
+                return await arender(request, 'frontend/register.html', status=503)
             except Exception as e:
                 messages.error(request, f'Registration failed: {str(e)}')
     
-    return render(request, 'frontend/register.html')
+    return await arender(request, 'frontend/register.html')
 
+@query_budget(8)
 @login_required
 def dashboard(request):
     """Enhanced dashboard with real-time messaging"""
@@ -93,91 +111,17 @@ def dashboard(request):
         'title': f'{user.role.title()} Dashboard'
     }
     
-    from appointments.models import Appointment
-    from doctors.models import Doctor
-    from patients.models import Patient
-    from chat.models import ChatRoom, Message
+    from frontend.dashboard import get_dashboard_summary
     
-    # Add role-specific data with messaging
-    if user.role == 'patient':
-        try:
-            patient = Patient.objects.get(user=user)
-            
-            # Get patient's accepted appointments for messaging
-            accepted_appointments = Appointment.objects.filter(
-                patient=patient,
-                status='accepted'
-            ).select_related('doctor__user').order_by('-appointment_date')
-            
-            # Get recent appointments
-            recent_appointments = Appointment.objects.filter(
-                patient=patient
-            ).select_related('doctor__user').order_by('-created_at')[:5]
-            
-            # Get recent messages from doctors
-            recent_messages = Message.objects.filter(
-                chat_room__patient=user,
-                sender__role='doctor'
-            ).select_related('sender', 'chat_room__appointment__doctor__user').order_by('-timestamp')[:5]
-            
-            context.update({
-                'template': 'frontend/patient_dashboard.html',
-                'patient': patient,
-                'accepted_appointments': accepted_appointments,
-                'recent_appointments': recent_appointments,
-                'recent_messages': recent_messages,
-                'total_appointments': Appointment.objects.filter(patient=patient).count(),
-                'pending_appointments': Appointment.objects.filter(patient=patient, status='pending').count(),
-                'accepted_count': accepted_appointments.count(),
-            })
-            
-        except Patient.DoesNotExist:
-            context['template'] = 'frontend/patient_dashboard.html'
-            
-    elif user.role == 'doctor':
-        try:
-            doctor = Doctor.objects.get(user=user)
-            
-            # Get doctor's accepted appointments for messaging
-            accepted_appointments = Appointment.objects.filter(
-                doctor=doctor,
-                status='accepted'
-            ).select_related('patient__user').order_by('-appointment_date')
-            
-            # Get pending appointments for review
-            pending_appointments = Appointment.objects.filter(
-                doctor=doctor,
-                status='pending'
-            ).select_related('patient__user').order_by('-created_at')
-            
-            # Get recent appointments
-            recent_appointments = Appointment.objects.filter(
-                doctor=doctor
-            ).select_related('patient__user').order_by('-created_at')[:5]
-            
-            # Get recent messages from patients
-            recent_messages = Message.objects.filter(
-                chat_room__doctor=user,
-                sender__role='patient'
-            ).select_related('sender', 'chat_room__appointment__patient__user').order_by('-timestamp')[:5]
-            
-            context.update({
-                'template': 'frontend/doctor_dashboard.html',
-                'doctor': doctor,
-                'accepted_appointments': accepted_appointments,
-                'pending_appointments': pending_appointments,
-                'recent_appointments': recent_appointments,
-                'recent_messages': recent_messages,
-                'total_appointments': Appointment.objects.filter(doctor=doctor).count(),
-                'pending_count': pending_appointments.count(),
-                'accepted_count': accepted_appointments.count(),
-            })
+    # Add role-specific data with messaging, cached per user
+    if user.role in ('patient', 'doctor'):
+        context['template'] = f'frontend/{user.role}_dashboard.html'
+        summary = get_dashboard_summary(user)
+        if summary is not None:
+            context.update(summary)
+        elif user.role == 'doctor':
+            context['error'] = 'Please complete your doctor profile first.'
             
-        except Doctor.DoesNotExist:
-            context.update({
-                'template': 'frontend/doctor_dashboard.html',
-                'error': 'Please complete your doctor profile first.'
-            })
     elif user.role == 'admin':
         context['template'] = 'frontend/admin_dashboard.html'
     else:
@@ -185,16 +129,37 @@ def dashboard(request):
     
     return render(request, 'frontend/dashboard.html', context)
 
+@query_budget(5)
 def doctors_list(request):
     """Public doctors listing - only registered doctors"""
     from doctors.models import Doctor
+    from doctors.directory import get_cached_rows
+    
+    def build_directory():
+        doctors = [
+            {
+                'id': row['id'],
+                'specialization': row['specialization'],
+                'experience_years': row['experience_years'],
+                'consultation_fee': row['consultation_fee'],
+                'education': row['education'],
+                'user': {
+                    'first_name': row['user__first_name'],
+                    'last_name': row['user__last_name'],
+                    'email': row['user__email'],
+                    'phone_number': row['user__phone_number'],
+                },
+            }
+            for row in Doctor.objects.filter(user__is_active=True).values(
+                'id', 'specialization', 'experience_years', 'consultation_fee', 'education',
+                'user__first_name', 'user__last_name', 'user__email', 'user__phone_number'
+            )
+        ]
+        # Unique specializations for the filter
+        specializations = sorted({doctor['specialization'] for doctor in doctors if doctor['specialization']})
+        return doctors, specializations
     
-    doctors = Doctor.objects.select_related('user').filter(user__is_active=True)
-    
-    # Get unique specializations for the filter
-    specializations = Doctor.objects.filter(
-        specialization__isnull=False
-    ).exclude(specialization='').values_list('specialization', flat=True).distinct()
+    doctors, specializations = get_cached_rows('frontend:doctors_list', build_directory)
     
     context = {
         'title': 'Our Doctors',
@@ -265,6 +230,7 @@ def appointments(request):
     
     return render(request, 'frontend/appointments.html', context)
 
+@query_budget(6)
 @login_required
 def patients(request):
     """Patients page with role-based access"""
@@ -272,36 +238,15 @@ def patients(request):
     
     if user.role == 'doctor':
         # Doctors see appointment requests and their patients
-        from appointments.models import Appointment
-        from patients.models import Patient
-        
-        # Get appointments for this doctor
         try:
             from doctors.models import Doctor
-            doctor = Doctor.objects.get(user=user)
+            from doctors.roster import attach_latest_appointments, patient_roster
+            doctor = Doctor.objects.select_related('user').get(user=user)
             
-            # Get all patients with appointments to this doctor
-            patients = Patient.objects.filter(
-                appointments__doctor=doctor
-            ).select_related('user').distinct()
-            
-            # Add pending appointment info to each patient
-            for patient in patients:
-                pending_appointment = Appointment.objects.filter(
-                    patient=patient, 
-                    doctor=doctor, 
-                    status='pending'
-                ).first()
-                patient.pending_appointment = pending_appointment
-                
-                # Set current doctor for confirmed appointments
-                confirmed_appointment = Appointment.objects.filter(
-                    patient=patient, 
-                    doctor=doctor, 
-                    status='confirmed'
-                ).first()
-                if confirmed_appointment:
-                    patient.current_doctor = doctor
+            # Patients who booked with this doctor, with their latest pending and accepted appointment
+            patients = attach_latest_appointments(
+                patient_roster(doctor).order_by('user__first_name', 'user__last_name', 'id'), doctor
+            )
             
             context = {
                 'title': 'My Patients',
@@ -347,6 +292,7 @@ def patients(request):
     
     return render(request, 'frontend/patients.html', context)
 
+@query_budget(8)
 @login_required
 @login_required
 @login_required
@@ -360,6 +306,7 @@ def chat(request):
     from patients.models import Patient
     from appointments.models import Appointment
     from chat.models import ChatRoom, Message
+    from chat.unread import create_message, mark_room_read
     
     context = {
         'title': 'Messages',
@@ -373,27 +320,20 @@ def chat(request):
         
         if message_content and appointment_id:
             try:
-                appointment = Appointment.objects.get(
+                appointment = Appointment.objects.select_related('patient', 'doctor').get(
                     id=appointment_id,
                     status='accepted'
                 )
                 
                 # Verify user has access to this chat
-                if (user.role == 'doctor' and appointment.doctor.user == user) or \
-                   (user.role == 'patient' and appointment.patient.user == user):
+                if (user.role == 'doctor' and appointment.doctor.user_id == user.id) or \
+                   (user.role == 'patient' and appointment.patient.user_id == user.id):
                     
                     # Get or create chat room
-                    chat_room, created = ChatRoom.objects.get_or_create(
-                        appointment=appointment,
-                        defaults={
-                            'patient': appointment.patient.user,
-                            'doctor': appointment.doctor.user,
-                            'is_active': True
-                        }
-                    )
+                    chat_room, created = ChatRoom.objects.get_or_create_for_appointment(appointment)
                     
                     # Create message
-                    Message.objects.create(
+                    create_message(
                         chat_room=chat_room,
                         sender=user,
                         content=message_content,
@@ -419,194 +359,174 @@ def chat(request):
                         'error': 'Invalid appointment'
                     })
     
-    # Get chat conversations based on user role
-    if user.role == 'doctor':
-        try:
-            doctor = Doctor.objects.get(user=user)
-            # Get all accepted appointments for this doctor
-            accepted_appointments = Appointment.objects.filter(
-                doctor=doctor,
-                status='accepted'
-            ).select_related('patient__user')
-            
-            # Create conversations list
-            conversations = []
-            for apt in accepted_appointments:
-                # Get or create chat room for message count
-                chat_room, created = ChatRoom.objects.get_or_create(
-                    appointment=apt,
-                    defaults={
-                        'patient': apt.patient.user,
-                        'doctor': apt.doctor.user,
-                        'is_active': True
-                    }
-                )
-                
-                # Get latest message
-                latest_message = Message.objects.filter(chat_room=chat_room).order_by('-timestamp').first()
-                
-                conversations.append({
-                    'partner': apt.patient.user,
-                    'appointment': apt,
-                    'partner_name': apt.patient.user.get_full_name(),
-                    'partner_role': 'Patient',
-                    'latest_message': latest_message.content[:30] + '...' if latest_message else 'No messages yet',
-                    'latest_time': latest_message.timestamp if latest_message else apt.created_at,
-                    'unread_count': Message.objects.filter(
-                        chat_room=chat_room,
-                        sender=apt.patient.user,
-                        is_read=False
-                    ).count()
-                })
-            
-            context['conversations'] = conversations
-            
-        except Doctor.DoesNotExist:
-            context['error'] = 'Please complete your doctor profile first.'
-            
-    elif user.role == 'patient':
-        try:
-            patient = Patient.objects.get(user=user)
-            # Get all accepted appointments for this patient
-            accepted_appointments = Appointment.objects.filter(
-                patient=patient,
-                status='accepted'
-            ).select_related('doctor__user')
-            
-            # Create conversations list
-            conversations = []
-            for apt in accepted_appointments:
-                # Get or create chat room for message count
-                chat_room, created = ChatRoom.objects.get_or_create(
-                    appointment=apt,
-                    defaults={
-                        'patient': apt.patient.user,
-                        'doctor': apt.doctor.user,
-                        'is_active': True
-                    }
-                )
-                
-                # Get latest message
-                latest_message = Message.objects.filter(chat_room=chat_room).order_by('-timestamp').first()
-                
-                conversations.append({
-                    'partner': apt.doctor.user,
-                    'appointment': apt,
-                    'partner_name': f'Dr. {apt.doctor.user.get_full_name()}',
-                    'partner_role': 'Doctor',
-                    'latest_message': latest_message.content[:30] + '...' if latest_message else 'No messages yet',
-                    'latest_time': latest_message.timestamp if latest_message else apt.created_at,
-                    'unread_count': Message.objects.filter(
-                        chat_room=chat_room,
-                        sender=apt.doctor.user,
-                        is_read=False
-                    ).count()
-                })
-            
-            context['conversations'] = conversations
-            
-        except Patient.DoesNotExist:
-            context['error'] = 'Please complete your patient profile first.'
+    # Get chat conversations based on user role; rooms are opened when an appointment is accepted
+    if user.role in ['doctor', 'patient']:
+        chat_rooms = ChatRoom.objects.for_user(user).filter(
+            appointment__status='accepted'
+        ).with_summary(user).order_by('-appointment__appointment_date', '-appointment__created_at')
+        
+        conversations = []
+        for chat_room in chat_rooms:
+            if user.role == 'doctor':
+                partner = chat_room.patient
+                partner_name = partner.get_full_name()
+                partner_role = 'Patient'
+            else:
+                partner = chat_room.doctor
+                partner_name = f'Dr. {partner.get_full_name()}'
+                partner_role = 'Doctor'
+            
+            has_messages = chat_room.last_message_id is not None
+            conversations.append({
+                'partner': partner,
+                'appointment': chat_room.appointment,
+                'partner_name': partner_name,
+                'partner_role': partner_role,
+                'latest_message': chat_room.last_message_content[:30] + '...' if has_messages else 'No messages yet',
+                'latest_time': chat_room.last_message_timestamp if has_messages else chat_room.appointment.created_at,
+                'unread_count': chat_room.unread_count
+            })
+        
+        context['conversations'] = conversations
+        
+        if not conversations:
+            if user.role == 'doctor' and not Doctor.objects.filter(user=user).exists():
+                context['error'] = 'Please complete your doctor profile first.'
+            elif user.role == 'patient' and not Patient.objects.filter(user=user).exists():
+                context['error'] = 'Please complete your patient profile first.'
     
     # If specific chat partner is selected, get chat messages
     if chat_partner_id and appointment_id:
         try:
-            appointment = Appointment.objects.get(
+            appointment = Appointment.objects.select_related('patient', 'doctor').get(
                 id=appointment_id,
                 status='accepted'
             )
             
             # Verify user has access to this chat
-            if (user.role == 'doctor' and appointment.doctor.user == user) or \
-               (user.role == 'patient' and appointment.patient.user == user):
+            if (user.role == 'doctor' and appointment.doctor.user_id == user.id) or \
+               (user.role == 'patient' and appointment.patient.user_id == user.id):
                 
-                # Get or create chat room
-                chat_room, created = ChatRoom.objects.get_or_create(
-                    appointment=appointment,
-                    defaults={
-                        'patient': appointment.patient.user,
-                        'doctor': appointment.doctor.user,
-                        'is_active': True
-                    }
-                )
+                chat_room = ChatRoom.objects.get(appointment=appointment)
                 
-                # Get all messages in this chat room
-                messages = Message.objects.filter(
+                # Get the latest messages in this chat room; older ones are loaded on demand
+                messages = list(Message.objects.filter(
                     chat_room=chat_room
-                ).select_related('sender').order_by('timestamp')
+                ).select_related('sender').order_by('-id')[:CHAT_PAGE_SIZE + 1])
+                has_older_messages = len(messages) > CHAT_PAGE_SIZE
+                messages = messages[:CHAT_PAGE_SIZE][::-1]
                 
                 # Mark messages as read for the current user
-                Message.objects.filter(
-                    chat_room=chat_room,
-                    is_read=False
-                ).exclude(sender=user).update(is_read=True)
+                mark_room_read(chat_room, user)
                 
                 context['active_chat'] = {
                     'appointment': appointment,
                     'partner': User.objects.get(id=chat_partner_id),
                     'messages': messages,
+                    'last_message_id': max([msg.id for msg in messages], default=0),
+                    'has_older_messages': has_older_messages,
                     'chat_room': chat_room
                 }
                 
-        except (Appointment.DoesNotExist, User.DoesNotExist):
+        except (Appointment.DoesNotExist, ChatRoom.DoesNotExist, User.DoesNotExist):
             context['error'] = 'Chat conversation not found.'
     
     return render(request, 'frontend/chat.html', context)
 
+@query_budget(6)
 @login_required
 def get_chat_messages(request, appointment_id):
-    """AJAX endpoint to get chat messages"""
-    from django.http import JsonResponse
+    """
+    AJAX endpoint to get chat messages. With ?since=<message_id> up to a
+    page of newer messages is returned, with ``has_more`` set when there
+    are more to fetch; If-None-Match is answered with 304 when the
+    conversation has not changed. With ?before=<message_id> the previous
+    page of older messages is returned instead.
+    """
+    from django.http import JsonResponse, HttpResponseNotModified
+    from django.utils.http import parse_etags
     from chat.models import ChatRoom, Message
-    from appointments.models import Appointment
+    from chat.unread import mark_room_read
     
     try:
-        appointment = Appointment.objects.get(
-            id=appointment_id,
-            status='accepted'
-        )
+        chat_room = ChatRoom.objects.select_related('patient', 'doctor').filter(
+            appointment_id=appointment_id,
+            appointment__status='accepted'
+        ).first()
+        if not chat_room:
+            return JsonResponse({'error': 'Appointment not found'}, status=404)
         
         # Verify user has access to this chat
         user = request.user
-        if not ((user.role == 'doctor' and appointment.doctor.user == user) or \
-                (user.role == 'patient' and appointment.patient.user == user)):
+        if user.id not in (chat_room.patient_id, chat_room.doctor_id):
             return JsonResponse({'error': 'Access denied'}, status=403)
         
-        # Get chat room
-        chat_room = ChatRoom.objects.filter(appointment=appointment).first()
-        if not chat_room:
-            return JsonResponse({'messages': []})
+        try:
+            since = int(request.GET.get('since', 0))
+            before = int(request.GET['before']) if request.GET.get('before') else None
+        except ValueError:
+            return JsonResponse({'error': 'Invalid since or before parameter'}, status=400)
         
-        # Get messages
-        messages = Message.objects.filter(
-            chat_room=chat_room
-        ).select_related('sender').order_by('timestamp')
+        names = {
+            chat_room.patient_id: chat_room.patient.get_full_name(),
+            chat_room.doctor_id: chat_room.doctor.get_full_name(),
+        }
         
-        # Mark unread messages as read
-        Message.objects.filter(
+        def message_data(msg):
+            return {
+                'id': msg['id'],
+                'content': msg['content'],
+                'sender_name': names.get(msg['sender_id'], ''),
+                'is_own_message': msg['sender_id'] == user.id,
+                'timestamp': timezone.localtime(msg['timestamp']).strftime('%b %d, %H:%M'),
+                'timestamp_iso': msg['timestamp'].isoformat()
+            }
+        
+        if before is not None:
+            # "Load older": one page before the given message, found through the (chat_room, id) index
+            older = list(Message.objects.filter(
+                chat_room=chat_room,
+                id__lt=before
+            ).order_by('-id').values('id', 'sender_id', 'content', 'timestamp')[:CHAT_PAGE_SIZE + 1])
+            return JsonResponse({
+                'messages': [message_data(msg) for msg in reversed(older[:CHAT_PAGE_SIZE])],
+                'has_more': len(older) > CHAT_PAGE_SIZE,
+                'success': True
+            })
+        
+        latest_id = chat_room.latest_message_id()
+        etag = chat_room.messages_etag(since, latest_id)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        
+        # Get at most a page of messages
+        messages = list(Message.objects.filter(
             chat_room=chat_room,
-            is_read=False
-        ).exclude(sender=user).update(is_read=True)
+            id__gt=since
+        ).order_by('id').values('id', 'sender_id', 'content', 'timestamp')[:CHAT_PAGE_SIZE + 1])
+        
+        # Mark unread messages as read
+        if chat_room.unread_count_for(user.id):
+            mark_room_read(chat_room, user)
         
         # Format messages for JSON response
-        messages_data = []
-        for msg in messages:
-            messages_data.append({
-                'id': msg.id,
-                'content': msg.content,
-                'sender_name': msg.sender.get_full_name(),
-                'is_own_message': msg.sender == user,
-                'timestamp': msg.timestamp.strftime('%M d, %H:%i'),
-                'timestamp_iso': msg.timestamp.isoformat()
-            })
+        messages_data = [message_data(msg) for msg in messages[:CHAT_PAGE_SIZE]]
+        last_id = max([since] + [msg['id'] for msg in messages_data])
+        has_more = len(messages) > CHAT_PAGE_SIZE
         
-        return JsonResponse({
+        response = JsonResponse({
             'messages': messages_data,
+            'last_id': last_id,
+            'has_more': has_more,
             'success': True
         })
+        if not has_more:
+            # Matches the next poll, which starts after last_id
+            response['ETag'] = chat_room.messages_etag(last_id, latest_id)
+        return response
         
-    except Appointment.DoesNotExist:
-        return JsonResponse({'error': 'Appointment not found'}, status=404)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -690,6 +610,7 @@ def book_appointment(request):
     from doctors.models import Doctor
     from patients.models import Patient
     from appointments.models import Appointment
+    from appointments.availability import SlotUnavailable, reserve_slot
     from datetime import datetime, date
     
     if request.method == 'POST':
@@ -733,21 +654,28 @@ def book_appointment(request):
                 datetime.strptime(appointment_time, '%H:%M').time()
             )
             
-            appointment = Appointment.objects.create(
-                patient=patient,
-                doctor=doctor,
-                appointment_date=timezone.make_aware(appointment_datetime),
-                reason_for_visit=symptoms,
-                symptoms=symptoms,
-                appointment_type=appointment_type,
-                status='pending'
-            )
+            appointment_datetime = timezone.make_aware(appointment_datetime)
+            
+            # Lock the doctor's schedule so two patients can't book the same slot
+            with transaction.atomic():
+                reserve_slot(doctor, appointment_datetime)
+                appointment = Appointment.objects.create(
+                    patient=patient,
+                    doctor=doctor,
+                    appointment_date=appointment_datetime,
+                    reason_for_visit=symptoms,
+                    symptoms=symptoms,
+                    appointment_type=appointment_type,
+                    status='pending'
+                )
             
             messages.success(request, f'Appointment request sent to Dr. {doctor.user.get_full_name()}. You will be notified once approved.')
             return redirect('frontend:appointments')
             
         except Doctor.DoesNotExist:
             messages.error(request, 'Selected doctor not found.')
+        except SlotUnavailable as e:
+            messages.error(request, str(e))
         except Exception as e:
             messages.error(request, f'Error booking appointment: {str(e)}')
     
@@ -779,7 +707,7 @@ def approve_appointment(request, appointment_id):
     try:
         appointment = Appointment.objects.get(id=appointment_id, doctor__user=request.user)
         appointment.status = 'accepted'
-        appointment.save()
+        appointment.save(update_fields=['status', 'updated_at'])
         
         messages.success(request, f'Appointment with {appointment.patient.user.get_full_name()} has been approved.')
     except Appointment.DoesNotExist:
@@ -800,7 +728,7 @@ def reject_appointment(request, appointment_id):
     try:
         appointment = Appointment.objects.get(id=appointment_id, doctor__user=request.user)
         appointment.status = 'rejected'
-        appointment.save()
+        appointment.save(update_fields=['status', 'updated_at'])
         
         messages.info(request, f'Appointment with {appointment.patient.user.get_full_name()} has been rejected.')
     except Appointment.DoesNotExist:
@@ -821,7 +749,7 @@ def complete_appointment(request, appointment_id):
     try:
         appointment = Appointment.objects.get(id=appointment_id, doctor__user=request.user)
         appointment.status = 'completed'
-        appointment.save()
+        appointment.save(update_fields=['status', 'updated_at'])
         
         messages.success(request, f'Appointment with {appointment.patient.user.get_full_name()} marked as completed.')
     except Appointment.DoesNotExist:
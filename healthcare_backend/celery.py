@@ -0,0 +1,13 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'healthcare_backend.settings')
+
+app = Celery('healthcare_backend')
+
+# CELERY_* Django settings configure the app
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Loads tasks.py of every installed app
+app.autodiscover_tasks()
@@ -0,0 +1,161 @@
+"""
+Resized, re-encoded variants of uploaded images.
+
+Background tasks (accounts.tasks, chat.tasks) render the variants with
+Pillow and store them next to the original: ``profile_pics/me.png`` gets
+``profile_pics/me.thumb.jpg`` and ``profile_pics/me.thumb.webp``. The model
+keeps the stored names in a JSON field,
+
+    {'source': 'profile_pics/me.png', 'thumb': {'jpeg': ..., 'webp': ...}}
+
+so serializers return variant URLs without touching storage, and nothing
+until the variants of the current file exist.
+
+Only JPEG, PNG, GIF and WebP sources are decoded (whatever their name
+says), and only up to MAX_SOURCE_PIXELS, so a worker never hands exotic
+formats to their decoders or runs out of memory on a huge image. Other
+uploads simply get no variants.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework import serializers
+
+# Every variant is stored in each format: (key, Pillow format, extension, save options)
+FORMATS = (
+    ('jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    ('webp', 'WEBP', 'webp', {'quality': 80, 'method': 4}),
+)
+
+
+# Pillow formats decoded for variants, and the largest source decoded
+SOURCE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+MAX_SOURCE_PIXELS = 40_000_000
+
+
+def variant_name(name, variant, extension):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{variant}.{extension}'
+
+
+def needs_variants(field_file, variants):
+    """True when the stored variants were not made from the current file."""
+    return (field_file.name or '') != (variants or {}).get('source', '')
+
+
+def open_image(field_file):
+    """
+    The upright image in ``field_file``, or None if it is not an image in
+    SOURCE_FORMATS of at most MAX_SOURCE_PIXELS.
+    """
+    try:
+        with field_file.open('rb'):
+            # Only the header is read until load()
+            image = Image.open(field_file, formats=SOURCE_FORMATS)
+            width, height = image.size
+            if width * height > MAX_SOURCE_PIXELS:
+                return None
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+        return None
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def encode(image, image_format, options):
+    if image_format == 'JPEG' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def render_variants(field_file, sizes):
+    """
+    Store each of ``sizes`` ({variant: (width, height, crop)}) of
+    ``field_file`` in every format and return the names to keep on the model.
+    Cropped variants fill the box; the others fit inside it and are never
+    enlarged. Files that are not images get no variants.
+    """
+    variants = {'source': field_file.name}
+    image = open_image(field_file)
+    if image is None:
+        return variants
+
+    storage = field_file.storage
+    for variant, (width, height, crop) in sizes.items():
+        if crop:
+            resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.LANCZOS)
+        variants[variant] = {}
+        for key, image_format, extension, options in FORMATS:
+            name = variant_name(field_file.name, variant, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            variants[variant][key] = storage.save(name, encode(resized, image_format, options))
+    return variants
+
+
+def delete_variants(storage, variants):
+    for variant, names in (variants or {}).items():
+        if variant != 'source':
+            for name in names.values():
+                storage.delete(name)
+
+
+def refresh_variants(instance, field, variants_field, sizes):
+    """
+    Re-render the variants of ``instance.<field>`` if the file changed since
+    they were made, remove the previous ones and save the new names.
+    """
+    field_file = getattr(instance, field)
+    previous = getattr(instance, variants_field)
+    if not needs_variants(field_file, previous):
+        return
+    variants = render_variants(field_file, sizes) if field_file else {}
+    delete_variants(field_file.storage, previous)
+    setattr(instance, variants_field, variants)
+    instance.save(update_fields=[variants_field])
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read-only ``{variant: {format: url}}`` of an image field, taking the
+    stored names from ``variants_field`` on the same model. Empty while the
+    variants of the current file are still being rendered. Subclasses
+    override variant_url() to link somewhere other than the storage.
+    """
+
+    def __init__(self, variants_field, **kwargs):
+        kwargs['read_only'] = True
+        self.variants_field = variants_field
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value:
+            return {}
+        variants = getattr(value.instance, self.variants_field)
+        if needs_variants(value, variants):
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for variant, names in variants.items():
+            if variant == 'source':
+                continue
+            urls[variant] = {}
+            for key, name in names.items():
+                url = self.variant_url(value, variant, key, name)
+                urls[variant][key] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
+    def variant_url(self, value, variant, key, name):
+        return value.storage.url(name)
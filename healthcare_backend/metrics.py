@@ -0,0 +1,212 @@
+"""
+Per-view request metrics.
+
+RequestMetricsMiddleware records, for every resolved URL name, the number
+of requests, SQL queries, time spent in SQL and in DRF serializers, total
+request time and response size. Totals are kept in process memory and
+exported in the Prometheus text format by ``metrics_view`` (each worker
+process reports its own totals).
+
+Views can declare a query budget, either with a ``query_budget`` class
+attribute or the ``query_budget()`` decorator. A budget is a number, or a
+dict of numbers by HTTP method for views whose methods do very different
+work (methods left out have no budget). Requests that exceed it are
+logged, and raise QueryBudgetExceeded when QUERY_BUDGET_STRICT is set, so
+tests catch new N+1 queries.
+
+With REQUEST_METRICS_ENABLED off the middleware removes itself at startup
+and costs nothing.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+METRIC_FIELDS = (
+    ('requests', 'http_requests_total', 'counter', 'Requests handled'),
+    ('duration', 'http_request_duration_seconds_total', 'counter', 'Time spent handling requests'),
+    ('queries', 'db_queries_total', 'counter', 'SQL queries executed'),
+    ('sql_time', 'db_query_duration_seconds_total', 'counter', 'Time spent in SQL queries'),
+    ('serializer_time', 'serializer_duration_seconds_total', 'counter', 'Time spent in DRF serializers'),
+    ('response_bytes', 'http_response_size_bytes_total', 'counter', 'Response body bytes sent'),
+    ('budget_exceeded', 'query_budget_exceeded_total', 'counter', 'Requests over their query budget'),
+)
+
+# Process-wide counters that are not tied to a view, see add_process_metric()
+PROCESS_METRIC_FIELDS = (
+    ('password_hashes', 'password_hashes_total', 'counter', 'Password hashes and checks run by the hashing pool'),
+    ('password_hash_time', 'password_hash_duration_seconds_total', 'counter', 'Time spent hashing passwords'),
+    ('password_hash_wait', 'password_hash_wait_seconds_total', 'counter', 'Time password hashes queued for a worker'),
+    ('password_hash_rejected', 'password_hash_rejected_total', 'counter', 'Password hashes refused with a full queue'),
+)
+
+_lock = threading.Lock()
+_totals = defaultdict(lambda: dict.fromkeys([field for field, *_ in METRIC_FIELDS], 0))
+_process_totals = dict.fromkeys([field for field, *_ in PROCESS_METRIC_FIELDS], 0)
+
+# Metrics of the request being handled by the current thread or task
+_current = ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a view runs more queries than its budget."""
+
+
+def query_budget(limit):
+    """Declare the maximum number of SQL queries of a function based view."""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+def get_query_budget(view_func, method=None):
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None) or getattr(view_func, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+def add_process_metric(field, amount=1):
+    with _lock:
+        _process_totals[field] += amount
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'sql_time', 'serializer_time', 'serializer_depth', 'budget')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.budget = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper counting and timing every query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+
+
+def _install_serializer_timer():
+    """Time BaseSerializer.data, counting nested serializers only once."""
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+    if getattr(data.fget, 'timed', False):
+        return
+
+    def timed_data(serializer):
+        metrics = _current.get()
+        if metrics is None:
+            return data.fget(serializer)
+        metrics.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serializer_depth -= 1
+            if not metrics.serializer_depth:
+                metrics.serializer_time += time.perf_counter() - start
+
+    timed_data.timed = True
+    BaseSerializer.data = property(timed_data)
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.strict = getattr(settings, 'QUERY_BUDGET_STRICT', False)
+        _install_serializer_timer()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with connections['default'].execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        over_budget = metrics.budget is not None and metrics.queries > metrics.budget
+        response_bytes = 0 if response.streaming else len(response.content)
+
+        with _lock:
+            totals = _totals[view_name]
+            totals['requests'] += 1
+            totals['duration'] += duration
+            totals['queries'] += metrics.queries
+            totals['sql_time'] += metrics.sql_time
+            totals['serializer_time'] += metrics.serializer_time
+            totals['response_bytes'] += response_bytes
+            totals['budget_exceeded'] += over_budget
+
+        if over_budget:
+            message = (f'{view_name} ran {metrics.queries} SQL queries, '
+                       f'over its budget of {metrics.budget}')
+            logger.warning(message)
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.budget = get_query_budget(view_func, request.method)
+
+
+def render_metrics():
+    """Current totals in the Prometheus text exposition format."""
+    with _lock:
+        snapshot = {view: dict(totals) for view, totals in _totals.items()}
+        process_snapshot = dict(_process_totals)
+
+    lines = []
+    for field, name, kind, help_text in METRIC_FIELDS:
+        name = f'healthcare_{name}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for view, totals in sorted(snapshot.items()):
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'{name}{{view="{label}"}} {totals[field]}')
+    for field, name, kind, help_text in PROCESS_METRIC_FIELDS:
+        name = f'healthcare_{name}'
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {process_snapshot[field]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Requires ``Authorization: Bearer <METRICS_TOKEN>``
+    when METRICS_TOKEN is set, and a logged in admin otherwise.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        allowed = constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.user.is_authenticated and request.user.role == 'admin'
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
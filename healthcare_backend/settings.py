@@ -17,6 +17,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'rest_framework_simplejwt',
@@ -32,6 +33,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'healthcare_backend.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -102,7 +104,7 @@ MEDIA_ROOT = BASE_DIR/'media'
 AUTH_USER_MODEL = 'accounts.User'
 
 REST_FRAMEWORK = {
-    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework_simplejwt.authentication.JWTAuthentication',),
+    'DEFAULT_AUTHENTICATION_CLASSES': ('accounts.authentication.CachedJWTAuthentication',),
     'DEFAULT_PERMISSION_CLASSES': ('rest_framework.permissions.IsAuthenticated',),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -116,12 +118,36 @@ SIMPLE_JWT = {
     "ROTATE_REFRESH_TOKENS": True,
 }
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [("127.0.0.1", 6379)]},
+# CHANNEL_LAYER=memory runs chat without Redis, in a single process only
+if config("CHANNEL_LAYER", default="redis") == "memory":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [config("REDIS_CHANNEL_URL", default="redis://127.0.0.1:6379/0")]},
+        }
+    }
+
+# REDIS_CACHE_URL shares the cache between processes; without it each process
+# caches in local memory and only sees its own invalidations
+if config("REDIS_CACHE_URL", default=""):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": config("REDIS_CACHE_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
-}
 
 # Default auto field for primary keys
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -140,3 +166,38 @@ LOGOUT_REDIRECT_URL = '/'
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
+
+# Appointment booking
+APPOINTMENT_SLOT_MINUTES = 30
+
+# Chat WebSocket consumer, see chat.buffer, chat.membership and chat.receipts
+CHAT_WRITE_BEHIND = config('CHAT_WRITE_BEHIND', default=False, cast=bool)
+CHAT_FLUSH_INTERVAL_MS = 20
+CHAT_FLUSH_BATCH_SIZE = 100
+CHAT_FLUSH_MAX_ATTEMPTS = 5
+CHAT_MEMBERSHIP_CACHE_SIZE = 10000
+CHAT_MEMBERSHIP_CACHE_TTL = 300
+CHAT_READ_FLUSH_SECONDS = 5
+
+# Chat attachments, see chat.attachments; offload is '', 'x-accel-redirect' or 'x-sendfile'
+CHAT_ATTACHMENT_MAX_BYTES = config('CHAT_ATTACHMENT_MAX_BYTES', default=25 * 1024 * 1024, cast=int)
+CHAT_ATTACHMENT_OFFLOAD = config('CHAT_ATTACHMENT_OFFLOAD', default='')
+CHAT_ATTACHMENT_ACCEL_PREFIX = '/protected-media/'
+
+# Background tasks, see healthcare_backend.celery; eager mode runs them in-process
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://127.0.0.1:6379/2')
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_IGNORE_RESULT = True
+
+# Request metrics, see healthcare_backend.metrics
+REQUEST_METRICS_ENABLED = config('REQUEST_METRICS_ENABLED', default=False, cast=bool)
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Tests fail when a view goes over its query budget
+TEST_RUNNER = 'healthcare_backend.test_runner.StrictQueryBudgetRunner'
+
+# Password hashing pool, see accounts.hashing; 0 workers hashes on the request thread
+PASSWORD_HASHING_WORKERS = config('PASSWORD_HASHING_WORKERS', default=4, cast=int)
+PASSWORD_HASHING_QUEUE = config('PASSWORD_HASHING_QUEUE', default=64, cast=int)
+PASSWORD_HASHING_TIMEOUT = 5
@@ -0,0 +1,32 @@
+"""
+Settings for seed_benchmark and run_benchmark: SQLite, local memory cache,
+in-memory channels and eager Celery tasks, so benchmarks need no PostgreSQL
+or Redis.
+
+    DJANGO_SETTINGS_MODULE=healthcare_backend.settings_benchmark python manage.py migrate
+    DJANGO_SETTINGS_MODULE=healthcare_backend.settings_benchmark python manage.py run_benchmark
+"""
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': config('BENCHMARK_DB', default=str(BASE_DIR / 'benchmark.sqlite3')),
+    }
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    }
+}
+
+CELERY_TASK_ALWAYS_EAGER = True
@@ -0,0 +1,131 @@
+"""
+Site-wide statistics for the admin dashboard.
+
+Every counter of a table is computed in a single aggregate query with
+conditional counts, and the combined result is cached for a short time.
+The per-app stats endpoints return their section of the same result.
+"""
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+STATS_CACHE_KEY = 'site-stats'
+STATS_CACHE_TIMEOUT = 30
+
+
+def counts_by(field, choices, total=None):
+    """
+    Conditional Count() per choice of ``field`` (and blank), keyed by value.
+    With ``total``, sums that column instead of counting rows.
+    """
+    values = [value for value, _ in choices] + ['']
+    return {
+        f'{field}:{value}': (Sum(total, filter=Q(**{field: value})) if total
+                             else Count('pk', filter=Q(**{field: value})))
+        for value in values
+    }
+
+
+def grouped(field, choices, result):
+    """Turn counts_by() results into the ``[{field: value, 'count': n}]`` shape, skipping zeros."""
+    values = [value for value, _ in choices] + ['']
+    return [
+        {field: value, 'count': result[f'{field}:{value}'] or 0}
+        for value in values
+        if result[f'{field}:{value}']
+    ]
+
+
+def user_stats():
+    from accounts.models import User
+    
+    return User.objects.aggregate(
+        total_users=Count('pk'),
+        active_users=Count('pk', filter=Q(is_active=True)),
+        patients=Count('pk', filter=Q(role='patient')),
+        doctors=Count('pk', filter=Q(role='doctor')),
+        admins=Count('pk', filter=Q(role='admin')),
+        general_users=Count('pk', filter=Q(role='user')),
+    )
+
+
+def doctor_stats():
+    from doctors.models import Doctor
+    
+    choices = Doctor.SPECIALIZATION_CHOICES
+    result = Doctor.objects.aggregate(
+        total_doctors=Count('pk'),
+        available_doctors=Count('pk', filter=Q(is_available=True)),
+        avg_rating=Avg('rating'),
+        **counts_by('specialization', choices)
+    )
+    return {
+        'total_doctors': result['total_doctors'],
+        'available_doctors': result['available_doctors'],
+        'by_specialization': grouped('specialization', choices, result),
+        'average_rating': round(result['avg_rating'], 2) if result['avg_rating'] else 0,
+    }
+
+
+def patient_stats():
+    from patients.models import Patient
+    
+    result = Patient.objects.aggregate(
+        total_patients=Count('pk'),
+        **counts_by('gender', Patient.GENDER_CHOICES),
+        **counts_by('blood_group', Patient.BLOOD_GROUP_CHOICES)
+    )
+    return {
+        'total_patients': result['total_patients'],
+        'by_gender': grouped('gender', Patient.GENDER_CHOICES, result),
+        'by_blood_group': grouped('blood_group', Patient.BLOOD_GROUP_CHOICES, result),
+    }
+
+
+def appointment_stats():
+    # Read from the daily rollups rather than the appointment table
+    from appointments.models import Appointment, AppointmentDailyStat
+    
+    result = AppointmentDailyStat.objects.aggregate(
+        total_appointments=Sum('count'),
+        today_appointments=Sum('count', filter=Q(day=timezone.localdate())),
+        **counts_by('status', Appointment.STATUS_CHOICES, total='count'),
+        **counts_by('appointment_type', Appointment.APPOINTMENT_TYPE_CHOICES, total='count')
+    )
+    return {
+        'total_appointments': result['total_appointments'] or 0,
+        'today_appointments': result['today_appointments'] or 0,
+        'by_status': grouped('status', Appointment.STATUS_CHOICES, result),
+        'by_type': grouped('appointment_type', Appointment.APPOINTMENT_TYPE_CHOICES, result),
+    }
+
+
+def chat_stats():
+    from chat.models import ChatRoom, Message
+    
+    result = ChatRoom.objects.aggregate(
+        total_chat_rooms=Count('pk'),
+        active_chat_rooms=Count('pk', filter=Q(is_active=True)),
+    )
+    result['total_messages'] = Message.objects.count()
+    return result
+
+
+def get_stats(fresh=False):
+    """All site statistics, from the cache unless ``fresh`` is set."""
+    stats = None if fresh else cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        stats = {
+            'users': user_stats(),
+            'doctors': doctor_stats(),
+            'patients': patient_stats(),
+            'appointments': appointment_stats(),
+            'chat': chat_stats(),
+            'generated_at': timezone.now().isoformat(),
+        }
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def wants_fresh_stats(request):
+    return request.query_params.get('fresh') in ('1', 'true')
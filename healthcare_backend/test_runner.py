@@ -0,0 +1,21 @@
+"""
+Test runner that enforces query budgets.
+
+Request metrics are switched on and QUERY_BUDGET_STRICT is set for the whole
+run, so a view that runs more queries than its declared budget fails its
+test with QueryBudgetExceeded instead of only logging a warning.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class StrictQueryBudgetRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.saved_metrics_settings = (settings.REQUEST_METRICS_ENABLED, settings.QUERY_BUDGET_STRICT)
+        settings.REQUEST_METRICS_ENABLED = True
+        settings.QUERY_BUDGET_STRICT = True
+
+    def teardown_test_environment(self, **kwargs):
+        settings.REQUEST_METRICS_ENABLED, settings.QUERY_BUDGET_STRICT = self.saved_metrics_settings
+        super().teardown_test_environment(**kwargs)
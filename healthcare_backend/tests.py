@@ -0,0 +1,124 @@
+"""
+Query budgets under the test runner, and image variants.
+"""
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import path
+from PIL import Image
+
+from . import images
+from .metrics import QueryBudgetExceeded, query_budget
+
+
+@query_budget(1)
+def count_users_twice(request):
+    User = get_user_model()
+    return HttpResponse(f'{User.objects.count()} {User.objects.count()}')
+
+
+@query_budget(2)
+def count_users_once(request):
+    return HttpResponse(str(get_user_model().objects.count()))
+
+
+@query_budget({'GET': 1})
+def count_users_twice_on_post(request):
+    return count_users_twice(request) if request.method == 'POST' else count_users_once(request)
+
+
+urlpatterns = [
+    path('over/', count_users_twice),
+    path('within/', count_users_once),
+    path('by-method/', count_users_twice_on_post),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class QueryBudgetTests(TestCase):
+    def test_budgets_are_strict_under_the_test_runner(self):
+        self.assertTrue(settings.REQUEST_METRICS_ENABLED)
+        self.assertTrue(settings.QUERY_BUDGET_STRICT)
+
+    def test_views_over_budget_raise(self):
+        with self.assertLogs('healthcare_backend.metrics', 'WARNING'):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/over/')
+
+    def test_views_within_budget_respond(self):
+        self.assertEqual(self.client.get('/within/').status_code, 200)
+
+    def test_budgets_by_method(self):
+        self.assertEqual(self.client.get('/by-method/').status_code, 200)
+        self.assertEqual(self.client.post('/by-method/').status_code, 200)
+
+
+def image_file(image_format, size=(400, 200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(buffer, image_format)
+    return ContentFile(buffer.getvalue())
+
+
+class ImageVariantTests(TestCase):
+    sizes = {'thumb': (96, 96, True), 'card': (320, 320, False)}
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = get_user_model().objects.create_user(email='pic@example.com', password='password')
+
+    def upload(self, name, content):
+        self.user.profile_picture.save(name, content)
+        return self.user.profile_picture
+
+    def test_variants_are_stored_in_every_format_at_their_size(self):
+        field_file = self.upload('me.png', image_file('PNG'))
+        variants = images.render_variants(field_file, self.sizes)
+
+        self.assertEqual(variants['source'], field_file.name)
+        self.assertEqual(set(variants['thumb']), {'jpeg', 'webp'})
+        expected = {'thumb': (96, 96), 'card': (320, 160)}
+        for variant, names in variants.items():
+            if variant == 'source':
+                continue
+            for key, name in names.items():
+                with field_file.storage.open(name) as stored, Image.open(stored) as image:
+                    self.assertEqual(image.size, expected[variant])
+                    self.assertEqual(image.format, key.upper())
+
+    def test_files_that_are_not_images_get_no_variants(self):
+        field_file = self.upload('me.png', ContentFile(b'not an image'))
+        self.assertEqual(images.render_variants(field_file, self.sizes), {'source': field_file.name})
+
+    def test_other_image_formats_get_no_variants(self):
+        field_file = self.upload('me.png', image_file('BMP'))
+        self.assertEqual(images.render_variants(field_file, self.sizes), {'source': field_file.name})
+
+    def test_images_over_the_pixel_limit_get_no_variants(self):
+        field_file = self.upload('me.png', image_file('PNG'))
+        with mock.patch.object(images, 'MAX_SOURCE_PIXELS', 400 * 200 - 1):
+            self.assertEqual(images.render_variants(field_file, self.sizes), {'source': field_file.name})
+
+    def test_variant_urls_appear_once_the_current_file_is_rendered(self):
+        field = images.ImageVariantsField(variants_field='profile_picture_variants')
+        self.upload('me.png', image_file('PNG'))
+        self.assertEqual(field.to_representation(self.user.profile_picture), {})
+
+        images.refresh_variants(self.user, 'profile_picture', 'profile_picture_variants', self.sizes)
+        urls = field.to_representation(self.user.profile_picture)
+        self.assertEqual(set(urls), {'thumb', 'card'})
+        self.assertTrue(urls['thumb']['webp'].endswith('.thumb.webp'))
+
+        self.upload('new.png', image_file('PNG'))
+        self.assertEqual(field.to_representation(self.user.profile_picture), {})
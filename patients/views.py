@@ -3,13 +3,13 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters
-from django.db import models
 from .models import Patient
 from .serializers import (
     PatientSerializer, PatientCreateSerializer, 
     PatientListSerializer, PatientUpdateSerializer
 )
 from accounts.permissions import IsAdminUser, IsPatientOrAdmin, IsOwnerOrReadOnly
+from healthcare_backend.stats import get_stats, wants_fresh_stats
 
 class PatientListCreateView(generics.ListCreateAPIView):
     queryset = Patient.objects.all()
@@ -50,7 +50,7 @@ class PatientListCreateView(generics.ListCreateAPIView):
 
 
 class PatientDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Patient.objects.all()
+    queryset = Patient.objects.select_related('user')
     permission_classes = [IsPatientOrAdmin, IsOwnerOrReadOnly]
     
     def get_serializer_class(self):
@@ -84,17 +84,4 @@ class PatientStatsView(APIView):
     permission_classes = [IsAdminUser]
     
     def get(self, request):
-        total_patients = Patient.objects.count()
-        by_gender = Patient.objects.values('gender').annotate(
-            count=models.Count('gender')
-        )
-        by_blood_group = Patient.objects.values('blood_group').annotate(
-            count=models.Count('blood_group')
-        )
-        
-        stats = {
-            'total_patients': total_patients,
-            'by_gender': list(by_gender),
-            'by_blood_group': list(by_blood_group),
-        }
-        return Response(stats)
+        return Response(get_stats(fresh=wants_fresh_stats(request))['patients'])